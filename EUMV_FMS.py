@@ -3,44 +3,112 @@
     
     This module implements a discrete event simulation of a manufacturing facility
     using SimPy. The facility consists of 6 stations with various failure rates,
-    processing times, and a quality control system.
+    processing times, and a quality control system; other lines of serial stages
+    and parallel groups are described with a topology (see topology.py).
 
     @author: Eduardo Ulises Martinez
     @author: Fernanda Mena
     @author: Brandon Avalos
 """
 
+import os
 import time
 import simpy
 import numpy as np
+from concurrent.futures import ProcessPoolExecutor
 from dataclasses import dataclass
-from typing import List, Dict
+from functools import partial
+from random_streams import RandomStreams
+from streaming_stats import RunningStats, merge_stats
+from product_traces import (TRACE_FULL, QUALITY_GOOD, QUALITY_REJECTED,
+                            SampledTraceStore, create_trace_store)
+from event_recorder import (EVENT_REQUEST, EVENT_GRANT, EVENT_PROCESS_START, EVENT_PROCESS_END,
+                            EVENT_BREAKDOWN_START, EVENT_BREAKDOWN_END, EVENT_RESUPPLY_START,
+                            EVENT_RESUPPLY_END, EVENT_REJECTION, DEFAULT_CAPACITY, EventRecorder)
+from topology import VISIT_ALL, ShortestQueueGroup, build_topology
+
+# Default configuration of the production line
+DEFAULT_FACILITY_PARAMS = {
+    "bin_size": 25,
+    "supplier_capacity": 3,
+    "station_capacity": 1,
+    "failure_probs": [0.02, 0.01, 0.05, 0.15, 0.07, 0.06],
+    # Stages and per-station settings of the line (None: topology.DEFAULT_TOPOLOGY)
+    "topology": None,
+}
+
+
+# SimPy versions whose Resource internals set_resource_capacity relies on
+RESIZABLE_SIMPY_VERSIONS = ("4.",)
+
+
+def check_resizable_resources():
+    """! Make sure resource capacities can be changed mid-run with the installed SimPy.
+    @details SimPy has no public API to resize a Resource, so set_resource_capacity uses its
+    private _capacity attribute and _trigger_put method, which are only known to behave
+    as expected in RESIZABLE_SIMPY_VERSIONS.
+    """
+    version = getattr(simpy, "__version__", "unknown")
+    if not version.startswith(RESIZABLE_SIMPY_VERSIONS) or not hasattr(simpy.Resource, "_trigger_put"):
+        raise RuntimeError(f"Changing capacities during a run is only supported with SimPy "
+                           f"{', '.join(v + 'x' for v in RESIZABLE_SIMPY_VERSIONS)}; "
+                           f"SimPy {version} is installed")
+
+
+def set_resource_capacity(resource, capacity):
+    """! Change the capacity of a SimPy resource in the middle of a run.
+
+    @details Extra capacity immediately serves waiting requests; with less capacity the
+    current users finish before the queue moves again. Call check_resizable_resources
+    first, before changing any state.
+    @param resource simpy.Resource
+    @param capacity New capacity (at least 1)
+    """
+    if capacity == resource.capacity:
+        return
+    resource._capacity = capacity
+    # Let waiting requests take the newly available slots
+    resource._trigger_put(None)
 
-np.random.seed(int(time.time()))
+
+def resolve_facility_params(facility_params=None):
+    """! Merge facility parameter overrides with the defaults.
+    @param facility_params Dict overriding some of DEFAULT_FACILITY_PARAMS (or None)
+    @return Complete facility parameter dict
+    """
+    params = dict(DEFAULT_FACILITY_PARAMS)
+    if facility_params:
+        unknown = set(facility_params) - set(DEFAULT_FACILITY_PARAMS)
+        if unknown:
+            raise ValueError(f"Unknown facility parameters: {sorted(unknown)}")
+        params.update(facility_params)
+    build_topology(params)  # Validates the topology and the per-station settings
+    return params
 
 @dataclass
 class StationMetrics:
     """! Class to track performance metrics for each manufacturing station.
     
-    @details Maintains counters and time series data for various performance indicators
-    including processing times, maintenance events, and bottleneck analysis.
+    @details Maintains counters and constant-memory running statistics for various
+    performance indicators including processing times, maintenance events, and
+    bottleneck analysis. Waiting and fixing times also keep a quantile sketch.
     """
     processed_items: int = 0
     busy_time: float = 0
     downtime: float = 0
-    fixing_times: List[float] = None
-    waiting_times: List[float] = None
-    bottleneck_delays: List[float] = None
+    fixing_times: RunningStats = None
+    waiting_times: RunningStats = None
+    bottleneck_delays: RunningStats = None
     good_products: int = 0
     rejected_products: int = 0
     accident_count: int = 0
 
     
     def __post_init__(self):
-        """! Initialize empty lists for data collection."""
-        self.fixing_times = []
-        self.waiting_times = []
-        self.bottleneck_delays = []
+        """! Initialize empty accumulators for data collection."""
+        self.fixing_times = RunningStats(quantiles=True)
+        self.waiting_times = RunningStats(quantiles=True)
+        self.bottleneck_delays = RunningStats()
         self.good_products = 0
         self.rejected_products = 0
         self.accident_count = 0
@@ -49,204 +117,311 @@ class StationMetrics:
 class ManufacturingFacility:
     """! Main class representing the manufacturing facility simulation.
     
-    @details Implements a production line with 6 stations, including parallel processing
-    capabilities, maintenance events, and quality control.
+    @details Implements a production line with 6 stations by default, or the stations and
+    parallel groups of the topology in its facility parameters, with maintenance events
+    and quality control.
     """
-    def __init__(self, env):
+    def __init__(self, env, seed=None, trace_level=TRACE_FULL, facility_params=None, antithetic=False,
+                 trace_sample=None):
         """! Initialize the manufacturing facility.
         @param env SimPy environment instance
+        @param seed Seed for the facility's random streams (None uses fresh entropy)
+        @param trace_level Product tracing level: "off", "summary" or "full"
+        @param facility_params Dict overriding DEFAULT_FACILITY_PARAMS (bin size, capacities, failure_probs)
+        @param antithetic Use the antithetic variates of the seed's random streams
+        @param trace_sample Keep a reservoir sample of this many traced products per quality
+                            instead of every product (None keeps them all)
         """
         self.env = env
-        self.stations = [simpy.Resource(env, capacity=1) for _ in range(6)]
-        self.bins = [25, 25, 25, 25, 25, 25]
-        self.suppliers = simpy.Resource(env, capacity=3)
+        params = resolve_facility_params(facility_params)
+        self.params = params
+        self.topology = build_topology(params)
+        self.stations = [simpy.Resource(env, capacity=station.capacity) for station in self.topology.stations]
+        self.bin_sizes = [station.bin_size for station in self.topology.stations]
+        self.bins = list(self.bin_sizes)
+        self.suppliers = simpy.Resource(env, capacity=params["supplier_capacity"])
         
-        self.metrics = {i: StationMetrics() for i in range(6)}
+        self.metrics = {i: StationMetrics() for i in range(len(self.stations))}
         self.total_production = 0
         self.rejected_products = 0
         self.supplier_busy_time = 0
         self.last_product_time = 0
-        self.failure_probs = [0.02, 0.01, 0.05, 0.15, 0.07, 0.06]
-        self.product_metrics = {}
+        self.failure_probs = [station.failure_prob for station in self.topology.stations]
+        # Stations visited in order; "one" groups route through a ShortestQueueGroup,
+        # other stages visit all their stations, shortest queue first
+        self.routing = self.topology.stages
+        self.stage_groups = [ShortestQueueGroup(stage, [self.topology.stations[i].capacity for i in stage])
+                             if len(stage) > 1 and visit != VISIT_ALL else None
+                             for stage, visit in zip(self.topology.stages, self.topology.visits)]
+        # Optional EventRecorder receiving every station, supplier and rejection event
+        self.recorder = None
+        
+        self.reseed(seed, antithetic)
+        sample_draws = self.random_streams.uniform("trace_sample", 0) if trace_sample else None
+        self.product_traces = create_trace_store(trace_level, trace_sample, sample_draws)
+
+    def reseed(self, seed, antithetic=False):
+        """! Replace every random stream of the facility.
+        @param seed Seed for the new streams (an int, or a sequence of ints such as (run seed, branch))
+        @param antithetic Use the antithetic variates of the seed's random streams
+        """
+        # Independent buffered random streams for every source of randomness
+        self.random_streams = RandomStreams(seed, antithetic=antithetic)
+        stations = range(len(self.stations))
+        self.service_times = [self.random_streams.abs_normal("service", i, 4, 1) for i in stations]
+        self.breakdown_draws = [self.random_streams.uniform("breakdown", i) for i in stations]
+        self.repair_times = [self.random_streams.exponential("fixing", i, 3) for i in stations]
+        self.rejection_draws = [self.random_streams.uniform("rejection", i) for i in stations]
+        self.supply_delays = self.random_streams.abs_normal("supplier", 0, 2, 0.5)
+        self.accident_draws = self.random_streams.uniform("accident", 0)
+        self.accident_stations = self.random_streams.integers("accident_station", 0, 0, len(self.stations))
+
+    def reconfigure(self, facility_params):
+        """! Change facility parameters in the middle of a run.
+
+        @details Bins refill to the new bin size at their next resupply. Capacity changes apply
+        at once: extra capacity immediately serves waiting requests, and with less capacity the
+        products in service finish before the queue moves again. The stages of the topology
+        cannot change, only the settings of its stations.
+        @param facility_params Dict overriding some of the current facility parameters
+        """
+        params = resolve_facility_params(dict(self.params, **(facility_params or {})))
+        topology = build_topology(params)
+        if (topology.stages, topology.visits) != (self.topology.stages, self.topology.visits):
+            raise ValueError("The stages of the line cannot change during a run")
+        resizes = ([(self.suppliers, params["supplier_capacity"])]
+                   + [(resource, station.capacity) for resource, station in zip(self.stations, topology.stations)])
+        resizes = [(resource, capacity) for resource, capacity in resizes if capacity != resource.capacity]
+        if any(capacity < 1 for _, capacity in resizes):
+            raise ValueError("Capacities must be at least 1")
+        if resizes:
+            check_resizable_resources()
+        for group in self.stage_groups:
+            if group is not None:
+                for station in group.excess:
+                    group.set_capacity(station, self.topology.stations[station].capacity,
+                                       topology.stations[station].capacity)
+        self.params = params
+        self.topology = topology
+        self.bin_sizes = [station.bin_size for station in topology.stations]
+        self.failure_probs = [station.failure_prob for station in topology.stations]
+        for resource, capacity in resizes:
+            set_resource_capacity(resource, capacity)
+
+    def reset_statistics(self):
+        """! Discard everything measured so far, e.g. at the end of a warm-up period.
+
+        @details processed_items is kept, since it drives the breakdown checks every 5 items.
+        """
+        for metrics in self.metrics.values():
+            metrics.busy_time = 0
+            metrics.downtime = 0
+            metrics.good_products = 0
+            metrics.rejected_products = 0
+            metrics.fixing_times = RunningStats(quantiles=True)
+            metrics.waiting_times = RunningStats(quantiles=True)
+            metrics.bottleneck_delays = RunningStats()
+        self.total_production = 0
+        self.rejected_products = 0
+        self.supplier_busy_time = 0
         
-    def resupply_bin(self, station_id):
+
+    def resupply_bin(self, station_id, product_id=-1):
         """! Process to resupply materials to a station's bin.
         @param station_id Index of the station that is requiring resupply
+        @param product_id Product that found the bin empty (only used by the event recorder)
         @return Generator for SimPy environment
         """
+        recorder = self.recorder
         start_time = self.env.now
+        if recorder is not None:
+            recorder.record(start_time, EVENT_RESUPPLY_START, station_id, product_id, len(self.suppliers.queue))
         with self.suppliers.request() as req:
             yield req
-            delay = abs(np.random.normal(2, 0.5))
+            delay = self.supply_delays.next()
             yield self.env.timeout(delay)
-            self.bins[station_id] = 25
+            self.bins[station_id] = self.bin_sizes[station_id]
             self.supplier_busy_time += self.env.now - start_time
+        if recorder is not None:
+            recorder.record(self.env.now, EVENT_RESUPPLY_END, station_id, product_id, self.env.now - start_time)
 
     def process_station(self, product_id, station_id, start_queue_time):
         """! Process a product at a specific station.
         @param product_id Unique identifier for the product
         @param station_id Index of the processing station
         @param start_queue_time Time when product entered the station's queue
-        @return Generator for SimPy environment
+        @return Generator for SimPy environment, returning True if the product was rejected
         """
 
-        self.metrics[station_id].waiting_times.append(self.env.now - start_queue_time)
+        recorder = self.recorder
+        self.metrics[station_id].waiting_times.add(self.env.now - start_queue_time)
         
-        process_time = abs(np.random.normal(4, 1))
+        process_time = self.service_times[station_id].next()
+        if recorder is not None:
+            recorder.record(self.env.now, EVENT_PROCESS_START, station_id, product_id)
         yield self.env.timeout(process_time)
+        if recorder is not None:
+            recorder.record(self.env.now, EVENT_PROCESS_END, station_id, product_id, process_time)
         
         self.metrics[station_id].processed_items += 1
         self.metrics[station_id].busy_time += process_time
     
         if self.metrics[station_id].processed_items % 5 == 0:
-            if np.random.random() < self.failure_probs[station_id]:
-                fixing_time = np.random.exponential(3)
+            if self.breakdown_draws[station_id].next() < self.failure_probs[station_id]:
+                fixing_time = self.repair_times[station_id].next()
+                if recorder is not None:
+                    recorder.record(self.env.now, EVENT_BREAKDOWN_START, station_id, product_id)
                 yield self.env.timeout(fixing_time)
+                if recorder is not None:
+                    recorder.record(self.env.now, EVENT_BREAKDOWN_END, station_id, product_id, fixing_time)
                 self.metrics[station_id].downtime += fixing_time
-                self.metrics[station_id].fixing_times.append(fixing_time)
+                self.metrics[station_id].fixing_times.add(fixing_time)
                 
         if self.last_product_time > 0:
             delay = self.env.now - self.last_product_time - process_time
             if delay > 0:
-                self.metrics[station_id].bottleneck_delays.append(delay)
+                self.metrics[station_id].bottleneck_delays.add(delay)
         self.last_product_time = self.env.now
         
         # Simulación de rechazo por estación (opcional: puedes variar la probabilidad por estación)
-        if np.random.random() < 0.01:  # 1% de rechazo por estación (puedes ajustar)
+        if self.rejection_draws[station_id].next() < 0.01:  # 1% de rechazo por estación (puedes ajustar)
             self.metrics[station_id].rejected_products += 1
-            self.product_metrics[product_id]["quality"] = "rejected"
-            raise simpy.Interrupt(f"Producto {product_id} rechazado en estación {station_id}")
-
+            if recorder is not None:
+                recorder.record(self.env.now, EVENT_REJECTION, station_id, product_id)
+            return True
+        return False
 
-    def process_product(self, product_id):
-        """! Process a single product through all stations.
+    def visit_station(self, product_id, row, station_id):
+        """! Take a product through one station: bin resupply, queueing and processing.
         @param product_id Unique identifier for the product
-        @return Generator for SimPy environment
+        @param row Row of the product in the trace store (None when tracing is off)
+        @param station_id Index of the station to visit
+        @return Generator for SimPy environment, returning True if the product was rejected
         """
-
-        self.product_metrics[product_id] = {
-            "start_time": self.env.now,
-            "end_time": None,
-            "stations_visit": [],
-            "quality": "unknown",
-            "total_wait_time": 0,
-            "total_process_time": 0
-        }
-
-        # Procesar por estaciones secuenciales (0 a 3)
-        for i in range(4):
-            station_start = self.env.now
-            if self.bins[i] <= 0:
-                yield self.env.process(self.resupply_bin(i))
-            self.bins[i] -= 1
-
-            start_queue = self.env.now
-            with self.stations[i].request() as req:
-                yield req
-                wait_time = self.env.now - start_queue
-                self.product_metrics[product_id]["total_wait_time"] += wait_time
-
-                process_start = self.env.now
-                try:
-                    yield self.env.process(self.process_station(product_id, i, start_queue))
-                except simpy.Interrupt:
-                    self.metrics[i].rejected_products += 1
-                    self.rejected_products += 1
-                    self.product_metrics[product_id]["quality"] = "rejected"
-                    self.product_metrics[product_id]["end_time"] = self.env.now
-                    return
-
-                process_time = self.env.now - process_start
-                self.product_metrics[product_id]["stations_visit"].append({
-                    "station_id": i,
-                    "entry_time": station_start,
-                    "exit_time": self.env.now,
-                    "wait_time": wait_time,
-                    "process_time": process_time
-                })
-                self.product_metrics[product_id]["total_process_time"] += process_time
-                self.metrics[i].good_products += 1
-
-        # Elegir primera estación paralela (4 o 5)
-        if len(self.stations[4].queue) <= len(self.stations[5].queue):
-            parallel_first = 4
-        else:
-            parallel_first = 5
-
-        # Procesar en primera paralela
+        traces = self.product_traces
+        recorder = self.recorder
         station_start = self.env.now
-        if self.bins[parallel_first] <= 0:
-            yield self.env.process(self.resupply_bin(parallel_first))
-        self.bins[parallel_first] -= 1
+        if self.bins[station_id] <= 0:
+            yield from self.resupply_bin(station_id, product_id)
+        self.bins[station_id] -= 1
 
         start_queue = self.env.now
-        with self.stations[parallel_first].request() as req:
+        if recorder is not None:
+            recorder.record(start_queue, EVENT_REQUEST, station_id, product_id, len(self.stations[station_id].queue))
+        with self.stations[station_id].request() as req:
             yield req
             wait_time = self.env.now - start_queue
-            self.product_metrics[product_id]["total_wait_time"] += wait_time
+            if recorder is not None:
+                recorder.record(self.env.now, EVENT_GRANT, station_id, product_id, wait_time)
+            if traces is not None:
+                traces.add_wait(row, wait_time)
 
             process_start = self.env.now
-            try:
-                yield self.env.process(self.process_station(product_id, parallel_first, start_queue))
-            except simpy.Interrupt:
-                self.metrics[parallel_first].rejected_products += 1
+            rejected = yield from self.process_station(product_id, station_id, start_queue)
+            if rejected:
+                self.metrics[station_id].rejected_products += 1
                 self.rejected_products += 1
-                self.product_metrics[product_id]["quality"] = "rejected"
-                self.product_metrics[product_id]["end_time"] = self.env.now
-                return
+                if traces is not None:
+                    traces.finish(row, self.env.now, QUALITY_REJECTED)
+                return True
 
             process_time = self.env.now - process_start
-            self.product_metrics[product_id]["stations_visit"].append({
-                "station_id": parallel_first,
-                "entry_time": station_start,
-                "exit_time": self.env.now,
-                "wait_time": wait_time,
-                "process_time": process_time
-            })
-            self.product_metrics[product_id]["total_process_time"] += process_time
-            self.metrics[parallel_first].good_products += 1
-
-        # Segunda estación paralela
-        parallel_second = 9 - parallel_first
-        station_start = self.env.now
-        if self.bins[parallel_second] <= 0:
-            yield self.env.process(self.resupply_bin(parallel_second))
-        self.bins[parallel_second] -= 1
+            if traces is not None:
+                traces.add_visit(row, station_id, station_start, self.env.now, wait_time, process_time)
+            self.metrics[station_id].good_products += 1
+        return False
+
+    def stage_order(self, stage):
+        """! Order in which a product visits the stations of a stage visiting all its stations.
+        @param stage Tuple of station indices; more than one means a parallel group
+        @return Sequence of station indices, shortest queue first for parallel groups
+        """
+        if len(stage) == 1:
+            return stage
+        # Stable sort: ties go to the station listed first, as with the original 4/5 pair
+        return sorted(stage, key=lambda station_id: len(self.stations[station_id].queue))
 
-        start_queue = self.env.now
-        with self.stations[parallel_second].request() as req:
-            yield req
-            wait_time = self.env.now - start_queue
-            self.product_metrics[product_id]["total_wait_time"] += wait_time
+    def process_product(self, product_id):
+        """! Process a single product through every stage of the routing table.
+        @param product_id Unique identifier for the product
+        @return Generator for SimPy environment, returning True if the product was finished good
+        """
 
-            process_start = self.env.now
-            try:
-                yield self.env.process(self.process_station(product_id, parallel_second, start_queue))
-            except simpy.Interrupt:
-                self.metrics[parallel_second].rejected_products += 1
-                self.rejected_products += 1
-                self.product_metrics[product_id]["quality"] = "rejected"
-                self.product_metrics[product_id]["end_time"] = self.env.now
-                return
-
-            process_time = self.env.now - process_start
-            self.product_metrics[product_id]["stations_visit"].append({
-                "station_id": parallel_second,
-                "entry_time": station_start,
-                "exit_time": self.env.now,
-                "wait_time": wait_time,
-                "process_time": process_time
-            })
-            self.product_metrics[product_id]["total_process_time"] += process_time
-            self.metrics[parallel_second].good_products += 1
+        traces = self.product_traces
+        row = traces.add_product(product_id, self.env.now) if traces is not None else None
+
+        # Etapas en orden: estaciones en serie y grupos paralelos (p. ej. el par 4 y 5)
+        for stage, group in zip(self.routing, self.stage_groups):
+            if group is not None:
+                station_id = group.acquire()
+                rejected = yield from self.visit_station(product_id, row, station_id)
+                group.release(station_id)
+                if rejected:
+                    return False
+                continue
+            for station_id in self.stage_order(stage):
+                if (yield from self.visit_station(product_id, row, station_id)):
+                    return False
 
         # Si llegó al final sin rechazo
         self.total_production += 1
-        self.product_metrics[product_id]["quality"] = "good"
-        self.product_metrics[product_id]["end_time"] = self.env.now
+        if traces is not None:
+            traces.finish(row, self.env.now, QUALITY_GOOD)
+        return True
 
     
     
+    def snapshot(self, run_id=None):
+        """! Current metrics of the facility, for live streaming.
+        @param run_id Identifier of the run, included in the snapshot
+        @return JSON-serializable dict of production, rejections, supplier and per-station state
+        """
+        now = self.env.now
+        finished = self.total_production + self.rejected_products
+        return {
+            "run_id": run_id,
+            "time": now,
+            "production": self.total_production,
+            "rejected": self.rejected_products,
+            "rejection_rate": self.rejected_products / finished if finished else 0.0,
+            "supplier_occupancy": self.supplier_busy_time / now if now else 0.0,
+            "supplier_queue": len(self.suppliers.queue),
+            "stations": [{
+                "occupancy": self.metrics[i].busy_time / now if now else 0.0,
+                "queue_length": len(station.queue),
+                "good_products": self.metrics[i].good_products,
+                "rejected_products": self.metrics[i].rejected_products,
+                "downtime": self.metrics[i].downtime,
+            } for i, station in enumerate(self.stations)],
+        }
+
+    def emit_snapshots(self, interval, callback, run_id=None):
+        """! Process calling a callback with a snapshot every interval of simulated time.
+        @param interval Simulated time between snapshots
+        @param callback Function receiving each snapshot dict
+        @param run_id Identifier of the run, included in the snapshots
+        @return Generator for SimPy environment
+        """
+        while True:
+            yield self.env.timeout(interval)
+            callback(self.snapshot(run_id))
+
+    def check_accident(self, simulation_time):
+        """! Draw whether a facility accident happens before releasing the next product.
+        @param simulation_time Total time to simulate (the accident probability scales with it)
+        @return True if an accident stops the run
+        """
+        if self.accident_draws.next() < 0.0001 / (simulation_time / 24):
+            accident_station = self.accident_stations.next()
+            self.metrics[accident_station].accident_count += 1
+            print(f"Facility accident at time {self.env.now}. Stopping this simulation run.")
+            return True
+        return False
+
+    def interarrival_time(self):
+        """! Time until the next product is released, slower while the first station is congested."""
+        return 2 if len(self.stations[0].queue) > 5 else 1
+
     # This is the fixed method - it no longer creates a new facility and environment
     def run_production(self, simulation_time):
         """! Run the manufacturing facility production process
@@ -255,50 +430,56 @@ class ManufacturingFacility:
         """
         product_id = 0
         while self.env.now < simulation_time:
-            if np.random.random() < 0.0001 / (simulation_time / 24): 
-                accident_station = np.random.randint(0, 6)
-                self.metrics[accident_station].accident_count += 1
-                print(f"Facility accident at time {self.env.now}. Stopping this simulation run.")
+            if self.check_accident(simulation_time):
                 break
             
             self.env.process(self.process_product(product_id))
             product_id += 1
             
-            if len(self.stations[0].queue) > 5:
-                yield self.env.timeout(2)
-            else:
-                yield self.env.timeout(1)
+            yield self.env.timeout(self.interarrival_time())
 
-def run_simulation(run_id, simulation_time):
-    """! Execute a single simulation run with specified parameters.
+def build_results(run_id, simulation_time, production, rejected, supplier_busy_time, station_metrics,
+                  product_traces=None, station_names=None):
+    """! Assemble the results dict of one simulation run.
     @param run_id Identifier for the simulation run
-    @param simulation_time Total time to simulate
+    @param simulation_time Total simulated time
+    @param production Number of good products finished
+    @param rejected Number of rejected products
+    @param supplier_busy_time Total time suppliers spent on resupply requests
+    @param station_metrics Dict of station index to StationMetrics
+    @param product_traces ProductTraceStore or SampledTraceStore of the run, or None when tracing is off
+    @param station_names Names of the stations from the line topology, exported with the results
     @return Dict containing simulation results and metrics
     """
-    np.random.seed(run_id + 1000)
-    env = simpy.Environment()
-    facility = ManufacturingFacility(env)
-    
-    # Fixed: Use the new run_production method instead of recursively calling run_simulation
-    env.process(facility.run_production(simulation_time))
-    env.run(until=simulation_time)
-    
     results = {
         'run_id': run_id,
-        'production': facility.total_production,
-        'rejected': facility.rejected_products,
-        'supplier_occupancy': facility.supplier_busy_time / simulation_time,
+        'production': production,
+        'rejected': rejected,
+        'supplier_occupancy': supplier_busy_time / simulation_time,
         'stations': {},
-        'products': facility.product_metrics
+        'products': product_traces.compact() if product_traces is not None else None
     }
+    if station_names is not None:
+        results['station_names'] = list(station_names)
+    if isinstance(product_traces, SampledTraceStore):
+        # Exact per-quality totals and distributions behind the sampled traces
+        results['product_sample'] = product_traces.summary()
     
-    for i, metrics in facility.metrics.items():
+    for i, metrics in station_metrics.items():
             results['stations'][i] = {
         'occupancy': metrics.busy_time / simulation_time,
         'downtime': metrics.downtime,
-        'avg_fixing_time': np.mean(metrics.fixing_times) if metrics.fixing_times else 0,
-        'avg_waiting_time': np.mean(metrics.waiting_times) if metrics.waiting_times else 0,
-        'avg_bottleneck_delay': np.mean(metrics.bottleneck_delays) if metrics.bottleneck_delays else 0,
+        'avg_fixing_time': metrics.fixing_times.mean,
+        'avg_waiting_time': metrics.waiting_times.mean,
+        'avg_bottleneck_delay': metrics.bottleneck_delays.mean,
+        'p50_waiting_time': metrics.waiting_times.quantile(0.50),
+        'p95_waiting_time': metrics.waiting_times.quantile(0.95),
+        'p99_waiting_time': metrics.waiting_times.quantile(0.99),
+        'p50_fixing_time': metrics.fixing_times.quantile(0.50),
+        'p95_fixing_time': metrics.fixing_times.quantile(0.95),
+        'p99_fixing_time': metrics.fixing_times.quantile(0.99),
+        'waiting_time_stats': metrics.waiting_times,
+        'fixing_time_stats': metrics.fixing_times,
         'good_products': metrics.good_products,
         'rejected_products': metrics.rejected_products,
         'accidents': metrics.accident_count
@@ -307,17 +488,224 @@ def run_simulation(run_id, simulation_time):
     
     return results
 
-def run_simulation_per_run(num_runs, simulation_time):
+def run_simulation(run_id, simulation_time, trace_level=TRACE_FULL, facility_params=None, engine="simpy",
+                   profile=False, snapshot_interval=None, on_snapshot=None, antithetic=False, trace_sample=None,
+                   event_trace=None, event_trace_capacity=DEFAULT_CAPACITY):
+    """! Execute a single simulation run with specified parameters.
+    @param run_id Identifier for the simulation run
+    @param simulation_time Total time to simulate
+    @param trace_level Product tracing level: "off", "summary" or "full"
+    @param facility_params Dict overriding DEFAULT_FACILITY_PARAMS for this run
+    @param engine "simpy" for the event-driven model, "vector" for the NumPy fast path
+    @param profile Instrument the event loop and add a JSON-ready 'profile' entry to the results;
+                   an int greater than 1 times only one event out of that many
+    @param snapshot_interval Simulated time between live snapshots passed to on_snapshot
+    @param on_snapshot Callback receiving ManufacturingFacility.snapshot() dicts while the run
+                       progresses, plus a final one flagged 'final' (None disables streaming)
+    @param antithetic Drive the run with the antithetic variates of its seed, the mirrored
+                      twin of the run with the same run_id
+    @param trace_sample Export a reservoir sample of this many products per quality (good/rejected)
+                        instead of every product; exact totals and distributions go to 'product_sample'
+    @param event_trace Path of a ring buffer file receiving every station, supplier and rejection
+                       event of the run ("{run_id}" in the path is replaced by the run_id)
+    @param event_trace_capacity Number of events kept in the ring buffer
+    @return Dict containing simulation results and metrics
+    """
+    check_engine_options(engine, {"profile": profile, "on_snapshot": on_snapshot, "antithetic": antithetic,
+                                  "trace_sample": trace_sample, "event_trace": event_trace})
+    if engine == "vector":
+        from vector_engine import simulate_vectorized
+        return simulate_vectorized([run_id], simulation_time, trace_level, facility_params)[0]
+    
+    if profile:
+        from instrumentation import InstrumentedEnvironment
+        env = InstrumentedEnvironment(sample_every=1 if profile is True else profile)
+    else:
+        env = simpy.Environment()
+    facility = ManufacturingFacility(env, seed=run_id + 1000, trace_level=trace_level,
+                                     facility_params=facility_params, antithetic=antithetic,
+                                     trace_sample=trace_sample)
+    if profile:
+        env.watch(facility.stations, facility.suppliers)
+    if event_trace:
+        event_trace = event_trace.format(run_id=run_id)
+        facility.recorder = EventRecorder(event_trace, event_trace_capacity)
+    
+    # Fixed: Use the new run_production method instead of recursively calling run_simulation
+    env.process(facility.run_production(simulation_time))
+    if on_snapshot is not None:
+        env.process(facility.emit_snapshots(snapshot_interval or simulation_time / 100, on_snapshot, run_id))
+    env.run(until=simulation_time)
+    if on_snapshot is not None:
+        on_snapshot(dict(facility.snapshot(run_id), final=True))
+    if facility.recorder is not None:
+        facility.recorder.close()
+    
+    results = build_results(run_id, simulation_time, facility.total_production, facility.rejected_products,
+                            facility.supplier_busy_time, facility.metrics, facility.product_traces,
+                            facility.topology.names)
+    if antithetic:
+        results['antithetic'] = True
+    if event_trace:
+        results['event_trace'] = event_trace
+    if profile:
+        results['profile'] = env.profile()
+    return results
+
+# run_simulation options that need the SimPy event loop
+SIMPY_ONLY_OPTIONS = ("profile", "on_snapshot", "antithetic", "trace_sample", "event_trace")
+
+def check_engine_options(engine, options):
+    """! Reject run_simulation options the selected engine does not support.
+    @param engine "simpy" or "vector"
+    @param options Dict of run_simulation keyword arguments
+    """
+    if engine == "vector":
+        used = [name for name in SIMPY_ONLY_OPTIONS if options.get(name)]
+        if used:
+            raise ValueError(f"Not available for engine='vector', since they need the SimPy event loop: "
+                             f"{', '.join(used)}")
+    elif engine != "simpy":
+        raise ValueError(f"Unknown simulation engine: {engine}")
+
+def _default_workers(workers):
+    """! Resolve a worker count, where None means one worker per core.
+    @param workers Requested number of worker processes or None
+    @return Number of worker processes to use
+    """
+    if workers is None:
+        return os.cpu_count() or 1
+    return max(1, int(workers))
+
+def _simulate_task(task, simulation_time):
+    """! Run one (run_id, options) simulation task; module level so worker processes can use it.
+    @param task Tuple of run identifier and run_simulation keyword arguments
+    @param simulation_time Duration of the simulation run
+    @return Dict containing simulation results and metrics
+    """
+    run_id, options = task
+    return run_simulation(run_id, simulation_time, **options)
+
+# run_simulation options whose effects (files written, callbacks, wall-clock timings) a
+# cached result cannot reproduce; tasks using them are always simulated
+UNCACHEABLE_OPTIONS = ("event_trace", "on_snapshot", "profile")
+
+def _cacheable(task):
+    """! Whether a (run_id, options) task may be loaded from or stored in the result cache."""
+    return not any(task[1].get(name) for name in UNCACHEABLE_OPTIONS)
+
+def _task_cache_key(cache, task, simulation_time):
+    """! Cache key of a simulation task, using the fully resolved facility parameters.
+    @param cache ResultCache computing the key
+    @param task Tuple of run identifier and run_simulation keyword arguments
+    @param simulation_time Duration of the simulation run
+    @return Cache key string
+    """
+    run_id, options = task
+    parameters = resolve_facility_params(options.get("facility_params"))
+    other_options = {name: value for name, value in options.items() if name != "facility_params"}
+    return cache.key(run_id + 1000, simulation_time, parameters, other_options)
+
+def run_tasks(tasks, simulation_time, workers=1, chunksize=None, progress=False, cache=None):
+    """! Execute simulation tasks, serially or on a process pool.
+    
+    @details Every task seeds itself from its run_id inside run_simulation, so the
+    parallel path produces exactly the same results as the serial one. Results are
+    returned in the same order as tasks regardless of which worker finished first.
+    When a cache is given, tasks already in it are loaded instead of simulated, except
+    tasks with side effects (see UNCACHEABLE_OPTIONS), which always run.
+    @param tasks Iterable of (run_id, options) tuples, options being run_simulation keyword arguments
+    @param simulation_time Duration of each simulation run
+    @param workers Number of worker processes (1 runs serially, None uses every core)
+    @param chunksize Number of tasks handed to a worker at a time (None picks one)
+    @param progress Print a progress line as runs complete
+    @param cache Optional ResultCache used to load and store run results
+    @return List of results ordered like tasks
+    """
+    tasks = list(tasks)
+    results = [None] * len(tasks)
+    keys = [None] * len(tasks)
+    if cache is not None:
+        for index, task in enumerate(tasks):
+            if _cacheable(task):
+                keys[index] = _task_cache_key(cache, task, simulation_time)
+                results[index] = cache.get(keys[index])
+        if progress:
+            loaded = sum(result is not None for result in results)
+            print(f"  Loaded {loaded}/{len(tasks)} runs from cache")
+    
+    pending = [index for index, result in enumerate(results) if result is None]
+    total = len(pending)
+    workers = min(_default_workers(workers), max(total, 1))
+    simulate = partial(_simulate_task, simulation_time=simulation_time)
+    pending_tasks = [tasks[index] for index in pending]
+    report_every = max(1, total // 10)
+    start = time.perf_counter()
+    
+    if workers == 1:
+        results_iter = map(simulate, pending_tasks)
+        executor = None
+    else:
+        if chunksize is None:
+            chunksize = max(1, total // (workers * 4))
+        executor = ProcessPoolExecutor(max_workers=workers)
+        results_iter = executor.map(simulate, pending_tasks, chunksize=chunksize)
+    
+    done = 0
+    try:
+        for index, result in zip(pending, results_iter):
+            results[index] = result
+            if keys[index] is not None:
+                cache.put(keys[index], result)
+            done += 1
+            if progress and (done % report_every == 0 or done == total):
+                print(f"  Completed {done}/{total} runs "
+                      f"({time.perf_counter() - start:.1f}s, {workers} worker(s))")
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    
+    return results
+
+def run_replications(run_ids, simulation_time, workers=1, chunksize=None, progress=False,
+                     cache=None, **simulation_options):
+    """! Execute a set of simulation runs with the same options, serially or on a process pool.
+    
+    @details With engine="vector" in the options, the runs are simulated in batches by the
+    vectorized engine instead (the cache is not used for that engine).
+    @param run_ids Iterable of run identifiers to simulate
+    @param simulation_time Duration of each simulation run
+    @param workers Number of worker processes (1 runs serially, None uses every core)
+    @param chunksize Number of runs handed to a worker at a time (None picks one)
+    @param progress Print a progress line as runs complete
+    @param cache Optional ResultCache used to load and store run results
+    @param simulation_options Extra keyword arguments for run_simulation (e.g. trace_level)
+    @return List of results ordered like run_ids
+    """
+    check_engine_options(simulation_options.get("engine", "simpy"), simulation_options)
+    if simulation_options.get("engine") == "vector":
+        # The vector engine simulates whole batches of replications per call
+        from vector_engine import run_vectorized_replications
+        options = {name: value for name, value in simulation_options.items() if name != "engine"}
+        return run_vectorized_replications(run_ids, simulation_time, workers, **options)
+    
+    tasks = [(run_id, simulation_options) for run_id in run_ids]
+    return run_tasks(tasks, simulation_time, workers, chunksize, progress, cache)
+
+def run_simulation_per_run(num_runs, simulation_time, workers=1, chunksize=None, progress=False, cache=None,
+                           **simulation_options):
     """! Execute multiple simulation runs and display detailed results.
     @param num_runs Number of simulation runs to execute
     @param simulation_time Duration of each simulation run
+    @param workers Number of worker processes (1 runs serially, None uses every core)
+    @param chunksize Number of runs handed to a worker at a time (None picks one)
+    @param progress Print a progress line as runs complete
+    @param cache Optional ResultCache used to load and store run results
+    @param simulation_options Extra keyword arguments for run_simulation (e.g. trace_level)
     @return List of results from all runs
     """
-    all_results = []
-    
-    for run_id in range(num_runs):
-        result = run_simulation(run_id, simulation_time)
-        all_results.append(result)
+    all_results = run_replications(range(num_runs), simulation_time, workers, chunksize, progress,
+                                   cache, **simulation_options)
     
     print("\nPer-Run Simulation Results:")
     print("-" * 50)
@@ -326,7 +714,7 @@ def run_simulation_per_run(num_runs, simulation_time):
         print(f"  Production: {result['production']}")
         print(f"  Rejected Products: {result['rejected']}")
         print(f"  Supplier Occupancy: {result['supplier_occupancy']:.3f}")
-        for station in range(6):
+        for station in range(len(result['stations'])):
             print(f"  Station {station}:")
             print(f"    Occupancy Rate: {result['stations'][station]['occupancy']:.3f}")
             print(f"    Downtime: {result['stations'][station]['downtime']:.2f}")
@@ -336,17 +724,20 @@ def run_simulation_per_run(num_runs, simulation_time):
     
     return all_results
 
-def run_all_runs(num_runs, simulation_time):
+def run_all_runs(num_runs, simulation_time, workers=1, chunksize=None, progress=False, cache=None,
+                 **simulation_options):
     """! Execute multiple simulation runs and generate summary statistics.
     @param num_runs Number of simulation runs to execute
     @param simulation_time Duration of each simulation run
+    @param workers Number of worker processes (1 runs serially, None uses every core)
+    @param chunksize Number of runs handed to a worker at a time (None picks one)
+    @param progress Print a progress line as runs complete
+    @param cache Optional ResultCache used to load and store run results
+    @param simulation_options Extra keyword arguments for run_simulation (e.g. trace_level)
     @return List of results from all runs
     """
-    all_results = []
-    
-    for run_id in range(num_runs):
-        result = run_simulation(run_id, simulation_time)
-        all_results.append(result)
+    all_results = run_replications(range(num_runs), simulation_time, workers, chunksize, progress,
+                                   cache, **simulation_options)
     
     print("\nSimulation Results Summary (All Runs):")
     print("-" * 50)
@@ -360,7 +751,7 @@ def run_all_runs(num_runs, simulation_time):
     print(f"Average Supplier Occupancy: {np.mean(supplier_occs):.3f}")
     
     print("\nWorkstation Statistics (All Runs):")
-    for station in range(6):
+    for station in range(len(all_results[0]['stations']) if all_results else 0):
         stats = [r['stations'][station] for r in all_results]
         print(f"\nStation {station}:")
         print(f"  Occupancy Rate: {np.mean([s['occupancy'] for s in stats]):.3f}")
@@ -368,8 +759,14 @@ def run_all_runs(num_runs, simulation_time):
         print(f"  Average Waiting Time: {np.mean([s['avg_waiting_time'] for s in stats]):.2f}")
         print(f"  Average Fixing Time: {np.mean([s['avg_fixing_time'] for s in stats]):.2f}")
         print(f"  Average Bottleneck Delay: {np.mean([s['avg_bottleneck_delay'] for s in stats]):.2f}")
+        waiting = merge_stats(s['waiting_time_stats'] for s in stats)
+        print(f"  Waiting Time p50/p95/p99: {waiting.quantile(0.50):.2f} / "
+              f"{waiting.quantile(0.95):.2f} / {waiting.quantile(0.99):.2f}")
     
     return all_results
 
 if __name__ == "__main__":
-    run_all_runs(num_runs=5, simulation_time=5000)
\ No newline at end of file
+    import sys
+    from cli import main
+    # Without arguments, simulate the default 5 replications as before
+    sys.exit(main(sys.argv[1:] or ["simulate"]))
\ No newline at end of file
@@ -0,0 +1,154 @@
+"""! @file adaptive_replications.py
+    @brief Sequential replication with confidence-interval stopping.
+
+    Instead of a fixed number of replications, runs are launched in parallel
+    batches and the Student-t confidence interval of every chosen metric is
+    updated after each batch. The study stops as soon as every interval is
+    narrower than its target, or when the run budget is spent, and reports the
+    final intervals.
+
+    Metrics are named like the scenario sweep columns: "production", "rejected",
+    "rejection_rate", "supplier_occupancy", or "station<i>_<field>" for any
+    per-station result field, e.g. "station3_occupancy".
+
+    @author: Eduardo Ulises Martinez
+    @author: Fernanda Mena
+    @author: Brandon Avalos
+"""
+
+import math
+import re
+from EUMV_FMS import _default_workers, run_replications
+from streaming_stats import RunningStats
+
+DEFAULT_METRICS = ("production", "rejection_rate", "station3_occupancy")
+
+_STATION_METRIC = re.compile(r"^station(\d+)_(\w+)$")
+
+
+def extract_metric(result, name):
+    """! Value of a named metric in one run's results.
+    @param result Results dict of a run
+    @param name Metric name (see the module description)
+    @return Metric value as a float
+    """
+    if name == "rejection_rate":
+        finished = result['production'] + result['rejected']
+        return result['rejected'] / finished if finished else 0.0
+    match = _STATION_METRIC.match(name)
+    if match:
+        station, field = int(match.group(1)), match.group(2)
+        return float(result['stations'][station][field])
+    if name not in result:
+        raise ValueError(f"Unknown metric: {name}")
+    return float(result[name])
+
+
+def _targets(metrics, half_widths, relative_precision):
+    """! Stopping rule of every metric.
+    @return Dict of metric name to (absolute half width or None, relative precision or None)
+    """
+    half_widths = half_widths or {}
+    unknown = set(half_widths) - set(metrics)
+    if unknown:
+        raise ValueError(f"Half-width targets given for metrics that are not tracked: {sorted(unknown)}")
+    return {metric: (half_widths.get(metric), None if metric in half_widths else relative_precision)
+            for metric in metrics}
+
+
+def interval_report(stats, targets, confidence):
+    """! Confidence interval of every metric and whether it meets its target.
+    @param stats Dict of metric name to RunningStats
+    @param targets Dict of metric name to (absolute half width, relative precision)
+    @param confidence Confidence level
+    @return Dict of metric name to interval dict
+    """
+    report = {}
+    for metric, accumulator in stats.items():
+        mean, half_width = accumulator.confidence_interval(confidence)
+        absolute, relative = targets[metric]
+        relative_width = half_width / abs(mean) if mean else math.inf
+        if absolute is not None:
+            met = half_width <= absolute
+        else:
+            met = relative_width <= relative or half_width == 0.0
+        report[metric] = {
+            "mean": mean,
+            "half_width": half_width,
+            "low": mean - half_width,
+            "high": mean + half_width,
+            "relative_half_width": relative_width,
+            "target": absolute if absolute is not None else relative,
+            "target_type": "absolute" if absolute is not None else "relative",
+            "met": met,
+        }
+    return report
+
+
+def run_adaptive(simulation_time, metrics=DEFAULT_METRICS, relative_precision=0.05, half_widths=None,
+                 confidence=0.95, min_runs=10, max_runs=365, batch_size=None, workers=None, cache=None,
+                 progress=True, **simulation_options):
+    """! Run replications in batches until every metric's confidence interval is narrow enough.
+    @param simulation_time Duration of each run
+    @param metrics Names of the metrics to estimate
+    @param relative_precision Target half width relative to the mean, for metrics without an absolute target
+    @param half_widths Optional dict of metric name to absolute half-width target
+    @param confidence Confidence level of the intervals
+    @param min_runs Runs made before the stopping rule is first checked
+    @param max_runs Run budget; the study stops there even if targets are not met
+    @param batch_size Runs per batch (None: two per worker, at least 4)
+    @param workers Number of worker processes (None uses every core)
+    @param cache Optional ResultCache used to load and store run results
+    @param progress Print the intervals after each batch
+    @param simulation_options Extra keyword arguments for run_simulation (e.g. facility_params)
+    @return Dict with the results, number of runs, whether the targets were met and the final intervals
+    """
+    targets = _targets(metrics, half_widths, relative_precision)
+    if batch_size is None:
+        batch_size = max(4, 2 * _default_workers(workers))
+    simulation_options.setdefault("trace_level", "off")
+
+    stats = {metric: RunningStats() for metric in metrics}
+    all_results = []
+    report = {}
+    converged = False
+    while len(all_results) < max_runs:
+        first = len(all_results)
+        # The first batch covers min_runs, later ones stop at the budget
+        size = max(batch_size, min_runs - first) if first < min_runs else batch_size
+        run_ids = range(first, min(first + size, max_runs))
+        batch = run_replications(run_ids, simulation_time, workers, cache=cache, **simulation_options)
+        for result in batch:
+            for metric in metrics:
+                stats[metric].add(extract_metric(result, metric))
+        all_results.extend(batch)
+
+        report = interval_report(stats, targets, confidence)
+        if progress:
+            widths = ", ".join(f"{metric} ±{interval['half_width']:.4g}" for metric, interval in report.items())
+            print(f"  {len(all_results)} runs: {widths}")
+        if len(all_results) >= min_runs and all(interval["met"] for interval in report.values()):
+            converged = True
+            break
+
+    return {
+        "runs": len(all_results),
+        "converged": converged,
+        "confidence": confidence,
+        "intervals": report,
+        "results": all_results,
+    }
+
+
+def print_intervals(study):
+    """! Print the final confidence intervals of an adaptive study.
+    @param study Dict returned by run_adaptive
+    """
+    status = "targets met" if study["converged"] else "run budget reached before the targets"
+    print(f"\nAdaptive replication: {study['runs']} runs, {status}")
+    print(f"{study['confidence']:.0%} confidence intervals:")
+    for metric, interval in study["intervals"].items():
+        target = (f"±{interval['target']:.4g}" if interval["target_type"] == "absolute"
+                  else f"±{interval['target']:.1%} of mean")
+        print(f"  {metric:28s} {interval['mean']:12.4f} ± {interval['half_width']:.4f} "
+              f"({interval['relative_half_width']:.2%}; target {target}) {'ok' if interval['met'] else 'NOT MET'}")
@@ -0,0 +1,244 @@
+"""! @file benchmarks.py
+    @brief Benchmark suite for the simulation and export pipeline.
+
+    Measures simulation throughput (events/sec and wall time of run_simulation
+    for several horizons), peak memory of a run at every product tracing level,
+    replication scaling with the worker count, and the time of every JSON and
+    plotting stage of the pipeline. Results are saved as JSON; the compare
+    command flags metrics that regressed against a stored baseline.
+
+    Usage:
+        python benchmarks.py run --output bench.json [--quick]
+        python benchmarks.py compare baseline.json bench.json [--threshold 0.10]
+
+    @author: Eduardo Ulises Martinez
+    @author: Fernanda Mena
+    @author: Brandon Avalos
+"""
+
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+import simpy
+from EUMV_FMS import ManufacturingFacility, run_replications, run_simulation
+from product_traces import TRACE_LEVELS, TRACE_FULL
+
+FULL_CONFIG = {
+    "simulation_times": [1000, 5000, 20000],
+    "repeats": 3,
+    "memory_simulation_time": 5000,
+    "scaling_runs": 32,
+    "scaling_simulation_time": 5000,
+    "export_runs": 30,
+    "export_simulation_time": 5000,
+}
+
+QUICK_CONFIG = {
+    "simulation_times": [500, 2000],
+    "repeats": 2,
+    "memory_simulation_time": 1000,
+    "scaling_runs": 8,
+    "scaling_simulation_time": 1000,
+    "export_runs": 5,
+    "export_simulation_time": 1000,
+}
+
+
+class CountingEnvironment(simpy.Environment):
+    """! SimPy environment that counts the events it processes."""
+
+    def __init__(self, initial_time=0):
+        """! Initialize the environment.
+        @param initial_time Simulation start time
+        """
+        super().__init__(initial_time)
+        self.events_processed = 0
+
+    def step(self):
+        """! Process the next event and count it."""
+        self.events_processed += 1
+        super().step()
+
+
+def _metric(value, unit, better="lower"):
+    """! Build a benchmark metric entry.
+    @param value Measured value
+    @param unit Unit of the value
+    @param better "lower" or "higher", the direction of improvement
+    @return Dict describing the metric
+    """
+    return {"value": value, "unit": unit, "better": better}
+
+
+def bench_simulation(simulation_times, repeats, run_id=0):
+    """! Measure wall time and events/sec of run_simulation for several horizons.
+    @param simulation_times List of simulation horizons to measure
+    @param repeats Number of repetitions; the fastest one is reported
+    @param run_id Run identifier (seed) used for every measurement
+    @return Dict of metric name to metric entry
+    """
+    metrics = {}
+    for simulation_time in simulation_times:
+        best_time = None
+        events = 0
+        for _ in range(repeats):
+            env = CountingEnvironment()
+            facility = ManufacturingFacility(env, seed=run_id + 1000, trace_level=TRACE_FULL)
+            start = time.perf_counter()
+            env.process(facility.run_production(simulation_time))
+            env.run(until=simulation_time)
+            elapsed = time.perf_counter() - start
+            if best_time is None or elapsed < best_time:
+                best_time = elapsed
+                events = env.events_processed
+        metrics[f"simulate.T{simulation_time}.wall_time"] = _metric(best_time, "s")
+        metrics[f"simulate.T{simulation_time}.events_per_sec"] = _metric(events / best_time, "events/s", "higher")
+    return metrics
+
+
+def bench_memory(simulation_time, run_id=0):
+    """! Measure peak traced memory of one run at every product tracing level.
+    @param simulation_time Simulation horizon of the run
+    @param run_id Run identifier (seed) of the run
+    @return Dict of metric name to metric entry
+    """
+    metrics = {}
+    for trace_level in TRACE_LEVELS:
+        tracemalloc.start()
+        run_simulation(run_id, simulation_time, trace_level=trace_level)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        metrics[f"memory.trace_{trace_level}.peak"] = _metric(peak / 1024 ** 2, "MiB")
+    return metrics
+
+
+def bench_scaling(num_runs, simulation_time, worker_counts=None):
+    """! Measure replication wall time for increasing worker counts.
+    @param num_runs Number of replications per measurement
+    @param simulation_time Simulation horizon of each replication
+    @param worker_counts Worker counts to try (default: powers of two up to the core count)
+    @return Dict of metric name to metric entry
+    """
+    if worker_counts is None:
+        cores = os.cpu_count() or 1
+        worker_counts = sorted({1, cores} | {2 ** k for k in range(1, 6) if 2 ** k < cores})
+    metrics = {}
+    for workers in worker_counts:
+        start = time.perf_counter()
+        run_replications(range(num_runs), simulation_time, workers=workers, trace_level="off")
+        elapsed = time.perf_counter() - start
+        metrics[f"scaling.workers{workers}.wall_time"] = _metric(elapsed, "s")
+        metrics[f"scaling.workers{workers}.runs_per_sec"] = _metric(num_runs / elapsed, "runs/s", "higher")
+    return metrics
+
+
+def bench_exports(num_runs, simulation_time):
+    """! Measure the time of every JSON generator and of generate_visualizations.
+    @param num_runs Number of replications exported
+    @param simulation_time Simulation horizon of each replication
+    @return Dict of metric name to metric entry
+    """
+    import plotting
+
+    all_results = run_replications(range(num_runs), simulation_time, workers=None)
+    stages = {
+        "generate_station_json": lambda folder: plotting.generate_station_json(all_results, folder),
+        "generate_product_json": lambda folder: plotting.generate_product_json(all_results, folder),
+        "generate_plant_json": lambda folder: plotting.generate_plant_json(all_results, folder),
+        "generate_visualizations": lambda folder: plotting.generate_visualizations(
+            all_results, os.path.join(folder, "plots")),
+    }
+    metrics = {}
+    with tempfile.TemporaryDirectory() as folder:
+        for name, stage in stages.items():
+            start = time.perf_counter()
+            stage(folder)
+            metrics[f"export.{name}.wall_time"] = _metric(time.perf_counter() - start, "s")
+    return metrics
+
+
+def run_benchmarks(config):
+    """! Run the whole benchmark suite.
+    @param config Dict of benchmark sizes (FULL_CONFIG or QUICK_CONFIG)
+    @return Dict with environment information and every metric
+    """
+    metrics = {}
+    metrics.update(bench_simulation(config["simulation_times"], config["repeats"]))
+    metrics.update(bench_memory(config["memory_simulation_time"]))
+    metrics.update(bench_scaling(config["scaling_runs"], config["scaling_simulation_time"]))
+    metrics.update(bench_exports(config["export_runs"], config["export_simulation_time"]))
+    return {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "config": config,
+        "metrics": metrics,
+    }
+
+
+def compare_benchmarks(baseline, current, threshold=0.10):
+    """! Compare two benchmark reports and flag regressions.
+    @param baseline Report dict used as reference
+    @param current Report dict to check
+    @param threshold Relative change in the wrong direction counted as a regression
+    @return List of (metric name, baseline value, current value, relative change, regressed) tuples
+    """
+    rows = []
+    for name, entry in sorted(current["metrics"].items()):
+        reference = baseline["metrics"].get(name)
+        if reference is None or not reference["value"]:
+            continue
+        change = (entry["value"] - reference["value"]) / reference["value"]
+        worse = -change if entry["better"] == "higher" else change
+        rows.append((name, reference["value"], entry["value"], change, worse > threshold))
+    return rows
+
+
+def main(argv=None):
+    """! Command-line entry point of the benchmark suite.
+    @param argv Argument list (defaults to sys.argv)
+    @return Process exit code (1 when a regression is found)
+    """
+    parser = argparse.ArgumentParser(description="Benchmark the simulation and export pipeline")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    run_parser = subparsers.add_parser("run", help="run the benchmark suite")
+    run_parser.add_argument("--output", default="bench_results.json", help="JSON file for the results")
+    run_parser.add_argument("--quick", action="store_true", help="use small sizes for a fast smoke run")
+    compare_parser = subparsers.add_parser("compare", help="compare results against a baseline")
+    compare_parser.add_argument("baseline", help="baseline results JSON")
+    compare_parser.add_argument("current", help="current results JSON")
+    compare_parser.add_argument("--threshold", type=float, default=0.10,
+                                help="relative slowdown flagged as a regression (default 0.10)")
+    args = parser.parse_args(argv)
+
+    if args.command == "run":
+        report = run_benchmarks(QUICK_CONFIG if args.quick else FULL_CONFIG)
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        for name, entry in report["metrics"].items():
+            print(f"{name:48s} {entry['value']:14.4f} {entry['unit']}")
+        print(f"Benchmark results written: {args.output}")
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+    rows = compare_benchmarks(baseline, current, args.threshold)
+    regressions = 0
+    for name, before, after, change, regressed in rows:
+        regressions += regressed
+        flag = "REGRESSION" if regressed else ""
+        print(f"{name:48s} {before:12.4f} -> {after:12.4f} ({change:+7.1%}) {flag}")
+    print(f"{regressions} regression(s) above {args.threshold:.0%}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,211 @@
+"""! @file branching.py
+    @brief What-if studies that branch from a common warm state instead of starting empty.
+
+    A run is simulated once up to the fork time, so queues are filled, bins are
+    partly drained and the production process is under way. Every branch then
+    continues from that exact state with its own parameter change (failure
+    probabilities, supplier or station capacity, bin size) and its own random
+    streams, and only the time after the fork is simulated per branch.
+
+    SimPy processes are Python generators, which cannot be copied or pickled, so
+    the warm state is shared by forking the process: each branch runs in a child
+    created with os.fork, which sees the parent's memory copy-on-write and sends
+    its results back through a file. Where os.fork is not available, each branch
+    rebuilds the warm state by simulating the warm-up again, which gives the same
+    results because runs are seeded from their run_id.
+
+    Statistics of a branch cover the period after the fork only. Product tracing
+    is off, since products in progress at the fork started under the old state.
+
+    @author: Eduardo Ulises Martinez
+    @author: Fernanda Mena
+    @author: Brandon Avalos
+"""
+
+import os
+import pickle
+import shutil
+import sys
+import tempfile
+import time
+import simpy
+from EUMV_FMS import ManufacturingFacility, _default_workers, build_results, resolve_facility_params
+from product_traces import TRACE_OFF
+from topology import build_topology
+
+
+def warm_facility(run_id, fork_time, simulation_time, facility_params=None):
+    """! Simulate a run up to the fork time.
+    @param run_id Identifier for the simulation run (seeds it like run_simulation)
+    @param fork_time Simulated time of the fork
+    @param simulation_time Total time of the run, which the production process is started with
+    @param facility_params Dict overriding DEFAULT_FACILITY_PARAMS before the fork
+    @return Tuple (SimPy environment, ManufacturingFacility) stopped at the fork time
+    """
+    env = simpy.Environment()
+    facility = ManufacturingFacility(env, seed=run_id + 1000, trace_level=TRACE_OFF,
+                                     facility_params=facility_params)
+    env.process(facility.run_production(simulation_time))
+    env.run(until=fork_time)
+    return env, facility
+
+
+def branch_seed(run_id, branch, common_random_numbers=False):
+    """! Seed of a branch's random streams.
+    @param run_id Identifier of the warm run
+    @param branch Index of the branch
+    @param common_random_numbers Give every branch the same streams, to compare branches with CRN
+    @return Seed sequence for RandomStreams
+    """
+    return (run_id + 1000, 0 if common_random_numbers else branch + 1)
+
+
+def continue_branch(env, facility, run_id, branch, changes, simulation_time, common_random_numbers=False):
+    """! Apply a branch's changes to a warm facility and simulate the rest of the run.
+    @param env SimPy environment stopped at the fork time
+    @param facility ManufacturingFacility of the environment
+    @param run_id Identifier of the warm run
+    @param branch Index of the branch
+    @param changes Dict of facility parameter overrides applied at the fork
+    @param simulation_time Total time of the run
+    @param common_random_numbers Give every branch the same streams
+    @return Results dict of the period after the fork, with a 'branch' entry
+    """
+    fork_time = env.now
+    fork_state = facility.snapshot(run_id)
+    facility.reconfigure(changes)
+    facility.reseed(branch_seed(run_id, branch, common_random_numbers))
+    facility.reset_statistics()
+    start = time.perf_counter()
+    env.run(until=simulation_time)
+
+    results = build_results(run_id, simulation_time - fork_time, facility.total_production,
+                            facility.rejected_products, facility.supplier_busy_time, facility.metrics)
+    results['branch'] = {
+        "index": branch,
+        "changes": dict(changes),
+        "fork_time": fork_time,
+        "simulation_time": simulation_time,
+        "fork_state": fork_state,
+        "wall_time_s": time.perf_counter() - start,
+    }
+    return results
+
+
+def _fork_branch(env, facility, run_id, branch, changes, simulation_time, common_random_numbers, path):
+    """! Run one branch in a forked child writing its results to path.
+    @return Process id of the child
+    """
+    sys.stdout.flush()
+    sys.stderr.flush()
+    pid = os.fork()
+    if pid:
+        return pid
+    status = 1
+    try:
+        results = continue_branch(env, facility, run_id, branch, changes, simulation_time, common_random_numbers)
+        with open(path, "wb") as f:
+            pickle.dump(results, f, protocol=pickle.HIGHEST_PROTOCOL)
+        status = 0
+    except BaseException:
+        import traceback
+        traceback.print_exc()
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        # Leave without running the parent's cleanup handlers
+        os._exit(status)
+
+
+def _reap(running, failed):
+    """! Wait for one branch child to exit, recording it as failed on a non-zero status."""
+    while True:
+        pid, status = os.wait()
+        branch = running.pop(pid, None)
+        if branch is not None:
+            break
+    if status != 0:
+        failed.append(branch)
+
+
+def run_branches(run_id, fork_time, simulation_time, branches, facility_params=None, workers=None,
+                 common_random_numbers=False, use_fork=None):
+    """! Warm a run up once, then simulate every branch from the warm state.
+    @param run_id Identifier for the simulation run
+    @param fork_time Simulated time of the fork
+    @param simulation_time Total time of each branch, warm-up included
+    @param branches List of dicts of facility parameter overrides, one per branch ({} continues unchanged);
+                    a topology override may change station settings but not the stages
+    @param facility_params Dict overriding DEFAULT_FACILITY_PARAMS before the fork
+    @param workers Number of branches simulated at once (None uses every core)
+    @param common_random_numbers Give every branch the same random streams after the fork
+    @param use_fork Fork from the warm state (None: whenever os.fork is available)
+    @return List of branch results, ordered like branches
+    """
+    if not 0 < fork_time < simulation_time:
+        raise ValueError("fork_time must be between 0 and simulation_time")
+    params = resolve_facility_params(facility_params)
+    line = build_topology(params)
+    for changes in branches:
+        topology = build_topology(resolve_facility_params(dict(params, **changes)))
+        if (topology.stages, topology.visits) != (line.stages, line.visits):
+            raise ValueError("Branches can change the settings of stations, not the stages of the line")
+    if use_fork is None:
+        use_fork = hasattr(os, "fork")
+
+    start = time.perf_counter()
+    if not use_fork:
+        # Every branch pays for its own warm-up
+        results = []
+        for branch, changes in enumerate(branches):
+            env, facility = warm_facility(run_id, fork_time, simulation_time, facility_params)
+            results.append(continue_branch(env, facility, run_id, branch, changes, simulation_time,
+                                           common_random_numbers))
+        return results
+
+    env, facility = warm_facility(run_id, fork_time, simulation_time, facility_params)
+    warmup_seconds = time.perf_counter() - start
+    workers = _default_workers(workers)
+    directory = tempfile.mkdtemp(prefix="branches-")
+    running = {}
+    failed = []
+    try:
+        for branch, changes in enumerate(branches):
+            if len(running) >= workers:
+                _reap(running, failed)
+            path = os.path.join(directory, f"branch-{branch}.pkl")
+            pid = _fork_branch(env, facility, run_id, branch, changes, simulation_time, common_random_numbers, path)
+            running[pid] = branch
+        while running:
+            _reap(running, failed)
+        if failed:
+            raise RuntimeError(f"Branches {sorted(failed)} failed; see the traceback above")
+
+        results = []
+        for branch in range(len(branches)):
+            with open(os.path.join(directory, f"branch-{branch}.pkl"), "rb") as f:
+                result = pickle.load(f)
+            result['branch']['warmup_wall_time_s'] = warmup_seconds
+            results.append(result)
+        return results
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def print_branches(results):
+    """! Print one line per branch of a what-if study.
+    @param results List returned by run_branches
+    """
+    if not results:
+        return
+    info = results[0]['branch']
+    print(f"\nBranches of run {results[0]['run_id']} forked at t={info['fork_time']:g} "
+          f"(measured over {info['simulation_time'] - info['fork_time']:g} time units):")
+    for result in results:
+        branch = result['branch']
+        finished = result['production'] + result['rejected']
+        rejection_rate = result['rejected'] / finished if finished else 0.0
+        changes = ", ".join(f"{name}={value}" for name, value in branch['changes'].items()) or "unchanged"
+        print(f"  [{branch['index']}] {changes:45s} production {result['production']:6d}  "
+              f"rejection {rejection_rate:.3f}  supplier occupancy {result['supplier_occupancy']:.3f}  "
+              f"({branch['wall_time_s']:.1f}s)")
@@ -0,0 +1,450 @@
+"""! @file cli.py
+    @brief Command-line interface of the simulation, export and plotting pipeline.
+
+    Subcommands:
+        simulate  run replications and print the summary (optionally pickle the results)
+        export    write the dashboard JSON files
+        plot      render the PNG plots
+        pipeline  simulate, plot and export in one go
+        serve     serve the dashboard with windowed JSON endpoints
+        live      stream snapshots of running simulations to the dashboard
+        adaptive  replicate until the confidence intervals reach a target precision
+        variance  antithetic pairs, or a common-random-numbers scenario comparison
+        long      one long bounded-memory run with warm-up deletion and batch means
+        shard     multi-node replication through a shared-directory work queue
+        branch    what-if branches forked from a common warm state
+
+    Only lightweight modules are imported at start-up; the simulation, export and
+    plotting modules are imported by the subcommand that needs them, so matplotlib
+    and seaborn are only loaded when plots are actually rendered.
+
+    Usage:
+        python cli.py simulate --runs 30 --time 5000 --workers 4
+        python cli.py export --runs 1 --output-folder ./data --what station plant
+        python cli.py export --runs 1 --time 500 --event-trace traces/run{run_id}.evt --what timeline
+        python cli.py plot --runs 365 --plots-dir plots --fast
+        python cli.py pipeline --runs 365 --time 5000
+        python cli.py serve --input results_store/ --port 8000
+        python cli.py live --runs 3 --time 5000 --interval 10 --speed 100
+        python cli.py adaptive --metrics production station3_occupancy --precision 0.01
+        python cli.py variance --runs 20 --compare '{"bin_size": 30}'
+        python cli.py long --time 10000000 --warmup 100000 --batches 30
+        python cli.py shard init --queue /shared/q --runs 365 --shard-size 10
+        python cli.py shard work --queue /shared/q            (on every node)
+        python cli.py export --input /shared/q --output-folder ./data
+        python cli.py branch --fork-time 4000 --time 5000 --branch '{}' --branch '{"bin_size": 10}'
+        python cli.py simulate --runs 10 --topology lines/assembly.json
+
+    @author: Eduardo Ulises Martinez
+    @author: Fernanda Mena
+    @author: Brandon Avalos
+"""
+
+import argparse
+import json
+import os
+import pickle
+import sys
+from result_cache import DEFAULT_CACHE_DIR
+
+EXPORT_TARGETS = ("station", "product", "plant", "timeline")
+
+# Run options of _add_run_arguments the vectorized engine does not support
+VECTOR_UNSUPPORTED_ARGUMENTS = {"trace_sample": "--trace-sample", "event_trace": "--event-trace"}
+
+
+def _worker_count(value):
+    """! Parse a --workers value, where "all" means one worker per core."""
+    return None if value == "all" else int(value)
+
+
+def _add_run_arguments(parser, default_runs, reuse=True):
+    """! Add the options that select which replications a command works on.
+    @param parser argparse parser of the subcommand
+    @param default_runs Default number of replications
+    @param reuse Also offer --engine and --input, which the pipeline command does not support
+    """
+    parser.add_argument("--runs", type=int, default=default_runs, help="number of replications")
+    parser.add_argument("--time", type=float, default=5000, help="simulation horizon of each replication")
+    parser.add_argument("--workers", type=_worker_count, default="all",
+                        help="worker processes, or 'all' for one per core (default)")
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR, help="simulation result cache directory")
+    parser.add_argument("--no-cache", action="store_true", help="do not read or write the result cache")
+    if reuse:
+        parser.add_argument("--engine", choices=("simpy", "vector"), default="simpy", help="simulation engine")
+        parser.add_argument("--trace-sample", type=int, default=None,
+                            help="keep a reservoir sample of this many traced products per quality per run")
+        parser.add_argument("--event-trace", default=None,
+                            help="record every event of each run in a ring buffer file; '{run_id}' in the "
+                                 "path is replaced by the run (e.g. traces/run{run_id}.evt)")
+        parser.add_argument("--topology", default=None,
+                            help="JSON file describing the stages and stations of the line (see topology.py)")
+        parser.add_argument("--input", help="results written by 'simulate --output' (pickle file), "
+                                            "'simulate --store' (results store directory) or a finished "
+                                            "'shard' queue directory, instead of simulating")
+
+
+def _load_results(args, trace_level):
+    """! Obtain the results a command works on, from --input or by simulating.
+    @param args Parsed arguments
+    @param trace_level Product tracing level needed by the command
+    @return List of run results
+    """
+    if args.input:
+        from sharding import is_shard_queue, merge_shards
+        if is_shard_queue(args.input):
+            return merge_shards(args.input)
+        if os.path.isdir(args.input):
+            from results_store import open_results_store
+            return open_results_store(args.input)
+        with open(args.input, "rb") as f:
+            return pickle.load(f)
+
+    from EUMV_FMS import run_all_runs
+    cache = None
+    if not args.no_cache and args.engine == "simpy":
+        from result_cache import ResultCache
+        cache = ResultCache(args.cache_dir)
+    options = {"trace_sample": args.trace_sample} if args.trace_sample else {}
+    if args.event_trace:
+        options["event_trace"] = args.event_trace
+    if args.topology:
+        with open(args.topology) as f:
+            options["facility_params"] = {"topology": json.load(f)}
+    return run_all_runs(args.runs, args.time, workers=args.workers, progress=True, cache=cache,
+                        trace_level=trace_level, engine=args.engine, **options)
+
+
+def command_simulate(args):
+    """! Run replications, optionally saving the results."""
+    results = _load_results(args, args.trace_level)
+    if args.output:
+        with open(args.output, "wb") as f:
+            pickle.dump(results, f, protocol=pickle.HIGHEST_PROTOCOL)
+        print(f"Results written: {args.output}")
+    if args.store:
+        from results_store import write_results_store
+        write_results_store(results, args.store)
+        print(f"Results store written: {args.store}")
+    return 0
+
+
+def command_export(args):
+    """! Write the selected dashboard JSON files."""
+    product_export = "product" in args.what
+    results = _load_results(args, "full" if product_export else "off")
+
+    import plotting
+    if "station" in args.what:
+        plotting.generate_station_json(results, args.output_folder)
+    if product_export:
+        if args.ndjson:
+            manifest = plotting.stream_product_json(results, args.output_folder, compress=args.compress)
+            print(f"Product shards written: {manifest}")
+        else:
+            plotting.generate_product_json(results, args.output_folder)
+    if "plant" in args.what:
+        plotting.generate_plant_json(results, args.output_folder)
+    if "timeline" in args.what:
+        traced = [result for result in results if result.get('event_trace')]
+        if traced:
+            from event_recorder import export_timeline
+            export_timeline(traced[0]['event_trace'], args.output_folder,
+                            station_names=traced[0].get('station_names'))
+        else:
+            print("No event trace to export; simulate with --event-trace to record one")
+    print(f"JSON files generated in: {args.output_folder}")
+    return 0
+
+
+def command_plot(args):
+    """! Render the PNG plots."""
+    results = _load_results(args, "off")
+
+    import plotting
+    plotting.generate_visualizations(results, args.plots_dir, workers=args.workers, fast=args.fast,
+                                     force=args.force)
+    return 0
+
+
+def command_pipeline(args):
+    """! Simulate, plot and export everything, like plotting.run_complete_pipeline."""
+    import plotting
+    plotting.run_complete_pipeline(args.runs, args.time, args.output_folder, workers=args.workers,
+                                   cache_dir=None if args.no_cache else args.cache_dir,
+                                   plots_dir=args.plots_dir, fast_plots=args.fast)
+    return 0
+
+
+def command_serve(args):
+    """! Serve the dashboard and its windowed endpoints until interrupted."""
+    results = _load_results(args, "full")
+
+    from dashboard_server import serve_dashboard
+    serve_dashboard(results, args.root, args.host, args.port)
+    return 0
+
+
+def command_live(args):
+    """! Stream snapshots of running simulations until interrupted."""
+    from live_server import serve_live
+    serve_live(range(args.runs), args.time, args.interval, args.speed, args.root, args.host, args.port,
+               trace_level="off")
+    return 0
+
+
+def command_adaptive(args):
+    """! Replicate in batches until the confidence intervals are narrow enough."""
+    from adaptive_replications import print_intervals, run_adaptive
+    cache = None
+    if not args.no_cache:
+        from result_cache import ResultCache
+        cache = ResultCache(args.cache_dir)
+    study = run_adaptive(args.time, args.metrics, args.precision, confidence=args.confidence,
+                         min_runs=args.min_runs, max_runs=args.max_runs, batch_size=args.batch_size,
+                         workers=args.workers, cache=cache)
+    print_intervals(study)
+    return 0
+
+
+def command_variance(args):
+    """! Run an antithetic or common-random-numbers study and report the variance reduction."""
+    from variance_reduction import compare_scenarios, print_variance_report, run_antithetic
+    cache = None
+    if not args.no_cache:
+        from result_cache import ResultCache
+        cache = ResultCache(args.cache_dir)
+    if args.compare is not None:
+        study = compare_scenarios(json.loads(args.baseline), json.loads(args.compare), args.runs, args.time,
+                                  args.metrics, args.confidence, args.workers, cache)
+    else:
+        study = run_antithetic(args.runs, args.time, args.metrics, args.confidence,
+                               json.loads(args.baseline), args.workers, cache)
+    print_variance_report(study)
+    return 0
+
+
+def command_long(args):
+    """! Run one long bounded-memory run and print its batch-means intervals."""
+    from long_run import print_long_run, run_long
+    results = run_long(args.run_id, args.time, args.warmup, args.batches, args.wip_limit, args.confidence,
+                       json.loads(args.params))
+    print_long_run(results)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results['long_run'], f, indent=2)
+        print(f"Long-run summary written: {args.output}")
+    return 0
+
+
+def command_shard(args):
+    """! Create, work on, inspect or merge a shared-directory work queue."""
+    import sharding
+    if args.action == "init":
+        job = sharding.create_job(args.queue, args.runs, args.time, args.shard_size, trace_level=args.trace_level,
+                                  facility_params=json.loads(args.params) or None)
+        print(f"Queue ready: {job['num_runs']} runs in {job['num_shards']} shard(s) at {args.queue}")
+    elif args.action == "work":
+        if args.local > 1:
+            codes = sharding.launch_local_workers(args.queue, args.local, args.lease)
+            return max(codes)
+        cache = None
+        if not args.no_cache:
+            from result_cache import ResultCache
+            cache = ResultCache(args.cache_dir)
+        done = sharding.run_worker(args.queue, args.worker_id, args.workers, args.lease, cache)
+        print(f"Worker finished: {done} shard(s) simulated")
+    elif args.action == "status":
+        status = sharding.queue_status(args.queue, args.lease)
+        print(f"{status['job']['num_shards']} shard(s): {status['done']} done, {status['running']} running, "
+              f"{status['abandoned']} abandoned, {status['pending']} pending")
+    else:
+        results = sharding.merge_shards(args.queue, allow_partial=args.partial)
+        if args.output:
+            with open(args.output, "wb") as f:
+                pickle.dump(results, f, protocol=pickle.HIGHEST_PROTOCOL)
+            print(f"Results written: {args.output}")
+        if args.store:
+            from results_store import write_results_store
+            write_results_store(results, args.store)
+            print(f"Results store written: {args.store}")
+        print(f"Merged {len(results)} run(s)")
+    return 0
+
+
+def command_branch(args):
+    """! Fork what-if branches from a common warm state and print their results."""
+    from branching import print_branches, run_branches
+    branches = [json.loads(branch) for branch in args.branch] or [{}]
+    results = run_branches(args.run_id, args.fork_time, args.time, branches, json.loads(args.params) or None,
+                           args.workers, args.crn)
+    print_branches(results)
+    if args.output:
+        with open(args.output, "wb") as f:
+            pickle.dump(results, f, protocol=pickle.HIGHEST_PROTOCOL)
+        print(f"Results written: {args.output}")
+    return 0
+
+
+def build_parser():
+    """! Build the argument parser of the command-line interface.
+    @return argparse.ArgumentParser with one subparser per command
+    """
+    parser = argparse.ArgumentParser(description="Manufacturing facility simulation pipeline")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    simulate_parser = subparsers.add_parser("simulate", help="run replications and print the summary")
+    _add_run_arguments(simulate_parser, default_runs=5)
+    simulate_parser.add_argument("--trace-level", choices=("off", "summary", "full"), default="full",
+                                 help="product tracing level")
+    simulate_parser.add_argument("--output", help="pickle file for the results")
+    simulate_parser.add_argument("--store", help="directory for a memory-mapped columnar results store")
+    simulate_parser.set_defaults(handler=command_simulate)
+
+    export_parser = subparsers.add_parser("export", help="write the dashboard JSON files")
+    _add_run_arguments(export_parser, default_runs=365)
+    export_parser.add_argument("--output-folder", default="./data", help="output directory for JSON files")
+    export_parser.add_argument("--what", nargs="+", choices=EXPORT_TARGETS, default=list(EXPORT_TARGETS[:3]),
+                               help="files to export (default: station product plant; timeline needs "
+                                    "--event-trace)")
+    export_parser.add_argument("--ndjson", action="store_true", help="export products as NDJSON shards")
+    export_parser.add_argument("--compress", action="store_true", help="gzip the NDJSON shards")
+    export_parser.set_defaults(handler=command_export)
+
+    plot_parser = subparsers.add_parser("plot", help="render the PNG plots")
+    _add_run_arguments(plot_parser, default_runs=365)
+    plot_parser.add_argument("--plots-dir", default="plots", help="output directory for the plots")
+    plot_parser.add_argument("--fast", action="store_true", help="headless fast rendering")
+    plot_parser.add_argument("--force", action="store_true", help="redraw plots whose data is unchanged")
+    plot_parser.set_defaults(handler=command_plot)
+
+    pipeline_parser = subparsers.add_parser("pipeline", help="simulate, plot and export everything")
+    _add_run_arguments(pipeline_parser, default_runs=365, reuse=False)
+    pipeline_parser.add_argument("--output-folder", default="./data", help="output directory for JSON files")
+    pipeline_parser.add_argument("--plots-dir", default="plots", help="output directory for the plots")
+    pipeline_parser.add_argument("--fast", action="store_true", help="headless fast rendering")
+    pipeline_parser.set_defaults(handler=command_pipeline)
+
+    serve_parser = subparsers.add_parser("serve", help="serve the dashboard with windowed JSON endpoints")
+    _add_run_arguments(serve_parser, default_runs=365)
+    serve_parser.add_argument("--host", default="127.0.0.1", help="interface to listen on")
+    serve_parser.add_argument("--port", type=int, default=8000, help="port to listen on")
+    serve_parser.add_argument("--root", help="directory with index.html (default: the project directory)")
+    serve_parser.set_defaults(handler=command_serve)
+
+    live_parser = subparsers.add_parser("live", help="stream snapshots of running simulations to the dashboard")
+    live_parser.add_argument("--runs", type=int, default=1, help="number of replications, run one after another")
+    live_parser.add_argument("--time", type=float, default=5000, help="simulation horizon of each replication")
+    live_parser.add_argument("--interval", type=float, default=None,
+                             help="simulated time between snapshots (default: 1%% of the horizon)")
+    live_parser.add_argument("--speed", type=float, default=None,
+                             help="simulated time units per second (default: as fast as possible)")
+    live_parser.add_argument("--host", default="127.0.0.1", help="interface to listen on")
+    live_parser.add_argument("--port", type=int, default=8001, help="port to listen on")
+    live_parser.add_argument("--root", help="directory with index.html (default: the project directory)")
+    live_parser.set_defaults(handler=command_live)
+
+    adaptive_parser = subparsers.add_parser("adaptive",
+                                            help="replicate until the confidence intervals reach a target precision")
+    adaptive_parser.add_argument("--time", type=float, default=5000, help="simulation horizon of each replication")
+    adaptive_parser.add_argument("--metrics", nargs="+", default=["production", "rejection_rate", "station3_occupancy"],
+                                 help="metrics to estimate, e.g. production rejection_rate station3_occupancy")
+    adaptive_parser.add_argument("--precision", type=float, default=0.05,
+                                 help="target half width relative to the mean (default 0.05)")
+    adaptive_parser.add_argument("--confidence", type=float, default=0.95, help="confidence level")
+    adaptive_parser.add_argument("--min-runs", type=int, default=10, help="runs before checking the targets")
+    adaptive_parser.add_argument("--max-runs", type=int, default=365, help="run budget")
+    adaptive_parser.add_argument("--batch-size", type=int, default=None, help="runs per batch")
+    adaptive_parser.add_argument("--workers", type=_worker_count, default="all",
+                                 help="worker processes, or 'all' for one per core (default)")
+    adaptive_parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR, help="simulation result cache directory")
+    adaptive_parser.add_argument("--no-cache", action="store_true", help="do not read or write the result cache")
+    adaptive_parser.set_defaults(handler=command_adaptive)
+
+    variance_parser = subparsers.add_parser("variance",
+                                            help="antithetic pairs, or a common-random-numbers scenario comparison")
+    variance_parser.add_argument("--runs", type=int, default=20,
+                                 help="antithetic pairs, or paired runs per scenario with --compare")
+    variance_parser.add_argument("--time", type=float, default=5000, help="simulation horizon of each run")
+    variance_parser.add_argument("--baseline", default="{}", help="facility parameter overrides as JSON")
+    variance_parser.add_argument("--compare", default=None,
+                                 help="JSON overrides of a scenario compared with the baseline using common "
+                                      "random numbers (default: antithetic study of the baseline)")
+    variance_parser.add_argument("--metrics", nargs="+", default=["production", "rejection_rate", "station3_occupancy"],
+                                 help="metrics to estimate")
+    variance_parser.add_argument("--confidence", type=float, default=0.95, help="confidence level")
+    variance_parser.add_argument("--workers", type=_worker_count, default="all",
+                                 help="worker processes, or 'all' for one per core (default)")
+    variance_parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR, help="simulation result cache directory")
+    variance_parser.add_argument("--no-cache", action="store_true", help="do not read or write the result cache")
+    variance_parser.set_defaults(handler=command_variance)
+
+    long_parser = subparsers.add_parser("long",
+                                        help="one long bounded-memory run with warm-up deletion and batch means")
+    long_parser.add_argument("--time", type=float, default=1e6, help="simulation horizon, warm-up included")
+    long_parser.add_argument("--warmup", type=float, default=None,
+                             help="simulated time discarded from the statistics (default: 10%% of --time)")
+    long_parser.add_argument("--batches", type=int, default=20, help="number of batches for the intervals")
+    long_parser.add_argument("--wip-limit", type=int, default=64, help="maximum number of products in the line")
+    long_parser.add_argument("--confidence", type=float, default=0.95, help="confidence level")
+    long_parser.add_argument("--run-id", type=int, default=0, help="run identifier (seed)")
+    long_parser.add_argument("--params", default="{}", help="facility parameter overrides as JSON")
+    long_parser.add_argument("--output", default=None, help="write the settings, batches and intervals as JSON")
+    long_parser.set_defaults(handler=command_long)
+
+    shard_parser = subparsers.add_parser("shard", help="multi-node replication through a shared-directory work queue")
+    shard_parser.add_argument("action", choices=("init", "work", "status", "merge"),
+                              help="create the queue, simulate shards, show progress or merge the results")
+    shard_parser.add_argument("--queue", required=True, help="work queue directory shared by every node")
+    shard_parser.add_argument("--runs", type=int, default=365, help="init: number of replications")
+    shard_parser.add_argument("--time", type=float, default=5000, help="init: simulation horizon of each replication")
+    shard_parser.add_argument("--shard-size", type=int, default=10, help="init: consecutive runs per shard")
+    shard_parser.add_argument("--trace-level", choices=("off", "summary", "full"), default="full",
+                              help="init: product tracing level of the runs")
+    shard_parser.add_argument("--params", default="{}", help="init: facility parameter overrides as JSON")
+    shard_parser.add_argument("--lease", type=float, default=300.0,
+                              help="seconds without heartbeat after which a claim is taken over")
+    shard_parser.add_argument("--worker-id", default=None, help="work: name recorded in claims")
+    shard_parser.add_argument("--workers", type=_worker_count, default="all",
+                              help="work: processes per shard, or 'all' for one per core (default)")
+    shard_parser.add_argument("--local", type=int, default=1,
+                              help="work: start this many single-process workers on this machine")
+    shard_parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR, help="work: simulation result cache directory")
+    shard_parser.add_argument("--no-cache", action="store_true", help="work: do not read or write the result cache")
+    shard_parser.add_argument("--partial", action="store_true", help="merge: merge the shards finished so far")
+    shard_parser.add_argument("--output", help="merge: pickle file for the merged results")
+    shard_parser.add_argument("--store", help="merge: results store directory for the merged results")
+    shard_parser.set_defaults(handler=command_shard)
+
+    branch_parser = subparsers.add_parser("branch", help="what-if branches forked from a common warm state")
+    branch_parser.add_argument("--run-id", type=int, default=0, help="run identifier (seed) of the warm run")
+    branch_parser.add_argument("--fork-time", type=float, required=True, help="simulated time of the fork")
+    branch_parser.add_argument("--time", type=float, default=5000, help="simulation horizon, warm-up included")
+    branch_parser.add_argument("--branch", action="append", default=[],
+                               help="facility parameter changes of one branch as JSON (repeat per branch)")
+    branch_parser.add_argument("--params", default="{}", help="facility parameter overrides before the fork")
+    branch_parser.add_argument("--crn", action="store_true",
+                               help="give every branch the same random streams after the fork")
+    branch_parser.add_argument("--workers", type=_worker_count, default="all",
+                               help="branches simulated at once, or 'all' for one per core (default)")
+    branch_parser.add_argument("--output", help="pickle file for the branch results")
+    branch_parser.set_defaults(handler=command_branch)
+    return parser
+
+
+def main(argv=None):
+    """! Command-line entry point.
+    @param argv Argument list (defaults to sys.argv)
+    @return Process exit code
+    """
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if getattr(args, "engine", None) == "vector" and not getattr(args, "input", None):
+        for name, flag in VECTOR_UNSUPPORTED_ARGUMENTS.items():
+            if getattr(args, name, None):
+                parser.error(f"{flag} needs the SimPy event loop; it cannot be used with --engine vector")
+    return args.handler(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
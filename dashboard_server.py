@@ -0,0 +1,334 @@
+"""! @file dashboard_server.py
+    @brief Local HTTP server for the dashboard with windowed JSON endpoints.
+
+    Serves index.html and its static assets (DASHBOARD_ASSETS), plus JSON
+    endpoints that return only the slice of data the dashboard renders:
+
+        /api/windows                             available windows and number of days
+        /api/stations?window=weekly[&station=2]  station entries of one window
+        /api/stations?start=10&end=40            station entries of a custom day range
+        /api/plant?window=weekly                 plant summary of one window (or start/end)
+        /api/products?page=0&page_size=100       one page of product entries
+
+    Windows are answered from the prefix-sum aggregates (WindowedMetrics), so the
+    cost of a request does not grow with the number of simulated days. Responses
+    carry a strong ETag, are gzip-compressed when the client accepts it and are
+    answered with 304 Not Modified when If-None-Match matches.
+
+    @author: Eduardo Ulises Martinez
+    @author: Fernanda Mena
+    @author: Brandon Avalos
+"""
+
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import threading
+from collections import OrderedDict
+from functools import partial
+from http import HTTPStatus
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+import numpy as np
+from plotting import build_plant_entries, build_station_entries, iter_product_entries
+from results_store import ResultsStore
+from windowed_metrics import STANDARD_WINDOWS, WindowedMetrics
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8000
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+RESPONSE_CACHE_SIZE = 256
+
+# Files and directories of the root served as static files; anything else in the
+# repository (results, caches, .git) stays private
+DASHBOARD_ASSETS = ("index.html", "css", "js", "img", "data")
+
+# Responses smaller than this are not worth compressing
+GZIP_MIN_BYTES = 512
+COMPRESSIBLE_TYPES = ("application/json", "text/", "application/javascript", "image/svg+xml")
+
+
+class DashboardData:
+    """! Windowed views of a set of run results, as served by the dashboard endpoints."""
+
+    def __init__(self, all_results):
+        """! Aggregate the results once.
+        @param all_results List of simulation run results or a ResultsStore
+        """
+        self.results = all_results
+        self.aggregates = WindowedMetrics(all_results)
+        self._product_offsets = None
+        self._lock = threading.Lock()
+
+    def window(self, query):
+        """! Window name and specification selected by a query string.
+        @param query Dict of query parameters (lists of strings, as from parse_qs)
+        @return Tuple (name, spec)
+        """
+        if "start" in query or "end" in query:
+            start = int(query.get("start", ["0"])[0])
+            end = int(query.get("end", [str(self.aggregates.num_days)])[0])
+            return "range", (start, end)
+        name = query.get("window", ["daily"])[0]
+        if name not in STANDARD_WINDOWS:
+            raise ValueError(f"Unknown window: {name}. Expected one of {tuple(STANDARD_WINDOWS)}")
+        return name, STANDARD_WINDOWS[name]
+
+    def windows(self):
+        """! Payload of /api/windows."""
+        return {"windows": STANDARD_WINDOWS, "num_days": self.aggregates.num_days,
+                "num_stations": self.aggregates.num_stations}
+
+    def stations(self, query):
+        """! Payload of /api/stations: station entries holding a single window."""
+        name, spec = self.window(query)
+        stations = None
+        if "station" in query:
+            station = int(query["station"][0])
+            if not 0 <= station < self.aggregates.num_stations:
+                raise ValueError(f"Unknown station: {station}")
+            stations = [station]
+        return build_station_entries(self.aggregates, {name: spec}, stations)
+
+    def plant(self, query):
+        """! Payload of /api/plant: the plant summary of a single window."""
+        name, spec = self.window(query)
+        return build_plant_entries(self.aggregates, {name: spec})
+
+    def _run(self, index):
+        """! Product traces of one run, without building its full results dict for a store."""
+        if isinstance(self.results, ResultsStore):
+            return {"run_id": int(self.results.run_column("run_id")[index]),
+                    "products": self.results.product_traces(index)}
+        return self.results[index]
+
+    def product_offsets(self):
+        """! Cumulative number of exported (completed) products before each run, computed once."""
+        with self._lock:
+            if self._product_offsets is None:
+                counts = []
+                for index in range(len(self.results)):
+                    traces = self._run(index).get("products")
+                    if traces is None:
+                        counts.append(0)
+                    else:
+                        counts.append(int(np.count_nonzero(~np.isnan(traces.product_columns()["end_time"]))))
+                offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+                np.cumsum(counts, out=offsets[1:])
+                self._product_offsets = offsets
+        return self._product_offsets
+
+    def products(self, query):
+        """! Payload of /api/products: one page of product entries in export order."""
+        page = max(0, int(query.get("page", ["0"])[0]))
+        page_size = min(MAX_PAGE_SIZE, max(1, int(query.get("page_size", [str(DEFAULT_PAGE_SIZE)])[0])))
+        offsets = self.product_offsets()
+        first = page * page_size
+        last = min(first + page_size, int(offsets[-1]))
+        entries = []
+        # Jump straight to the run holding the first product of the page
+        run = int(np.searchsorted(offsets, first, side="right")) - 1
+        position = first
+        while position < last and run < len(self.results):
+            skip = position - int(offsets[run])
+            for index, entry in enumerate(iter_product_entries(self._run(run))):
+                if index < skip:
+                    continue
+                if position >= last:
+                    break
+                entries.append(entry)
+                position += 1
+            run += 1
+        return {"page": page, "page_size": page_size, "total": int(offsets[-1]), "products": entries}
+
+
+def dashboard_asset_path(root, url_path):
+    """! File of the dashboard root a URL path refers to, if it is a served asset.
+    @param root Dashboard root directory
+    @param url_path Decoded path of the request URL
+    @return Absolute file path, or None when the path is outside DASHBOARD_ASSETS or not a file
+    """
+    root = os.path.abspath(root)
+    path = os.path.abspath(os.path.join(root, url_path.lstrip("/") or "index.html"))
+    if os.path.isdir(path):
+        path = os.path.join(path, "index.html")
+    relative = os.path.relpath(path, root).split(os.sep)
+    if relative[0] not in DASHBOARD_ASSETS or not os.path.isfile(path):
+        return None
+    return path
+
+
+class _Response:
+    """! Encoded response body with its ETag and compressed variant."""
+    __slots__ = ("body", "etag", "content_type", "gzipped")
+
+    def __init__(self, body, content_type):
+        self.body = body
+        self.content_type = content_type
+        self.etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+        compressible = content_type.startswith(COMPRESSIBLE_TYPES) and len(body) >= GZIP_MIN_BYTES
+        self.gzipped = gzip.compress(body, compresslevel=6) if compressible else None
+
+
+class DashboardRequestHandler(SimpleHTTPRequestHandler):
+    """! Request handler serving the static dashboard files and the JSON endpoints."""
+
+    # Set by make_server
+    data = None
+    cache = None
+    cache_lock = None
+
+    def do_GET(self):
+        """! Answer a GET request from the endpoint or static file cache."""
+        self._answer()
+
+    def do_HEAD(self):
+        """! Answer a HEAD request like GET (same allowlist and cache), sending headers only."""
+        self._answer(head=True)
+
+    def _answer(self, head=False):
+        """! Look up and send the response of the request URL.
+        @param head Send the headers without the body
+        """
+        url = urlsplit(self.path)
+        try:
+            response = self._cached(url)
+        except ValueError as error:
+            self._send_error_json(HTTPStatus.BAD_REQUEST, str(error))
+            return
+        if response is None:
+            self.send_error(HTTPStatus.NOT_FOUND)
+            return
+        self._send(response, head)
+
+    def _cached(self, url):
+        """! Response of a URL, built once and kept in a small LRU cache.
+
+        @details Endpoint responses only depend on the loaded results. Static files are
+        keyed on their modification time and size as well, so a re-exported data file or an
+        edited script is served (with a new ETag) as soon as it changes on disk.
+        """
+        key = url.path + "?" + url.query
+        if not url.path.startswith("/api/"):
+            path = dashboard_asset_path(self.directory, unquote(url.path))
+            try:
+                stat = os.stat(path) if path is not None else None
+            except OSError:  # Removed since it was found
+                stat = None
+            if stat is None:
+                return None
+            key = f"{path}:{stat.st_mtime_ns}:{stat.st_size}"
+        with self.cache_lock:
+            response = self.cache.get(key)
+            if response is not None:
+                self.cache.move_to_end(key)
+                return response
+        response = self._build(url)
+        if response is not None:
+            with self.cache_lock:
+                self.cache[key] = response
+                while len(self.cache) > RESPONSE_CACHE_SIZE:
+                    self.cache.popitem(last=False)
+        return response
+
+    def _build(self, url):
+        """! Build the response of an endpoint or static file.
+        @return _Response, or None when nothing is found
+        """
+        endpoints = {
+            "/api/windows": lambda query: self.data.windows(),
+            "/api/stations": self.data.stations,
+            "/api/plant": self.data.plant,
+            "/api/products": self.data.products,
+        }
+        if url.path in endpoints:
+            payload = endpoints[url.path](parse_qs(url.query))
+            body = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+            return _Response(body, "application/json")
+
+        path = dashboard_asset_path(self.directory, unquote(url.path))
+        if path is None:
+            return None
+        with open(path, "rb") as f:
+            body = f.read()
+        content_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+        return _Response(body, content_type)
+
+    def _send(self, response, head=False):
+        """! Send a response, honouring If-None-Match and Accept-Encoding.
+        @param response _Response to send
+        @param head Send the headers without the body (HEAD request)
+        """
+        if self.headers.get("If-None-Match") == response.etag:
+            self.send_response(HTTPStatus.NOT_MODIFIED)
+            self.send_header("ETag", response.etag)
+            self.end_headers()
+            return
+        body = response.body
+        use_gzip = response.gzipped is not None and "gzip" in self.headers.get("Accept-Encoding", "")
+        if use_gzip:
+            body = response.gzipped
+        self.send_response(HTTPStatus.OK)
+        self.send_header("Content-Type", response.content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", response.etag)
+        # Revalidate every time; unchanged data costs a 304 with no body
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Vary", "Accept-Encoding")
+        if use_gzip:
+            self.send_header("Content-Encoding", "gzip")
+        self.end_headers()
+        if not head:
+            self.wfile.write(body)
+
+    def _send_error_json(self, status, message):
+        """! Send a JSON error body."""
+        body = json.dumps({"error": message}).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        """! Keep the console quiet apart from errors."""
+
+
+def make_server(all_results, root=None, host=DEFAULT_HOST, port=DEFAULT_PORT):
+    """! Create the dashboard server without starting it.
+    @param all_results List of simulation run results or a ResultsStore
+    @param root Directory with index.html and its assets (default: this module's directory);
+                only DASHBOARD_ASSETS under it are served
+    @param host Interface to listen on
+    @param port Port to listen on (0 picks a free one)
+    @return ThreadingHTTPServer
+    """
+    root = root or os.path.dirname(os.path.abspath(__file__))
+    # A handler subclass per server keeps its data and response cache separate
+    handler = type("BoundDashboardRequestHandler", (DashboardRequestHandler,), {
+        "data": DashboardData(all_results),
+        "cache": OrderedDict(),
+        "cache_lock": threading.Lock(),
+    })
+    return ThreadingHTTPServer((host, port), partial(handler, directory=root))
+
+
+def serve_dashboard(all_results, root=None, host=DEFAULT_HOST, port=DEFAULT_PORT):
+    """! Serve the dashboard until interrupted.
+    @param all_results List of simulation run results or a ResultsStore
+    @param root Directory with index.html and its assets
+    @param host Interface to listen on
+    @param port Port to listen on
+    """
+    server = make_server(all_results, root, host, port)
+    print(f"Dashboard served at http://{server.server_address[0]}:{server.server_address[1]}/")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
@@ -0,0 +1,312 @@
+"""! @file event_recorder.py
+    @brief Opt-in per-event trace of a run in a memory-mapped ring buffer file.
+
+    Every station request and grant, process start and end, breakdown start and
+    end, resupply start and end and rejection is written as a fixed-size 24-byte
+    record (EVENT_DTYPE). Records are appended to a small in-memory batch and
+    copied into the memory-mapped file one block at a time, so the per-event cost
+    is a tuple append. The file is a ring: once full, new records overwrite the
+    oldest ones, keeping the last `capacity` events of an arbitrarily long run.
+
+    File layout:
+        header (64 bytes)   magic, version, record size, capacity, records written
+        records             capacity × EVENT_DTYPE
+
+    EventTrace reads a file back as zero-copy NumPy structured array views, and
+    export_timeline turns it into the start/end segments of a Gantt view
+    (TimelineInfo.json), shown by the dashboard's Timeline chart.
+
+    @author: Eduardo Ulises Martinez
+    @author: Fernanda Mena
+    @author: Brandon Avalos
+"""
+
+import json
+import os
+import numpy as np
+from topology import station_name
+
+MAGIC = b"FMSEVTRB"
+VERSION = 1
+HEADER_SIZE = 64
+DEFAULT_CAPACITY = 1 << 20
+FLUSH_EVENTS = 4096
+
+# Event kinds
+EVENT_REQUEST = 1          # product joins a station queue (value: queue length before joining)
+EVENT_GRANT = 2            # product seizes the station (value: waiting time)
+EVENT_PROCESS_START = 3
+EVENT_PROCESS_END = 4      # value: processing time
+EVENT_BREAKDOWN_START = 5
+EVENT_BREAKDOWN_END = 6    # value: fixing time
+EVENT_RESUPPLY_START = 7   # station bin empty, supplier requested (value: supplier queue length)
+EVENT_RESUPPLY_END = 8     # value: resupply duration including the wait for a supplier
+EVENT_REJECTION = 9
+EVENT_NAMES = {
+    EVENT_REQUEST: "request",
+    EVENT_GRANT: "grant",
+    EVENT_PROCESS_START: "process_start",
+    EVENT_PROCESS_END: "process_end",
+    EVENT_BREAKDOWN_START: "breakdown_start",
+    EVENT_BREAKDOWN_END: "breakdown_end",
+    EVENT_RESUPPLY_START: "resupply_start",
+    EVENT_RESUPPLY_END: "resupply_end",
+    EVENT_REJECTION: "rejection",
+}
+
+EVENT_DTYPE = np.dtype([
+    ("time", "<f8"),
+    ("product_id", "<i8"),   # -1 when no product is involved
+    ("value", "<f4"),        # kind-specific, see the event kinds
+    ("station", "<i2"),
+    ("kind", "u1"),
+    ("reserved", "u1"),
+])
+
+HEADER_DTYPE = np.dtype([
+    ("magic", "S8"),
+    ("version", "<u4"),
+    ("record_size", "<u4"),
+    ("capacity", "<u8"),
+    ("written", "<u8"),
+    ("reserved", "V32"),
+])
+
+# (segment kind, start event, end event) pairs matched by export_timeline
+TIMELINE_SEGMENTS = (
+    ("process", EVENT_PROCESS_START, EVENT_PROCESS_END),
+    ("breakdown", EVENT_BREAKDOWN_START, EVENT_BREAKDOWN_END),
+    ("resupply", EVENT_RESUPPLY_START, EVENT_RESUPPLY_END),
+    ("queue", EVENT_REQUEST, EVENT_GRANT),
+)
+
+
+def _map(path, mode, capacity=None):
+    """! Memory-map a ring buffer file.
+    @return Tuple (header record view, records array view, memmap)
+    """
+    if capacity is None:
+        memory = np.memmap(path, dtype=np.uint8, mode=mode)
+    else:
+        memory = np.memmap(path, dtype=np.uint8, mode=mode, shape=(HEADER_SIZE + capacity * EVENT_DTYPE.itemsize,))
+    header = memory[:HEADER_SIZE].view(HEADER_DTYPE)
+    records = memory[HEADER_SIZE:].view(EVENT_DTYPE)
+    return header, records, memory
+
+
+class EventRecorder:
+    """! Writer of the ring buffer file of one run."""
+
+    def __init__(self, path, capacity=DEFAULT_CAPACITY):
+        """! Create (or truncate) the ring buffer file.
+        @param path Path of the file
+        @param capacity Number of records kept; older records are overwritten beyond it
+        """
+        if capacity < 1:
+            raise ValueError("capacity must be at least 1")
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.capacity = int(capacity)
+        self.header, self.records, self._memory = _map(path, "w+", self.capacity)
+        self.header[0] = (MAGIC, VERSION, EVENT_DTYPE.itemsize, self.capacity, 0, b"")
+        self.written = 0
+        self._pending = []
+
+    def record(self, time, kind, station, product_id=-1, value=0.0):
+        """! Append one event (buffered until the next flush).
+        @param time Simulation time of the event
+        @param kind One of the EVENT_* kinds
+        @param station Station index
+        @param product_id Product involved, or -1
+        @param value Kind-specific value
+        """
+        self._pending.append((time, product_id, value, station, kind, 0))
+        if len(self._pending) >= FLUSH_EVENTS:
+            self.flush()
+
+    def flush(self):
+        """! Copy the buffered events into the ring and publish the new record count."""
+        if not self._pending:
+            return
+        block = np.array(self._pending, dtype=EVENT_DTYPE)
+        self._pending = []
+        if len(block) > self.capacity:
+            # Only the newest capacity records can survive
+            self.written += len(block) - self.capacity
+            block = block[-self.capacity:]
+        position = self.written % self.capacity
+        first = min(len(block), self.capacity - position)
+        self.records[position:position + first] = block[:first]
+        self.records[:len(block) - first] = block[first:]
+        self.written += len(block)
+        self.header["written"] = self.written
+
+    def close(self):
+        """! Flush the remaining events and write the file to disk."""
+        self.flush()
+        self._memory.flush()
+        del self.header, self.records
+        self._memory = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.close()
+        return False
+
+
+class EventTrace:
+    """! Read-only view of a ring buffer file as NumPy structured arrays."""
+
+    def __init__(self, path):
+        """! Memory-map a file written by EventRecorder.
+        @param path Path of the file
+        """
+        self.path = path
+        header, records, self._memory = _map(path, "r")
+        header = header[0]
+        if header["magic"] != MAGIC or header["version"] != VERSION:
+            raise ValueError(f"{path} is not an event trace file")
+        if header["record_size"] != EVENT_DTYPE.itemsize:
+            raise ValueError(f"{path} has {header['record_size']}-byte records, expected {EVENT_DTYPE.itemsize}")
+        self.capacity = int(header["capacity"])
+        self.written = int(header["written"])
+        self.records = records[:self.capacity]
+
+    def __len__(self):
+        """! Number of events held (at most the capacity)."""
+        return min(self.written, self.capacity)
+
+    @property
+    def dropped(self):
+        """! Number of oldest events overwritten by the ring."""
+        return max(0, self.written - self.capacity)
+
+    def segments(self):
+        """! The held events in chronological order, as one or two zero-copy views of the file.
+        @return List of structured arrays; concatenated they give every held event, oldest first
+        """
+        if self.written <= self.capacity:
+            return [self.records[:self.written]]
+        position = self.written % self.capacity
+        return [self.records[position:], self.records[:position]]
+
+    def events(self):
+        """! Every held event in chronological order.
+
+        @details Zero-copy until the ring has wrapped around; after that the two segments
+        are concatenated into a new array.
+        @return Structured array of EVENT_DTYPE
+        """
+        segments = self.segments()
+        return segments[0] if len(segments) == 1 else np.concatenate(segments)
+
+    def kind_counts(self):
+        """! Number of held events of every kind.
+        @return Dict of event name to count
+        """
+        counts = np.zeros(256, dtype=np.int64)
+        for segment in self.segments():
+            counts += np.bincount(segment["kind"], minlength=256)
+        return {name: int(counts[kind]) for kind, name in EVENT_NAMES.items()}
+
+
+def match_segments(events, start_kind, end_kind):
+    """! Pair start and end events of the same station and product into time segments.
+
+    @details Events whose partner was overwritten by the ring, or has not happened yet,
+    are left out. Resupply events are paired by the product that triggered them.
+    @param events Structured array of EVENT_DTYPE in chronological order
+    @param start_kind Event kind opening a segment
+    @param end_kind Event kind closing it
+    @return Tuple of arrays (station, product_id, start, end)
+    """
+    starts = events[events["kind"] == start_kind]
+    ends = events[events["kind"] == end_kind]
+    if len(starts) == 0 or len(ends) == 0:
+        empty = starts[:0]
+        return empty["station"], empty["product_id"], empty["time"], empty["time"]
+    # Each product visits a station once, so (station, product) identifies a segment
+    start_keys = _segment_keys(starts)
+    end_keys = _segment_keys(ends)
+    order = np.argsort(end_keys, kind="stable")
+    sorted_keys = end_keys[order]
+    index = np.minimum(np.searchsorted(sorted_keys, start_keys), len(sorted_keys) - 1)
+    matched = sorted_keys[index] == start_keys
+    starts = starts[matched]
+    end_times = ends["time"][order[index[matched]]]
+    return starts["station"], starts["product_id"], starts["time"], end_times
+
+
+def _segment_keys(events):
+    """! One int64 key per event combining its station and product."""
+    return (events["station"].astype(np.int64) << 48) | (events["product_id"] & ((1 << 48) - 1))
+
+
+def timeline_entries(trace, start_time=None, end_time=None, max_segments=None, station_names=None):
+    """! Gantt segments and rejection markers of an event trace.
+    @param trace EventTrace (or structured array of events in chronological order)
+    @param start_time Keep segments ending after this time (None: from the first event)
+    @param end_time Keep segments starting before this time (None: up to the last event)
+    @param max_segments Keep only the latest segments of each kind beyond this count
+    @param station_names Names of the station rows (None: default names of the stations seen)
+    @return JSON-ready dict with station rows, columnar segments and rejection markers
+    """
+    events = trace.events() if isinstance(trace, EventTrace) else trace
+    lower = -np.inf if start_time is None else start_time
+    upper = np.inf if end_time is None else end_time
+    columns = {"kind": [], "station": [], "product_id": [], "start": [], "end": []}
+    for kind, start_kind, end_kind in TIMELINE_SEGMENTS:
+        stations, products, starts, ends = match_segments(events, start_kind, end_kind)
+        visible = (ends >= lower) & (starts <= upper)
+        stations, products, starts, ends = stations[visible], products[visible], starts[visible], ends[visible]
+        if max_segments is not None and len(starts) > max_segments:
+            latest = np.argsort(starts, kind="stable")[-max_segments:]
+            latest.sort()
+            stations, products, starts, ends = stations[latest], products[latest], starts[latest], ends[latest]
+        columns["kind"].extend([kind] * len(starts))
+        columns["station"].extend(stations.tolist())
+        columns["product_id"].extend(products.tolist())
+        columns["start"].extend(starts.tolist())
+        columns["end"].extend(ends.tolist())
+
+    rejections = events[events["kind"] == EVENT_REJECTION]
+    rejections = rejections[(rejections["time"] >= lower) & (rejections["time"] <= upper)]
+    if station_names is None:
+        num_stations = int(events["station"].max()) + 1 if len(events) else 0
+        station_names = [station_name(station) for station in range(num_stations)]
+    return {
+        "stations": list(station_names),
+        "start_time": float(events["time"][0]) if len(events) else 0.0,
+        "end_time": float(events["time"][-1]) if len(events) else 0.0,
+        "segments": columns,
+        "rejections": {"station": rejections["station"].tolist(), "product_id": rejections["product_id"].tolist(),
+                       "time": rejections["time"].tolist()},
+    }
+
+
+def export_timeline(trace_path, output_folder='./data', filename='TimelineInfo.json', start_time=None,
+                    end_time=None, max_segments=5000, station_names=None):
+    """! Write the Gantt view of an event trace for the dashboard.
+    @param trace_path Path of the ring buffer file
+    @param output_folder Output directory for JSON files
+    @param filename Output JSON filename
+    @param start_time Keep segments ending after this time
+    @param end_time Keep segments starting before this time
+    @param max_segments Keep only the latest segments of each kind beyond this count
+    @param station_names Names of the station rows, from the run's 'station_names' result entry
+    @return Path of the JSON file
+    """
+    trace = EventTrace(trace_path)
+    timeline = timeline_entries(trace, start_time, end_time, max_segments, station_names)
+    timeline["events_held"] = len(trace)
+    timeline["events_dropped"] = trace.dropped
+    os.makedirs(output_folder, exist_ok=True)
+    output_path = os.path.join(output_folder, filename)
+    with open(output_path, 'w') as f:
+        json.dump(timeline, f, separators=(",", ":"))
+    print(f"Timeline JSON file generated: {output_path}")
+    return output_path
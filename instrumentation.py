@@ -0,0 +1,131 @@
+"""! @file instrumentation.py
+    @brief Opt-in event-loop instrumentation for simulation runs.
+
+    InstrumentedEnvironment is a drop-in simpy.Environment that counts the
+    events scheduled and processed by type, samples how much wall time is spent
+    resuming each kind of process (product, station, resupply, arrival
+    generator) and records the high-water marks of the watched resource queues.
+    run_simulation only uses it when profiling is requested, so normal runs keep
+    the plain SimPy environment and pay nothing.
+
+    @author: Eduardo Ulises Martinez
+    @author: Fernanda Mena
+    @author: Brandon Avalos
+"""
+
+import json
+import time
+from collections import Counter
+import simpy
+
+# Generator function names of the facility mapped to the process kind they belong to
+PROCESS_KINDS = {
+    "process_product": "product",
+    "visit_station": "station",
+    "process_station": "station",
+    "resupply_bin": "resupply",
+    "run_production": "arrival_generator",
+}
+
+
+def _process_kind(event):
+    """! Kind of the process an event is about to resume.
+    @param event SimPy event about to be processed
+    @return Process kind name, or "other" when the event resumes no facility process
+    """
+    for callback in event.callbacks or ():
+        process = getattr(callback, "__self__", None)
+        if isinstance(process, simpy.Process):
+            # Follow yield from delegation down to the generator that will actually resume
+            generator = process._generator
+            while getattr(generator, "gi_yieldfrom", None) is not None:
+                generator = generator.gi_yieldfrom
+            return PROCESS_KINDS.get(generator.gi_code.co_name, "other")
+    return "other"
+
+
+class InstrumentedEnvironment(simpy.Environment):
+    """! SimPy environment recording event counts, per-process-kind time and queue high-water marks."""
+
+    def __init__(self, initial_time=0, sample_every=1):
+        """! Initialize the environment.
+        @param initial_time Simulation start time
+        @param sample_every Time one event out of every sample_every (1 times every event)
+        """
+        super().__init__(initial_time)
+        self.sample_every = max(1, int(sample_every))
+        self.events_scheduled = Counter()
+        self.events_processed = Counter()
+        self.process_time = Counter()
+        self.time_samples = 0
+        self.station_resources = []
+        self.supplier_resource = None
+        self.station_high_water = []
+        self.supplier_high_water = 0
+        self._steps = 0
+        self._started = time.perf_counter()
+
+    def watch(self, stations, suppliers):
+        """! Register the resources whose queue lengths are tracked.
+        @param stations List of station simpy.Resource objects
+        @param suppliers Supplier simpy.Resource
+        """
+        self.station_resources = list(stations)
+        self.supplier_resource = suppliers
+        self.station_high_water = [0] * len(self.station_resources)
+
+    def schedule(self, event, priority=simpy.core.NORMAL, delay=0):
+        """! Schedule an event, counting it by type."""
+        self.events_scheduled[type(event).__name__] += 1
+        super().schedule(event, priority, delay)
+
+    def step(self):
+        """! Process the next event, counting it and sampling the time spent on it."""
+        if not self._queue:
+            return super().step()
+        event = self._queue[0][3]
+        self.events_processed[type(event).__name__] += 1
+        self._steps += 1
+        if self._steps % self.sample_every == 0:
+            kind = _process_kind(event)
+            start = time.perf_counter()
+            super().step()
+            self.process_time[kind] += time.perf_counter() - start
+            self.time_samples += 1
+        else:
+            super().step()
+
+        for index, resource in enumerate(self.station_resources):
+            if len(resource.queue) > self.station_high_water[index]:
+                self.station_high_water[index] = len(resource.queue)
+        if self.supplier_resource is not None and len(self.supplier_resource.queue) > self.supplier_high_water:
+            self.supplier_high_water = len(self.supplier_resource.queue)
+
+    def profile(self):
+        """! JSON-serializable summary of everything recorded so far.
+        @return Dict with event counts, estimated time per process kind and queue high-water marks
+        """
+        return {
+            "wall_time_s": time.perf_counter() - self._started,
+            "events_processed_total": sum(self.events_processed.values()),
+            "events_scheduled": dict(self.events_scheduled),
+            "events_processed": dict(self.events_processed),
+            "sample_every": self.sample_every,
+            "time_samples": self.time_samples,
+            # Sampled times scaled up to an estimate for all events
+            "process_time_s": {kind: seconds * self.sample_every for kind, seconds in self.process_time.items()},
+            "queue_high_water": {
+                "stations": {str(index): high for index, high in enumerate(self.station_high_water)},
+                "suppliers": self.supplier_high_water,
+            },
+        }
+
+
+def write_profile(results, path):
+    """! Write the profile of a run to a JSON file next to its results.
+    @param results Results dict of a run made with profile=True
+    @param path Output JSON path
+    """
+    profile = dict(results["profile"], run_id=results["run_id"])
+    with open(path, "w") as f:
+        json.dump(profile, f, indent=2)
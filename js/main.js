@@ -29,6 +29,46 @@ const plantTimeFrameKeyMap = {
 
 let currentTimeFrameIndex = 0;
 
+// Datos por periodo: el servidor (dashboard_server.py) entrega solo el periodo mostrado
+const stationCache = {};
+const plantCache = {};
+let staticData = null; // Archivos completos, si no hay servidor
+
+function windowName(timeFrame) {
+  return timeFrameKeyMap[timeFrame].replace("_data", "");
+}
+
+function loadStaticData() {
+  if (!staticData) {
+    staticData = Promise.all([
+      d3.json("data/StationsInfo1.json"),
+      d3.json("data/PlantInfo.json"),
+    ]);
+  }
+  return staticData;
+}
+
+// Carga (una sola vez) los datos de un periodo y los deja en chartData/plantData
+function loadTimeFrame(timeFrame) {
+  if (stationCache[timeFrame]) {
+    chartData = stationCache[timeFrame];
+    plantData = plantCache[timeFrame];
+    return Promise.resolve();
+  }
+  const windowParam = encodeURIComponent(windowName(timeFrame));
+  return Promise.all([
+    d3.json(`api/stations?window=${windowParam}`),
+    d3.json(`api/plant?window=${windowParam}`),
+  ])
+    .catch(() => loadStaticData())
+    .then(([stations, plant]) => {
+      stationCache[timeFrame] = stations;
+      plantCache[timeFrame] = plant;
+      chartData = stations;
+      plantData = plant;
+    });
+}
+
 // Configuración de cada gráfica con nuevos tipos
 const chartsConfig = [
   {
@@ -104,6 +144,15 @@ const chartsConfig = [
   },
 ];
 
+// Nombre por defecto de una estación: A..Z, luego AA, AB, ... (como topology.station_name)
+function stationLabel(index) {
+  let letters = "";
+  for (let n = index + 1; n > 0; n = Math.floor((n - 1) / 26)) {
+    letters = String.fromCharCode(65 + ((n - 1) % 26)) + letters;
+  }
+  return `Station ${letters}`;
+}
+
 function calculateBottleneckData(timeFrame) {
   if (!plantData) return [];
   const summaryKey = plantTimeFrameKeyMap[timeFrame];
@@ -111,7 +160,7 @@ function calculateBottleneckData(timeFrame) {
 
   return Object.keys(stationMetrics)
     .map((stationId) => ({
-      name: `Station ${String.fromCharCode(65 + parseInt(stationId))}`,
+      name: stationMetrics[stationId].name || stationLabel(parseInt(stationId)),
       bottleneck: stationMetrics[stationId].avg_bottleneck_delay || 0,
     }))
     .sort((a, b) => b.bottleneck - a.bottleneck);
@@ -603,6 +652,11 @@ function initializeSecondaryChart(chartId) {
   // Limpiar cualquier gráfica existente
   d3.select(`#chart-${chartId}`).selectAll("svg").remove();
 
+  if (chartId === "timeline") {
+    renderTimeline();
+    return;
+  }
+
   // Encontrar la configuración de la gráfica
   const config = chartsConfig.find((c) => c.container === `#chart-${chartId}`);
 
@@ -869,14 +923,8 @@ function updateChart(config, timeFrame) {
 }
 
 function initializeDashboard() {
-  Promise.all([
-    d3.json("data/StationsInfo1.json"),
-    d3.json("data/PlantInfo.json"),
-  ])
-    .then(([stations, plant]) => {
-      chartData = stations;
-      plantData = plant;
-
+  loadTimeFrame(timeFrames[currentTimeFrameIndex])
+    .then(() => {
       initializeMainChartOnly();
       updateKPICards();
       showDataInsights();
@@ -945,43 +993,224 @@ function setupChartButtons() {
   });
 }
 
-document.addEventListener("DOMContentLoaded", function () {
-  Promise.all([
-    d3.json("data/StationsInfo1.json"),
-    d3.json("data/PlantInfo.json"),
-  ])
-    .then(([stations, plant]) => {
-      chartData = stations;
-      plantData = plant;
+document.addEventListener("DOMContentLoaded", initializeDashboard);
 
-      initializeMainChartOnly();
+// Línea de tiempo (Gantt) del registro de eventos: data/TimelineInfo.json,
+// generado con `python cli.py export --what timeline --event-trace ...`
+let timelineData = null;
+const timelineColors = {
+  process: "#ff69b4",
+  breakdown: "#c0392b",
+  resupply: "#f5a623",
+};
+const TIMELINE_INITIAL_SPAN = 200; // Unidades de tiempo visibles al abrir la vista
 
-      setupChartButtons();
-      updateKPICards();
-      showDataInsights();
+function loadTimelineData() {
+  if (timelineData) return Promise.resolve(timelineData);
+  return d3.json("data/TimelineInfo.json").then((data) => {
+    timelineData = data;
+    return data;
+  });
+}
 
-      const mainChart = chartsConfig.find((config) => config.isMainChart);
-      if (mainChart) {
-        updateChart(mainChart, timeFrames[currentTimeFrameIndex]);
-      }
+function renderTimeline() {
+  const container = d3.select("#chart-timeline");
+  container.selectAll("*").remove();
+
+  loadTimelineData()
+    .then((data) => {
+      const margin = { left: 80, right: 20, top: 40, bottom: 40 };
+      const width = container.node().clientWidth - margin.left - margin.right;
+      const height =
+        container.node().clientHeight - margin.top - margin.bottom;
+
+      const svg = container
+        .append("svg")
+        .attr("width", "100%")
+        .attr("height", "100%")
+        .attr(
+          "viewBox",
+          `0 0 ${width + margin.left + margin.right} ${
+            height + margin.top + margin.bottom
+          }`
+        )
+        .attr("preserveAspectRatio", "xMidYMid meet")
+        .style("background", "#fffafc");
 
-      window.addEventListener("resize", () => {
-        d3.select("#chart-production").selectAll("svg").remove();
-        initializeMainChartOnly();
-        updateChart(mainChart, timeFrames[currentTimeFrameIndex]);
-      });
+      svg
+        .append("defs")
+        .append("clipPath")
+        .attr("id", "timeline-clip")
+        .append("rect")
+        .attr("width", width)
+        .attr("height", height);
+
+      const g = svg
+        .append("g")
+        .attr("transform", `translate(${margin.left}, ${margin.top})`);
+
+      // Segmentos en formato columnar; las colas no se dibujan
+      const columns = data.segments;
+      const segments = columns.kind
+        .map((kind, i) => ({
+          kind,
+          station: columns.station[i],
+          product: columns.product_id[i],
+          start: columns.start[i],
+          end: columns.end[i],
+        }))
+        .filter((d) => d.kind in timelineColors);
+      const rejections = data.rejections.time.map((time, i) => ({
+        time,
+        station: data.rejections.station[i],
+      }));
+
+      const x = d3
+        .scaleLinear()
+        .domain([
+          Math.max(data.start_time, data.end_time - TIMELINE_INITIAL_SPAN),
+          data.end_time,
+        ])
+        .range([0, width]);
+      const y = d3
+        .scaleBand()
+        .domain(data.stations)
+        .range([0, height])
+        .padding(0.2);
+      const rowY = (d) => y(data.stations[d.station]);
+
+      const xAxis = g
+        .append("g")
+        .attr("class", "x-axis")
+        .attr("transform", `translate(0, ${height})`);
+      g.append("g")
+        .attr("class", "y-axis")
+        .call(d3.axisLeft(y))
+        .selectAll(".tick text")
+        .style("fill", "#ff69b4");
+
+      g.append("text")
+        .attr("class", "chart-title")
+        .attr("x", width / 2)
+        .attr("y", -15)
+        .style("text-anchor", "middle")
+        .style("fill", "#ff69b4")
+        .style("font-size", "18px")
+        .style("font-family", "'Poppins', cursive")
+        .text("Station Timeline (scroll to zoom, drag to pan)");
+
+      const plot = g.append("g").attr("clip-path", "url(#timeline-clip)");
+      const bars = plot
+        .selectAll("rect.segment")
+        .data(segments)
+        .enter()
+        .append("rect")
+        .attr("class", "segment")
+        .attr("fill", (d) => timelineColors[d.kind])
+        .attr("opacity", (d) => (d.kind === "process" ? 0.8 : 1));
+      // Los reabastecimientos ocupan la franja superior de la fila
+      bars
+        .attr("y", (d) => rowY(d) + (d.kind === "resupply" ? 0 : y.bandwidth() * 0.25))
+        .attr("height", (d) =>
+          d.kind === "resupply" ? y.bandwidth() * 0.2 : y.bandwidth() * 0.75
+        );
+      bars
+        .append("title")
+        .text(
+          (d) =>
+            `${d.kind} · product ${d.product} · ${d.start.toFixed(1)}–${d.end.toFixed(1)}`
+        );
+
+      const marks = plot
+        .selectAll("path.rejection")
+        .data(rejections)
+        .enter()
+        .append("path")
+        .attr("class", "rejection")
+        .attr("d", d3.symbol().type(d3.symbolCross).size(40))
+        .attr("fill", "#333");
+
+      const draw = (scale) => {
+        xAxis.call(d3.axisBottom(scale).ticks(8));
+        xAxis.selectAll("text").style("fill", "#ff69b4");
+        bars
+          .attr("x", (d) => scale(d.start))
+          .attr("width", (d) => Math.max(1, scale(d.end) - scale(d.start)));
+        marks.attr(
+          "transform",
+          (d) =>
+            `translate(${scale(d.time)}, ${
+              y(data.stations[d.station]) + y.bandwidth() / 2
+            })`
+        );
+      };
+      draw(x);
+
+      svg.call(
+        d3
+          .zoom()
+          .scaleExtent([0.01, 50])
+          .on("zoom", () => draw(d3.event.transform.rescaleX(x)))
+      );
     })
+    .catch(() => {
+      container
+        .append("p")
+        .attr("class", "text-center text-muted mt-5")
+        .text(
+          "No timeline data. Record one with: python cli.py export --event-trace traces/run{run_id}.evt --what timeline"
+        );
+    });
+}
+
+// Cambia de periodo cargando solo los datos de ese periodo
+function showTimeFrame(timeFrame) {
+  loadTimeFrame(timeFrame)
+    .then(() => updateCharts(timeFrame))
     .catch((error) => console.error("Error:", error));
-});
+}
 
 // Eventos de botones de tiempo
 document.getElementById("prev-btn").addEventListener("click", () => {
   currentTimeFrameIndex =
     (currentTimeFrameIndex - 1 + timeFrames.length) % timeFrames.length;
-  updateCharts(timeFrames[currentTimeFrameIndex]);
+  showTimeFrame(timeFrames[currentTimeFrameIndex]);
 });
 
 document.getElementById("next-btn").addEventListener("click", () => {
   currentTimeFrameIndex = (currentTimeFrameIndex + 1) % timeFrames.length;
-  updateCharts(timeFrames[currentTimeFrameIndex]);
+  showTimeFrame(timeFrames[currentTimeFrameIndex]);
 });
+
+// Modo en vivo (live_server.py): abrir el dashboard con ?live=1
+function connectLiveStream() {
+  const source = new EventSource("events");
+  const label = document.getElementById("timeframe-label");
+
+  const showSnapshot = (event) => {
+    const snapshot = JSON.parse(event.data);
+    document.getElementById("kpi-production").textContent =
+      snapshot.production.toLocaleString();
+    document.getElementById("kpi-rejection").textContent = `${(
+      snapshot.rejection_rate * 100
+    ).toFixed(1)}%`;
+    const occupancy =
+      snapshot.stations.reduce((acc, s) => acc + s.occupancy, 0) /
+      snapshot.stations.length;
+    document.getElementById("kpi-occupancy").textContent = `${(
+      occupancy * 100
+    ).toFixed(1)}%`;
+    label.textContent = `Live: run ${snapshot.run_id}, t = ${Math.round(
+      snapshot.time
+    )}`;
+  };
+
+  source.addEventListener("snapshot", showSnapshot);
+  source.addEventListener("run_end", showSnapshot);
+  source.addEventListener("done", () => source.close());
+  source.onerror = (error) => console.error("Error en el stream en vivo:", error);
+}
+
+if (new URLSearchParams(window.location.search).has("live")) {
+  document.addEventListener("DOMContentLoaded", connectLiveStream);
+}
@@ -0,0 +1,224 @@
+"""! @file live_server.py
+    @brief Live streaming of simulation snapshots to the dashboard over server-sent events.
+
+    The simulation runs in a worker thread and reports a snapshot (production,
+    rejections, per-station occupancy and queue lengths) every snapshot_interval
+    of simulated time. An asyncio server pushes the snapshots to every connected
+    browser on GET /events as server-sent events and serves the dashboard files
+    for everything else, so opening /?live=1 shows the run as it progresses.
+
+    Each client has a small bounded queue. When a client falls behind, its oldest
+    pending snapshots are dropped rather than waiting for it, so a slow client
+    never stalls the simulation or the other clients; it simply receives the
+    most recent state once it catches up.
+
+    @author: Eduardo Ulises Martinez
+    @author: Fernanda Mena
+    @author: Brandon Avalos
+"""
+
+import asyncio
+import json
+import mimetypes
+import os
+import time
+from urllib.parse import unquote, urlsplit
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8001
+CLIENT_QUEUE_SIZE = 16
+HEARTBEAT_SECONDS = 15
+
+
+class SnapshotBroadcaster:
+    """! Fan-out of snapshots to per-client bounded queues that drop the oldest entries when full."""
+
+    def __init__(self, queue_size=CLIENT_QUEUE_SIZE):
+        """! Initialize without clients.
+        @param queue_size Snapshots buffered per client before the oldest are dropped
+        """
+        self.queue_size = queue_size
+        self.clients = set()
+        self.latest = None
+        self.published = 0
+        self.dropped = 0
+        self.finished = False
+
+    def subscribe(self):
+        """! Register a client.
+        @return asyncio.Queue receiving the snapshots, primed with the latest one
+        """
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        if self.latest is not None:
+            queue.put_nowait(self.latest)
+        self.clients.add(queue)
+        return queue
+
+    def unsubscribe(self, queue):
+        """! Remove a client."""
+        self.clients.discard(queue)
+
+    def publish(self, message):
+        """! Hand an encoded message to every client without ever waiting.
+        @param message Tuple (event name, JSON data string)
+        """
+        self.latest = message
+        self.published += 1
+        for queue in self.clients:
+            if queue.full():
+                queue.get_nowait()
+                self.dropped += 1
+            queue.put_nowait(message)
+
+
+class LiveSimulation:
+    """! Runs replications in a thread and forwards their snapshots to a broadcaster."""
+
+    def __init__(self, run_ids, simulation_time, snapshot_interval=None, speed=None, **simulation_options):
+        """! Describe the replications to stream.
+        @param run_ids Iterable of run identifiers, simulated one after another
+        @param simulation_time Duration of each run
+        @param snapshot_interval Simulated time between snapshots (None: 1% of the run)
+        @param speed Simulated time units per wall-clock second (None runs as fast as possible)
+        @param simulation_options Extra keyword arguments for run_simulation
+        """
+        self.run_ids = list(run_ids)
+        self.simulation_time = simulation_time
+        self.snapshot_interval = snapshot_interval or simulation_time / 100
+        self.speed = speed
+        self.simulation_options = simulation_options
+
+    def run(self, loop, broadcaster):
+        """! Simulate every run, publishing snapshots on the event loop (called in a worker thread).
+        @param loop asyncio event loop owning the broadcaster
+        @param broadcaster SnapshotBroadcaster receiving the snapshots
+        """
+        from EUMV_FMS import run_simulation
+
+        def on_snapshot(snapshot):
+            if self.speed and not snapshot.get("final"):
+                # Pace the run so snapshot_interval of simulated time takes interval / speed seconds
+                delay = pace_start + snapshot["time"] / self.speed - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            event = "run_end" if snapshot.get("final") else "snapshot"
+            loop.call_soon_threadsafe(broadcaster.publish, (event, json.dumps(snapshot)))
+
+        for run_id in self.run_ids:
+            pace_start = time.perf_counter()
+            run_simulation(run_id, self.simulation_time, snapshot_interval=self.snapshot_interval,
+                           on_snapshot=on_snapshot, **self.simulation_options)
+        loop.call_soon_threadsafe(broadcaster.publish, ("done", json.dumps({"runs": len(self.run_ids)})))
+
+
+class LiveServer:
+    """! asyncio HTTP server streaming snapshots as server-sent events and serving the dashboard."""
+
+    def __init__(self, simulation, root=None, host=DEFAULT_HOST, port=DEFAULT_PORT, queue_size=CLIENT_QUEUE_SIZE):
+        """! Configure the server.
+        @param simulation LiveSimulation to stream
+        @param root Directory with index.html and its assets (default: this module's directory)
+        @param host Interface to listen on
+        @param port Port to listen on (0 picks a free one)
+        @param queue_size Snapshots buffered per client
+        """
+        self.simulation = simulation
+        self.root = os.path.abspath(root or os.path.dirname(os.path.abspath(__file__)))
+        self.host = host
+        self.port = port
+        self.broadcaster = SnapshotBroadcaster(queue_size)
+        self.server = None
+
+    async def handle(self, reader, writer):
+        """! Serve one HTTP connection."""
+        try:
+            request_line = await reader.readline()
+            # Skip the request headers
+            while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                pass
+            parts = request_line.decode("latin-1").split()
+            if len(parts) < 2 or parts[0] != "GET":
+                await self._send(writer, 405, "text/plain", b"Method Not Allowed")
+                return
+            path = unquote(urlsplit(parts[1]).path)
+            if path == "/events":
+                await self._stream(writer)
+            else:
+                await self._static(writer, path)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except asyncio.CancelledError:
+            # Server shutting down: end the connection quietly
+            pass
+        finally:
+            writer.close()
+
+    async def _send(self, writer, status, content_type, body):
+        """! Send a complete response."""
+        reasons = {200: "OK", 404: "Not Found", 405: "Method Not Allowed"}
+        writer.write((f"HTTP/1.1 {status} {reasons[status]}\r\nContent-Type: {content_type}\r\n"
+                      f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n").encode("latin-1") + body)
+        await writer.drain()
+
+    async def _static(self, writer, path):
+        """! Serve a dashboard file from the root directory (only the dashboard assets)."""
+        from dashboard_server import dashboard_asset_path
+        file_path = dashboard_asset_path(self.root, path)
+        if file_path is None:
+            await self._send(writer, 404, "text/plain", b"Not Found")
+            return
+        with open(file_path, "rb") as f:
+            body = f.read()
+        await self._send(writer, 200, mimetypes.guess_type(file_path)[0] or "application/octet-stream", body)
+
+    async def _stream(self, writer):
+        """! Push snapshots to one client until it disconnects."""
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nCache-Control: no-cache\r\n"
+                     b"Connection: keep-alive\r\n\r\nretry: 2000\n\n")
+        await writer.drain()
+        queue = self.broadcaster.subscribe()
+        try:
+            while True:
+                try:
+                    event, data = await asyncio.wait_for(queue.get(), HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    writer.write(b": keep-alive\n\n")
+                else:
+                    writer.write(f"event: {event}\ndata: {data}\n\n".encode("utf-8"))
+                # Only this client's coroutine waits here; publishing never does
+                await writer.drain()
+        finally:
+            self.broadcaster.unsubscribe(queue)
+
+    async def serve(self):
+        """! Start the server and the simulation, and serve until cancelled."""
+        loop = asyncio.get_running_loop()
+        self.server = await asyncio.start_server(self.handle, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        print(f"Live dashboard at http://{self.host}:{self.port}/?live=1 (events at /events)")
+        simulation = loop.run_in_executor(None, self.simulation.run, loop, self.broadcaster)
+        async with self.server:
+            await simulation
+            self.broadcaster.finished = True
+            print(f"Simulation finished: {self.broadcaster.published} messages published, "
+                  f"{self.broadcaster.dropped} dropped for slow clients")
+            await self.server.serve_forever()
+
+
+def serve_live(run_ids, simulation_time, snapshot_interval=None, speed=None, root=None, host=DEFAULT_HOST,
+               port=DEFAULT_PORT, **simulation_options):
+    """! Stream replications live until interrupted.
+    @param run_ids Iterable of run identifiers
+    @param simulation_time Duration of each run
+    @param snapshot_interval Simulated time between snapshots
+    @param speed Simulated time units per wall-clock second (None runs as fast as possible)
+    @param root Directory with index.html and its assets
+    @param host Interface to listen on
+    @param port Port to listen on
+    @param simulation_options Extra keyword arguments for run_simulation
+    """
+    simulation = LiveSimulation(run_ids, simulation_time, snapshot_interval, speed, **simulation_options)
+    try:
+        asyncio.run(LiveServer(simulation, root, host, port).serve())
+    except KeyboardInterrupt:
+        pass
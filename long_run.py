@@ -0,0 +1,255 @@
+"""! @file long_run.py
+    @brief Bounded-memory long-horizon runs with warm-up deletion and batch-means intervals.
+
+    One long run is the efficient way to estimate steady-state performance, but
+    the regular model cannot run for long: products are released every 1-2 time
+    units while a station serves one every ~4, so the queue of station 0 (and the
+    number of live product processes) grows linearly with the horizon.
+
+    The long-run mode bounds memory in three ways:
+        - Work in process is capped (CONWIP): a product is released only when fewer
+          than wip_limit products are in the line. Station 0 still never starves,
+          so the throughput of the line is unchanged, while the number of live
+          processes and queued events stays below the cap.
+        - Product traces are off; each finished product's flow time is folded
+          into a running accumulator and the product is dropped.
+        - Batch statistics are kept as one value per batch.
+
+    The cap changes the model in one respect: products wait for a WIP slot
+    before entering the line instead of queueing at station 0, so the flow time
+    of a product is mostly set by the cap. By Little's law it is about
+    wip_limit / throughput; it is reported, but flagged as depending on the cap
+    (WIP_DEPENDENT_METRICS) rather than as a steady-state estimate of the model.
+
+    Statistics gathered during the warm-up period are discarded. The rest of the
+    horizon is split into equal batches, and the batch means give Student-t
+    confidence intervals for the steady-state metrics, along with the lag-1
+    autocorrelation of the batch means to check the batches are long enough.
+
+    @author: Eduardo Ulises Martinez
+    @author: Fernanda Mena
+    @author: Brandon Avalos
+"""
+
+import time
+import numpy as np
+import simpy
+from EUMV_FMS import ManufacturingFacility, build_results
+from product_traces import TRACE_OFF
+from streaming_stats import RunningStats
+
+DEFAULT_WIP_LIMIT = 64
+DEFAULT_NUM_BATCHES = 20
+DEFAULT_WARMUP_FRACTION = 0.1
+
+# Metrics set by the WIP cap rather than by the line itself
+WIP_DEPENDENT_METRICS = ("flow_time",)
+
+
+class LongRunFacility(ManufacturingFacility):
+    """! ManufacturingFacility with a work-in-process cap, flow-time accumulator and batch statistics."""
+
+    def __init__(self, env, seed=None, facility_params=None, antithetic=False, wip_limit=DEFAULT_WIP_LIMIT):
+        """! Initialize the facility without product traces.
+        @param env SimPy environment instance
+        @param seed Seed for the facility's random streams
+        @param facility_params Dict overriding DEFAULT_FACILITY_PARAMS
+        @param antithetic Use the antithetic variates of the seed's random streams
+        @param wip_limit Maximum number of products in the line at once
+        """
+        if wip_limit < 1:
+            raise ValueError("wip_limit must be at least 1")
+        super().__init__(env, seed, TRACE_OFF, facility_params, antithetic)
+        self.wip = simpy.Resource(env, capacity=wip_limit)
+        self.wip_high_water = 0
+        self.flow_times = RunningStats(quantiles=True)
+        self.batches = []
+
+    def track_product(self, product_id, token):
+        """! Process a product, then free its WIP slot and fold its flow time into the accumulator.
+        @param product_id Unique identifier for the product
+        @param token WIP request held while the product is in the line
+        @return Generator for SimPy environment
+        """
+        start = self.env.now
+        finished = yield from self.process_product(product_id)
+        self.wip.release(token)
+        if finished:
+            self.flow_times.add(self.env.now - start)
+
+    def run_production(self, simulation_time):
+        """! Release products like ManufacturingFacility.run_production, waiting for a free WIP slot.
+        @param simulation_time Total time to simulate
+        @return Generator for SimPy environment
+        """
+        product_id = 0
+        while self.env.now < simulation_time:
+            token = self.wip.request()
+            yield token
+            if self.check_accident(simulation_time):
+                self.wip.release(token)
+                break
+
+            self.env.process(self.track_product(product_id, token))
+            product_id += 1
+            self.wip_high_water = max(self.wip_high_water, self.wip.count)
+
+            yield self.env.timeout(self.interarrival_time())
+
+    def reset_statistics(self):
+        """! Discard everything measured so far, flow times included (end of the warm-up period)."""
+        super().reset_statistics()
+        self.flow_times = RunningStats(quantiles=True)
+
+    def counters(self):
+        """! Cumulative counters the batch values are differences of."""
+        return {
+            "production": self.total_production,
+            "rejected": self.rejected_products,
+            "supplier_busy_time": self.supplier_busy_time,
+            "busy_time": [self.metrics[i].busy_time for i in range(len(self.stations))],
+            "flow_time_total": self.flow_times.total,
+            "flow_time_count": self.flow_times.count,
+        }
+
+    def observe(self, warmup, batch_length, num_batches):
+        """! Process discarding the warm-up statistics, then recording one value set per batch.
+        @param warmup Simulated time before statistics are collected
+        @param batch_length Simulated time of each batch
+        @param num_batches Number of batches
+        @return Generator for SimPy environment
+        """
+        if warmup > 0:
+            yield self.env.timeout(warmup)
+        self.reset_statistics()
+        previous = self.counters()
+        for _ in range(num_batches):
+            yield self.env.timeout(batch_length)
+            current = self.counters()
+            self.batches.append(batch_values(previous, current, batch_length))
+            previous = current
+
+
+def batch_values(previous, current, batch_length):
+    """! Metric values of one batch from the counters at its start and end.
+    @param previous Counters at the start of the batch
+    @param current Counters at the end of the batch
+    @param batch_length Simulated time of the batch
+    @return Dict of metric name to value
+    """
+    production = current["production"] - previous["production"]
+    rejected = current["rejected"] - previous["rejected"]
+    completed = current["flow_time_count"] - previous["flow_time_count"]
+    values = {
+        "throughput": production / batch_length,
+        "rejection_rate": rejected / (production + rejected) if production + rejected else 0.0,
+        "supplier_occupancy": (current["supplier_busy_time"] - previous["supplier_busy_time"]) / batch_length,
+        "flow_time": ((current["flow_time_total"] - previous["flow_time_total"]) / completed
+                      if completed else 0.0),
+    }
+    for station, (before, after) in enumerate(zip(previous["busy_time"], current["busy_time"])):
+        values[f"station{station}_occupancy"] = (after - before) / batch_length
+    return values
+
+
+def batch_means_intervals(batches, confidence=0.95):
+    """! Batch-means confidence interval of every metric.
+    @param batches List of per-batch metric dicts from batch_values
+    @param confidence Confidence level of the intervals
+    @return Dict of metric name to interval dict with the lag-1 autocorrelation of the batch means
+    """
+    intervals = {}
+    for metric in (batches[0] if batches else {}):
+        values = np.array([batch[metric] for batch in batches], dtype=float)
+        stats = RunningStats()
+        stats.add_array(values)
+        mean, half_width = stats.confidence_interval(confidence)
+        centered = values - values.mean()
+        denominator = float(np.dot(centered, centered))
+        lag1 = float(np.dot(centered[:-1], centered[1:])) / denominator if denominator > 0 else 0.0
+        intervals[metric] = {
+            "mean": mean,
+            "half_width": half_width,
+            "low": mean - half_width,
+            "high": mean + half_width,
+            "lag1_autocorrelation": lag1,
+        }
+    return intervals
+
+
+def run_long(run_id, simulation_time, warmup=None, num_batches=DEFAULT_NUM_BATCHES, wip_limit=DEFAULT_WIP_LIMIT,
+             confidence=0.95, facility_params=None, antithetic=False):
+    """! Execute one long run with warm-up deletion and batch means, in bounded memory.
+    @param run_id Identifier for the simulation run (seeds it like run_simulation)
+    @param simulation_time Total time to simulate, warm-up included
+    @param warmup Simulated time whose statistics are discarded (None: 10% of the horizon)
+    @param num_batches Number of batches the observed period is split into
+    @param wip_limit Maximum number of products in the line at once
+    @param confidence Confidence level of the batch-means intervals
+    @param facility_params Dict overriding DEFAULT_FACILITY_PARAMS
+    @param antithetic Use the antithetic variates of the run's seed
+    @return Results dict like run_simulation's, computed over the observed period only, with a
+            'long_run' entry holding the settings, flow-time summary, batches and intervals;
+            intervals of WIP_DEPENDENT_METRICS are flagged 'wip_dependent'
+    """
+    if warmup is None:
+        warmup = DEFAULT_WARMUP_FRACTION * simulation_time
+    if not 0 <= warmup < simulation_time:
+        raise ValueError("warmup must be non-negative and shorter than simulation_time")
+    if num_batches < 2:
+        raise ValueError("At least 2 batches are needed for batch-means intervals")
+    observed_time = simulation_time - warmup
+    batch_length = observed_time / num_batches
+
+    env = simpy.Environment()
+    facility = LongRunFacility(env, seed=run_id + 1000, facility_params=facility_params,
+                               antithetic=antithetic, wip_limit=wip_limit)
+    env.process(facility.run_production(simulation_time))
+    observer = env.process(facility.observe(warmup, batch_length, num_batches))
+    start = time.perf_counter()
+    # Running until the observer ends (at simulation_time) also closes the last batch
+    env.run(until=observer)
+
+    results = build_results(run_id, observed_time, facility.total_production, facility.rejected_products,
+                            facility.supplier_busy_time, facility.metrics)
+    intervals = batch_means_intervals(facility.batches, confidence)
+    for metric in WIP_DEPENDENT_METRICS:
+        if metric in intervals:
+            intervals[metric]["wip_dependent"] = True
+    results['long_run'] = {
+        "simulation_time": simulation_time,
+        "warmup": warmup,
+        "observed_time": observed_time,
+        "num_batches": len(facility.batches),
+        "batch_length": batch_length,
+        "wip_limit": wip_limit,
+        "wip_high_water": facility.wip_high_water,
+        "wall_time_s": time.perf_counter() - start,
+        "flow_time": facility.flow_times.summary(),
+        "confidence": confidence,
+        "batches": facility.batches,
+        "intervals": intervals,
+    }
+    return results
+
+
+def print_long_run(results):
+    """! Print the batch-means intervals of a long run.
+    @param results Dict returned by run_long
+    """
+    info = results['long_run']
+    print(f"\nLong run {results['run_id']}: {info['simulation_time']:g} time units "
+          f"({info['warmup']:g} warm-up), {info['num_batches']} batches of {info['batch_length']:g}, "
+          f"WIP high water {info['wip_high_water']}/{info['wip_limit']}, {info['wall_time_s']:.1f}s")
+    print(f"{info['confidence']:.0%} batch-means confidence intervals:")
+    for metric, interval in info['intervals'].items():
+        marker = "*" if interval.get("wip_dependent") else " "
+        print(f"  {metric:21s}{marker} {interval['mean']:12.5f} ± {interval['half_width']:.5f} "
+              f"(lag-1 autocorrelation {interval['lag1_autocorrelation']:+.2f})")
+    throughput = info['intervals'].get('throughput', {}).get('mean', 0.0)
+    if any(interval.get("wip_dependent") for interval in info['intervals'].values()) and throughput > 0:
+        print(f"  * Set by the WIP cap, not a steady-state estimate of the line: by Little's law "
+              f"about wip_limit / throughput = {info['wip_limit'] / throughput:.1f}")
+    # Positive correlation makes the intervals too narrow; negative only makes them conservative
+    if any(interval['lag1_autocorrelation'] > 0.2 for interval in info['intervals'].values()):
+        print("  Some batch means are positively correlated; use fewer, longer batches or a longer run.")
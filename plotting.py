@@ -1,185 +1,277 @@
-import matplotlib.pyplot as plt
-import seaborn as sns
 import numpy as np
+import gzip
+import hashlib
 import json
 import os
-from EUMV_FMS import run_all_runs
+import textwrap
+from concurrent.futures import ProcessPoolExecutor
+from EUMV_FMS import run_all_runs, _default_workers
+from result_cache import ResultCache, DEFAULT_CACHE_DIR
+from product_traces import TRACE_FULL, QUALITY_LABELS
+from windowed_metrics import STANDARD_WINDOWS, WindowedMetrics
+from results_store import ResultsStore
+from topology import station_name, station_names, workstation_id
+
+# Per-station metrics plotted by generate_visualizations
+PLOT_STATION_FIELDS = ("occupancy", "downtime", "avg_fixing_time", "avg_bottleneck_delay")
+
+# Figure file name mapped to the metric fields it is drawn from
+PLOT_FIGURES = {
+    "production_defect_rates.png": ("production", "rejected"),
+    "station_occupancy_rates.png": ("occupancy",),
+    "station_downtime.png": ("downtime",),
+    "supplier_utilization.png": ("supplier_occupancy",),
+    "average_fixing_time.png": ("avg_fixing_time",),
+    "bottleneck_delays.png": ("avg_bottleneck_delay",),
+}
+
+# Title and axis label of the per-station box plots
+STATION_PLOT_LABELS = {
+    "occupancy": ("Station Occupancy Rates", "Occupancy Rate"),
+    "downtime": ("Station Downtime", "Downtime (Units)"),
+    "avg_fixing_time": ("Average Fixing Time per Station", "Fixing Time (Units)"),
+    "avg_bottleneck_delay": ("Average Bottleneck Delay per Station", "Delay (Units)"),
+}
+
+PLOT_MANIFEST = ".plot_hashes.json"
+
+
+def gather_plot_metrics(all_results):
+    """Gather every plotted metric of every run into one structured array
+    
+    @param all_results List of simulation run results, or a ResultsStore
+    @return Structured array with one row per run; per-station fields hold one value per station
+    """
+    if not len(all_results):
+        raise ValueError("There are no simulation results to plot")
+    if isinstance(all_results, ResultsStore):
+        # Read the columns directly instead of building a dict per run
+        dtype = [('production', np.int64), ('rejected', np.int64), ('supplier_occupancy', np.float64)]
+        dtype += [(field, np.float64, (all_results.num_stations,)) for field in PLOT_STATION_FIELDS]
+        metrics = np.zeros(len(all_results), dtype=dtype)
+        for field in ('production', 'rejected', 'supplier_occupancy'):
+            metrics[field] = all_results.run_column(field)
+        for field in PLOT_STATION_FIELDS:
+            metrics[field] = all_results.station_column(field)
+        return metrics
 
-def generate_visualizations(all_results):
-    """Generate standard visualization plots of simulation results
+    num_stations = len(all_results[0]['stations'])
+    dtype = [('production', np.int64), ('rejected', np.int64), ('supplier_occupancy', np.float64)]
+    dtype += [(field, np.float64, (num_stations,)) for field in PLOT_STATION_FIELDS]
+    metrics = np.zeros(len(all_results), dtype=dtype)
+    for row, result in enumerate(all_results):
+        metrics['production'][row] = result['production']
+        metrics['rejected'][row] = result['rejected']
+        metrics['supplier_occupancy'][row] = result['supplier_occupancy']
+        for field in PLOT_STATION_FIELDS:
+            metrics[field][row] = [result['stations'][station][field] for station in range(num_stations)]
+    return metrics
+
+
+def _figure_hash(name, data, fast):
+    """Hash of everything a figure is drawn from
     
-    @param all_results List of simulation run results
+    @param name Figure file name
+    @param data Dict of field name to array
+    @param fast Whether the figure is drawn in fast mode
+    @return Hex digest
     """
-    sns.set_theme(style="whitegrid")
-    os.makedirs("plots", exist_ok=True)
-
-    productions = [result['production'] for result in all_results]
-    rejections = [result['rejected'] for result in all_results]
-    defect_rates = [rej / (prod + rej) if (prod + rej) > 0 else 0 for prod, rej in zip(productions, rejections)]
-    supplier_occs = [result['supplier_occupancy'] for result in all_results]
-
-    # Plot 1: Production and Defect Rates
-    plt.figure(figsize=(14, 6))
-    plt.subplot(1, 2, 1)
-    sns.boxplot(x=productions)
-    plt.title('Production per Run')
-    plt.xlabel('Total Production')
-
-    plt.subplot(1, 2, 2)
-    sns.boxplot(x=defect_rates)
-    plt.title('Defect Rate per Run')
-    plt.xlabel('Defect Rate')
-    plt.tight_layout()
-    plt.savefig('plots/production_defect_rates.png')
-    plt.close()
+    digest = hashlib.sha256(f"{name}:{fast}".encode("utf-8"))
+    for field in sorted(data):
+        array = np.ascontiguousarray(data[field])
+        digest.update(field.encode("utf-8"))
+        digest.update(str(array.shape).encode("utf-8"))
+        digest.update(array.tobytes())
+    return digest.hexdigest()
 
-    # Plot 2: Station Occupancy Rates
-    occupancy_data = []
-    for station in range(6):
-        occupancies = [result['stations'][station]['occupancy'] for result in all_results]
-        occupancy_data.append(occupancies)
-
-    plt.figure(figsize=(14, 8))
-    sns.boxplot(data=occupancy_data)
-    plt.xticks(range(6), [f'Station {i}' for i in range(6)])
-    plt.title('Station Occupancy Rates')
-    plt.ylabel('Occupancy Rate')
-    plt.savefig('plots/station_occupancy_rates.png')
-    plt.close()
 
-    # Plot 3: Station Downtime
-    downtime_data = []
-    for station in range(6):
-        downtimes = [result['stations'][station]['downtime'] for result in all_results]
-        downtime_data.append(downtimes)
-
-    plt.figure(figsize=(14, 8))
-    sns.boxplot(data=downtime_data)
-    plt.xticks(range(6), [f'Station {i}' for i in range(6)])
-    plt.title('Station Downtime')
-    plt.ylabel('Downtime (Units)')
-    plt.savefig('plots/station_downtime.png')
-    plt.close()
+def _boxplot(plt, sns, values, fast, horizontal=False):
+    """Draw a box plot on the current axes with seaborn, or plain matplotlib in fast mode
+    
+    @param plt matplotlib.pyplot module
+    @param sns seaborn module, or None in fast mode
+    @param values 1-D array (one box) or 2-D array with one column per box
+    @param fast Whether to use plain matplotlib
+    @param horizontal Draw a single horizontal box
+    """
+    if fast:
+        plt.boxplot(values, vert=not horizontal)
+    elif horizontal:
+        sns.boxplot(x=values)
+    else:
+        sns.boxplot(data=[values[:, column] for column in range(values.shape[1])])
 
-    # Plot 4: Supplier Utilization
-    plt.figure(figsize=(8, 6))
-    sns.boxplot(x=supplier_occs)
-    plt.title('Supplier Utilization Rate')
-    plt.xlabel('Utilization Rate')
-    plt.savefig('plots/supplier_utilization.png')
-    plt.close()
 
-    # Plot 5: Average Fixing Time per Station
-    fixing_data = []
-    for station in range(6):
-        fixes = [result['stations'][station]['avg_fixing_time'] for result in all_results]
-        fixing_data.append(fixes)
-
-    plt.figure(figsize=(14, 8))
-    sns.boxplot(data=fixing_data)
-    plt.xticks(range(6), [f'Station {i}' for i in range(6)])
-    plt.title('Average Fixing Time per Station')
-    plt.ylabel('Fixing Time (Units)')
-    plt.savefig('plots/average_fixing_time.png')
+def render_figure(name, data, path, fast=False, headless=False):
+    """Render one figure of generate_visualizations to a PNG file
+    
+    @details Importing matplotlib here keeps it out of processes that never plot and lets
+    worker processes select the headless Agg backend before pyplot is loaded.
+    @param name Figure file name, a key of PLOT_FIGURES
+    @param data Dict of field name to array for the fields the figure uses; per-station
+                figures also get the tick labels as 'station_names'
+    @param path Output PNG path
+    @param fast Use the Agg backend, plain matplotlib box plots and a lower resolution
+    @param headless Use the Agg backend (implied by fast)
+    @return Path of the written file
+    """
+    import matplotlib
+    if fast or headless:
+        matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    sns = None
+    if not fast:
+        import seaborn as sns
+        sns.set_theme(style="whitegrid")
+    dpi = 72 if fast else None
+
+    if name == "production_defect_rates.png":
+        productions = data['production']
+        totals = productions + data['rejected']
+        defect_rates = np.divide(data['rejected'], totals, out=np.zeros(len(totals)), where=totals > 0)
+        plt.figure(figsize=(14, 6))
+        plt.subplot(1, 2, 1)
+        _boxplot(plt, sns, productions, fast, horizontal=True)
+        plt.title('Production per Run')
+        plt.xlabel('Total Production')
+
+        plt.subplot(1, 2, 2)
+        _boxplot(plt, sns, defect_rates, fast, horizontal=True)
+        plt.title('Defect Rate per Run')
+        plt.xlabel('Defect Rate')
+        plt.tight_layout()
+    elif name == "supplier_utilization.png":
+        plt.figure(figsize=(8, 6))
+        _boxplot(plt, sns, data['supplier_occupancy'], fast, horizontal=True)
+        plt.title('Supplier Utilization Rate')
+        plt.xlabel('Utilization Rate')
+    else:
+        field, = PLOT_FIGURES[name]
+        values = data[field]
+        num_stations = values.shape[1]
+        title, ylabel = STATION_PLOT_LABELS[field]
+        # Long lines get a wider figure and vertical labels
+        plt.figure(figsize=(max(14, 0.35 * num_stations), 8))
+        _boxplot(plt, sns, values, fast)
+        # matplotlib numbers its boxes from 1, seaborn from 0
+        positions = range(1, num_stations + 1) if fast else range(num_stations)
+        labels = data.get('station_names')
+        labels = list(labels) if labels is not None else [station_name(i) for i in range(num_stations)]
+        plt.xticks(positions, labels, rotation=90 if num_stations > 20 else 0)
+        plt.title(title)
+        plt.ylabel(ylabel)
+    plt.savefig(path, dpi=dpi)
     plt.close()
+    return path
 
-    # Plot 6: Bottleneck Delays
-    bottleneck_data = []
-    for station in range(6):
-        delays = [result['stations'][station]['avg_bottleneck_delay'] for result in all_results]
-        bottleneck_data.append(delays)
-
-    plt.figure(figsize=(14, 8))
-    sns.boxplot(data=bottleneck_data)
-    plt.xticks(range(6), [f'Station {i}' for i in range(6)])
-    plt.title('Average Bottleneck Delay per Station')
-    plt.ylabel('Delay (Units)')
-    plt.savefig('plots/bottleneck_delays.png')
-    plt.close()
+
+def generate_visualizations(all_results, output_dir='plots', workers=None, fast=False, force=False):
+    """Generate standard visualization plots of simulation results
+    
+    @details The plotted metrics are gathered once into a structured array. A figure is
+    only redrawn when the hash of its input data differs from the one recorded in the
+    output directory manifest (or its PNG is missing); the remaining figures are
+    rendered in parallel worker processes.
+    @param all_results List of simulation run results or a ResultsStore
+    @param output_dir Directory where the PNG files are written
+    @param workers Number of rendering processes (None uses one per core, 1 renders in-process)
+    @param fast Headless fast mode: Agg backend, plain matplotlib box plots, lower resolution
+    @param force Redraw every figure even if its input is unchanged
+    @return List of figure paths that were redrawn
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    metrics = gather_plot_metrics(all_results)
+    # Part of the hashed data, so renaming stations redraws their figures
+    names = np.array(station_names(all_results), dtype=str)
+
+    manifest_path = os.path.join(output_dir, PLOT_MANIFEST)
+    try:
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        manifest = {}
+
+    pending = []
+    for name, fields in PLOT_FIGURES.items():
+        data = {field: metrics[field] for field in fields}
+        if fields[0] in PLOT_STATION_FIELDS:
+            data['station_names'] = names
+        digest = _figure_hash(name, data, fast)
+        path = os.path.join(output_dir, name)
+        if not force and manifest.get(name) == digest and os.path.exists(path):
+            continue
+        pending.append((name, data, path, digest))
+
+    workers = min(_default_workers(workers), len(pending))
+    if workers <= 1:
+        for name, data, path, _ in pending:
+            render_figure(name, data, path, fast)
+    else:
+        # Workers never show windows, so they always draw with the headless backend
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(render_figure, name, data, path, fast, True)
+                       for name, data, path, _ in pending]
+            for future in futures:
+                future.result()
+
+    for name, _, _, digest in pending:
+        manifest[name] = digest
+    with open(manifest_path, "w") as f:
+        json.dump(manifest, f, indent=2)
+
+    print(f"Visualization plots generated in the '{output_dir}' directory "
+          f"({len(pending)} redrawn, {len(PLOT_FIGURES) - len(pending)} unchanged)")
+    return [path for _, _, path, _ in pending]
+
+
+def build_station_entries(aggregates, windows=STANDARD_WINDOWS, stations=None):
+    """Build the StationsInfo.json entries of some stations and windows
+    
+    @param aggregates WindowedMetrics of the results
+    @param windows Dict of window name to number of leading days or (start, end) day range;
+                   each window is added as "{name}_data"
+    @param stations Station indices to include (None for all)
+    @return List of station entry dicts
+    """
+    if stations is None:
+        stations = range(aggregates.num_stations)
+    stations_data = []
+    for i in stations:
+        station_info = {
+            "workstation_id": workstation_id(i),
+            "name": aggregates.station_names[i],
+        }
+        for name, spec in windows.items():
+            station_info[f"{name}_data"] = aggregates.station_block(i, spec)
+        stations_data.append(station_info)
+    return stations_data
+
+
+def build_plant_entries(aggregates, windows=STANDARD_WINDOWS):
+    """Build the PlantInfo.json summaries of some windows
     
-    print("Visualization plots generated in the 'plots' directory")
+    @param aggregates WindowedMetrics of the results
+    @param windows Dict of window name to number of leading days or (start, end) day range;
+                   each window is added as "{name}_summary"
+    @return Dict of summary key to plant summary
+    """
+    return {f"{name}_summary": aggregates.plant_summary(spec) for name, spec in windows.items()}
 
 
-def generate_station_json(all_results, output_folder='./data', filename='StationsInfo.json'):
+def generate_station_json(all_results, output_folder='./data', filename='StationsInfo.json',
+                          windows=STANDARD_WINDOWS, aggregates=None):
     """Generate station-level JSON data for dashboard
     
-    @param all_results List of simulation run results
+    @param all_results List of simulation run results or a ResultsStore
     @param output_folder Output directory for JSON files
     @param filename Output JSON filename
+    @param windows Dict of window name to number of leading days or (start, end) day range;
+                   each window is written as "{name}_data"
+    @param aggregates Optional WindowedMetrics already built from all_results
     """
-    import os
-    import json
-    
     os.makedirs(output_folder, exist_ok=True)
-
-    num_stations = len(all_results[0]['stations'])
-    station_ids = [f"WS-{111 + i * 111}" for i in range(num_stations)]
-    station_names = [f"Station {chr(65 + i)}" for i in range(num_stations)]
-
-    # Initialize station data structure
-    stations_data = []
-
-    for i in range(num_stations):
-        # Get metrics for this station from all runs
-        daily_metrics = [result['stations'][i] for result in all_results]
-
-        def compute_block(day_start, day_end):
-            """Compute aggregated metrics for a time period
-            
-            @param day_start Start day index
-            @param day_end End day index
-            @return Dict of aggregated metrics
-            """
-            block = daily_metrics[day_start:day_end]
-            if not block:  # Handle empty block case
-                return {
-                    "production": 0,
-                    "occupancy_hours": 0,
-                    "avg_production_time_min": 0,
-                    "rejected_units": 0,
-                    "rejection_percentage": 0.0,
-                    "avg_delay_minutes": 0,
-                    "accidents": 0
-                }
-                
-            # Fixed lines to correctly access good_products and rejected_products
-            production = sum(day["good_products"] for day in block)
-            rejected = sum(day["rejected_products"] for day in block)
-            occupancy = sum(day.get("occupancy", 0) * 24 for day in block)
-            accidents = sum(day.get("accidents", 0) for day in block)
-            delay = sum(day.get("downtime", 0) or 0 for day in block)
-            
-            # Avoid division by zero
-            count = len(block)
-            avg_fixing_time = sum(day.get("avg_fixing_time", 0) for day in block)
-            
-            rejection_pct = 0.0
-            if production + rejected > 0:
-                rejection_pct = round(rejected / (production + rejected) * 100, 1)
-
-            return {
-                "production": int(production),
-                "occupancy_hours": int(occupancy),
-                "avg_production_time_min": int(avg_fixing_time / count) if count else 0,
-                "rejected_units": int(rejected),
-                "rejection_percentage": rejection_pct,
-                "avg_delay_minutes": int(delay / count) if count else 0,
-                "accidents": int(accidents)
-            }
-
-        # Limit to available data length
-        available_days = len(daily_metrics)
-        station_info = {
-            "workstation_id": station_ids[i],
-            "name": station_names[i],
-            "daily_data": compute_block(0, min(1, available_days)),
-            "weekly_data": compute_block(0, min(7, available_days)),
-            "monthly_data": compute_block(0, min(30, available_days)),
-            "quarterly_data": compute_block(0, min(90, available_days)),
-            "yearly_data": compute_block(0, min(365, available_days))
-        }
-
-        stations_data.append(station_info)
+    aggregates = aggregates or WindowedMetrics(all_results)
+    stations_data = build_station_entries(aggregates, windows)
 
     output_path = os.path.join(output_folder, filename)
     with open(output_path, 'w') as f:
@@ -188,77 +280,198 @@ def generate_station_json(all_results, output_folder='./data', filename='Station
     print(f"Station JSON file generated: {output_path}")
 
 
-def generate_product_json(all_results, output_folder='./data', filename='ProductsInfo.json'):
+def iter_product_entries(run):
+    """Yield the dashboard entries of every completed product in one run
+    
+    @param run Single simulation run result
+    @return Generator of product entry dicts, in product order
+    """
+    traces = run.get('products')
+    if traces is None:  # Product tracing was off for this run
+        return
+    run_id = run.get('run_id', 0)
+    products = traces.product_columns()
+    full = traces.level == TRACE_FULL
+    names = run.get('station_names')
+    if full:
+        visits = traces.visit_columns()
+        visit_order, visit_offsets = traces.visits_by_product()
+        visit_order = visit_order.tolist()
+        visit_offsets = visit_offsets.tolist()
+        visit_stations = visits["station_id"].tolist()
+        visit_waits = visits["wait_time"].tolist()
+        visit_processes = visits["process_time"].tolist()
+
+    product_ids = products["product_id"].tolist()
+    start_times = products["start_time"].tolist()
+    end_times = products["end_time"].tolist()
+    wait_times = products["wait_time"].tolist()
+    process_times = products["process_time"].tolist()
+    qualities = products["quality"].tolist()
+
+    # Filter out incomplete product data
+    for row in np.flatnonzero(~np.isnan(products["end_time"])).tolist():
+        product_entry = {
+            "product_id": f"{run_id}-{product_ids[row]}",
+            "run_id": run_id,
+            "cycle_time": end_times[row] - start_times[row],
+            "wait_time": wait_times[row],
+            "process_time": process_times[row],
+            "quality": QUALITY_LABELS[qualities[row]],
+            "stations_data": []
+        }
+
+        # Add station visit data
+        if full:
+            for visit in visit_order[visit_offsets[row]:visit_offsets[row + 1]]:
+                station_id = visit_stations[visit]
+                product_entry["stations_data"].append({
+                    "station_id": workstation_id(station_id),
+                    "station_name": names[station_id] if names else station_name(station_id),
+                    "wait_time": visit_waits[visit],
+                    "process_time": visit_processes[visit]
+                })
+
+        yield product_entry
+
+
+def generate_product_json(all_results, output_folder='./data', filename='ProductsInfo.json', indent=2):
     """Generate product-level JSON data for dashboard
     
-    @param all_results List of simulation run results
+    The JSON array is written one product at a time, so memory does not grow with
+    the number of products exported.
+    
+    @param all_results List of simulation run results or a ResultsStore
     @param output_folder Output directory for JSON files
     @param filename Output JSON filename
+    @param indent Indentation of the JSON output (None writes it compactly)
     """
     os.makedirs(output_folder, exist_ok=True)
     
-    # Extract product-level data
-    product_data = []
-    for run in all_results:
-        if 'products' in run:  # Check if products key exists
-            run_id = run.get('run_id', 0)
-            for product_id, metrics in run['products'].items():
-                # Convert product_id to string if it's not already
-                product_id_str = str(product_id)
-                
-                # Filter out incomplete product data
-                if metrics.get("end_time") is None:
-                    continue
-                    
-                # Create product entry with basic metrics
-                product_entry = {
-                    "product_id": f"{run_id}-{product_id_str}",
-                    "run_id": run_id,
-                    "cycle_time": metrics["end_time"] - metrics["start_time"],
-                    "wait_time": metrics["total_wait_time"],
-                    "process_time": metrics["total_process_time"],
-                    "quality": metrics["quality"],
-                    "stations_data": []
-                }
-                
-                # Add station visit data
-                for visit in metrics.get("stations_visit", []):
-                    station_id = visit.get("station_id", 0)
-                    product_entry["stations_data"].append({
-                        "station_id": f"WS-{111 + station_id * 111}",
-                        "station_name": f"Station {chr(65 + station_id)}",
-                        "wait_time": visit.get("wait_time", 0),
-                        "process_time": visit.get("process_time", 0)
-                    })
-                
-                product_data.append(product_entry)
-    
     output_path = os.path.join(output_folder, filename)
     with open(output_path, 'w') as f:
-        json.dump(product_data, f, indent=2)
+        f.write("[")
+        first = True
+        for run in all_results:
+            for product_entry in iter_product_entries(run):
+                f.write("\n" if first else ",\n")
+                first = False
+                entry_json = json.dumps(product_entry, indent=indent)
+                if indent is not None:
+                    entry_json = textwrap.indent(entry_json, " " * indent)
+                f.write(entry_json)
+        f.write("]" if first else "\n]")
     
     print(f"Product JSON file generated: {output_path}")
 
 
-def generate_plant_json(all_results, output_folder='./data', filename='PlantInfo.json'):
+def _remove_stale_shards(output_folder, basename, current_files):
+    """Delete shards of an earlier export that the new manifest no longer lists
+    
+    @param output_folder Folder holding the shards
+    @param basename Prefix of shard filenames
+    @param current_files Filenames of the shards just written
+    """
+    prefix = f"{basename}-"
+    for filename in os.listdir(output_folder):
+        if filename in current_files or not filename.startswith(prefix):
+            continue
+        index, dot, extension = filename[len(prefix):].partition(".")
+        if len(index) == 5 and index.isdigit() and dot + extension in (".ndjson", ".ndjson.gz"):
+            os.remove(os.path.join(output_folder, filename))
+
+
+def stream_product_json(all_results, output_folder='./data', basename='ProductsInfo', compress=False,
+                        shard_by='run', products_per_shard=100000):
+    """Export product-level data as newline-delimited JSON shards plus a manifest
+    
+    Each line of a shard is one product entry, in the same format used by
+    generate_product_json. Shards are written incrementally, so export time and
+    memory scale with a single shard. The manifest ({basename}.manifest.json)
+    lists every shard with the run_ids and number of products it covers; shards
+    left in the folder by an earlier export with the same basename are deleted.
+    
+    @param all_results Iterable of simulation run results or a ResultsStore
+    @param output_folder Output directory for the shards and manifest
+    @param basename Prefix of shard and manifest filenames
+    @param compress Gzip-compress the shards
+    @param shard_by 'run' for one shard per run, 'products' for products_per_shard products
+                    per shard, or None for a single shard
+    @param products_per_shard Maximum products per shard when shard_by is 'products'
+    @return Path of the manifest file
+    """
+    if shard_by not in ('run', 'products', None):
+        raise ValueError(f"Unknown shard_by value: {shard_by}")
+    os.makedirs(output_folder, exist_ok=True)
+    extension = ".ndjson.gz" if compress else ".ndjson"
+    shards = []
+    shard_file = None
+
+    def open_shard():
+        """Start a new shard file and register it in the manifest
+        
+        @return Open text file handle for the shard
+        """
+        filename = f"{basename}-{len(shards):05d}{extension}"
+        path = os.path.join(output_folder, filename)
+        shards.append({"file": filename, "run_ids": [], "products": 0})
+        if compress:
+            return gzip.open(path, 'wt', encoding='utf-8')
+        return open(path, 'w', encoding='utf-8')
+
+    try:
+        for run in all_results:
+            if shard_by == 'run' and shard_file is not None:
+                shard_file.close()
+                shard_file = None
+            run_id = run.get('run_id', 0)
+            for product_entry in iter_product_entries(run):
+                if shard_file is None or (shard_by == 'products' and shards[-1]["products"] >= products_per_shard):
+                    if shard_file is not None:
+                        shard_file.close()
+                    shard_file = open_shard()
+                shard = shards[-1]
+                if not shard["run_ids"] or shard["run_ids"][-1] != run_id:
+                    shard["run_ids"].append(run_id)
+                shard["products"] += 1
+                shard_file.write(json.dumps(product_entry, separators=(',', ':')))
+                shard_file.write("\n")
+    finally:
+        if shard_file is not None:
+            shard_file.close()
+
+    manifest = {
+        "format": "ndjson",
+        "compression": "gzip" if compress else None,
+        "shard_by": shard_by,
+        "total_products": sum(shard["products"] for shard in shards),
+        "shards": shards
+    }
+    manifest_path = os.path.join(output_folder, f"{basename}.manifest.json")
+    with open(manifest_path, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    _remove_stale_shards(output_folder, basename, {shard["file"] for shard in shards})
+
+    print(f"Product NDJSON export generated: {manifest_path} ({len(shards)} shard(s))")
+    return manifest_path
+
+
+def generate_plant_json(all_results, output_folder='./data', filename='PlantInfo.json',
+                        windows=STANDARD_WINDOWS, aggregates=None):
     """Generate plant-level JSON data for dashboard
     
-    @param all_results List of simulation run results
+    @param all_results List of simulation run results or a ResultsStore
     @param output_folder Output directory for JSON files
     @param filename Output JSON filename
+    @param windows Dict of window name to number of leading days or (start, end) day range;
+                   each window is written as "{name}_summary"
+    @param aggregates Optional WindowedMetrics already built from all_results
     """
     os.makedirs(output_folder, exist_ok=True)
-    
-    available_days = len(all_results)
+    aggregates = aggregates or WindowedMetrics(all_results)
     
     # Generate plant-level summary data
-    plant_data = {
-        "daily_summary": generate_plant_summary(all_results, min(1, available_days)),
-        "weekly_summary": generate_plant_summary(all_results, min(7, available_days)),
-        "monthly_summary": generate_plant_summary(all_results, min(30, available_days)),
-        "quarterly_summary": generate_plant_summary(all_results, min(90, available_days)),
-        "yearly_summary": generate_plant_summary(all_results, min(365, available_days))
-    }
+    plant_data = build_plant_entries(aggregates, windows)
     
     output_path = os.path.join(output_folder, filename)
     with open(output_path, 'w') as f:
@@ -270,84 +483,50 @@ def generate_plant_json(all_results, output_folder='./data', filename='PlantInfo
 def generate_plant_summary(all_results, days):
     """Generate plant-level summary for specified number of days
     
-    @param all_results List of simulation run results
+    @param all_results List of simulation run results or a ResultsStore
     @param days Number of days to include in summary
     @return Dict with plant-level summary metrics
     """
-    if days <= 0 or not all_results:
-        return {
-            "total_production": 0,
-            "total_rejected": 0,
-            "rejection_rate": 0,
-            "supplier_utilization": 0,
-            "station_metrics": {str(i): {"avg_occupancy": 0, "avg_downtime": 0, "avg_bottleneck_delay": 0} for i in range(6)}
-        }
-    
-    results_subset = all_results[:days]
-    
-    # Calculate aggregated metrics
-    total_production = sum(r.get('production', 0) for r in results_subset)
-    total_rejected = sum(r.get('rejected', 0) for r in results_subset)
-    
-    rejection_rate = 0
-    if total_production + total_rejected > 0:
-        rejection_rate = total_rejected / (total_production + total_rejected)
-    
-    supplier_utilization = 0
-    if results_subset:
-        supplier_utilization = sum(r.get('supplier_occupancy', 0) for r in results_subset) / len(results_subset)
-    
-    # Build station metrics
-    station_metrics = {}
-    for i in range(6):
-        station_metrics[str(i)] = {
-            "avg_occupancy": 0,
-            "avg_downtime": 0,
-            "avg_bottleneck_delay": 0
-        }
-        
-        if results_subset:
-            station_metrics[str(i)]["avg_occupancy"] = sum(r.get('stations', {}).get(i, {}).get('occupancy', 0) for r in results_subset) / len(results_subset)
-            station_metrics[str(i)]["avg_downtime"] = sum(r.get('stations', {}).get(i, {}).get('downtime', 0) for r in results_subset) / len(results_subset)
-            station_metrics[str(i)]["avg_bottleneck_delay"] = sum(r.get('stations', {}).get(i, {}).get('avg_bottleneck_delay', 0) for r in results_subset) / len(results_subset)
-    
-    return {
-        "total_production": total_production,
-        "total_rejected": total_rejected,
-        "rejection_rate": rejection_rate,
-        "supplier_utilization": supplier_utilization,
-        "station_metrics": station_metrics
-    }
+    return WindowedMetrics(all_results).plant_summary(days)
 
 
 def generate_complete_json(all_results, output_folder='./data'):
     """Generate all JSON files needed for the dashboard
     
-    @param all_results List of simulation run results
+    @param all_results List of simulation run results or a ResultsStore
     @param output_folder Output directory for JSON files
     """
     os.makedirs(output_folder, exist_ok=True)
     
-    # Generate all three JSON files
-    generate_station_json(all_results, output_folder)
+    # Generate all three JSON files, aggregating the station and plant windows once
+    aggregates = WindowedMetrics(all_results)
+    generate_station_json(all_results, output_folder, aggregates=aggregates)
     generate_product_json(all_results, output_folder)
-    generate_plant_json(all_results, output_folder)
+    generate_plant_json(all_results, output_folder, aggregates=aggregates)
     
     print(f"All JSON files generated in: {output_folder}")
 
 
-def run_complete_pipeline(num_runs=365, simulation_time=5000, output_folder='./data'):
+def run_complete_pipeline(num_runs=365, simulation_time=5000, output_folder='./data', workers=None,
+                          cache_dir=DEFAULT_CACHE_DIR, plots_dir='plots', fast_plots=False):
     """Run complete pipeline: simulation, data processing, and JSON generation
     
     @param num_runs Number of simulation runs to execute
     @param simulation_time Duration of each simulation run
     @param output_folder Output directory for JSON files
+    @param workers Number of simulation worker processes (None uses every core)
+    @param cache_dir Directory of the simulation result cache (None disables caching)
+    @param plots_dir Directory of the PNG plots
+    @param fast_plots Render the plots in headless fast mode
     """
+    cache = ResultCache(cache_dir) if cache_dir is not None else None
+    
     print("Running manufacturing simulation...")
-    simulation_results = run_all_runs(num_runs=num_runs, simulation_time=simulation_time)
+    simulation_results = run_all_runs(num_runs=num_runs, simulation_time=simulation_time,
+                                      workers=workers, progress=True, cache=cache)
     
     print("Generating visualization files...")
-    generate_visualizations(simulation_results)
+    generate_visualizations(simulation_results, plots_dir, workers=workers, fast=fast_plots)
     
     print("Generating dashboard data files...")
     generate_complete_json(simulation_results, output_folder)
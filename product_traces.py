@@ -0,0 +1,328 @@
+"""! @file product_traces.py
+    @brief Columnar, array-backed storage for per-product simulation traces.
+
+    Products are stored as one row per product in growable NumPy columns, and
+    station visits as a flat table whose rows point back at their product row.
+    This replaces the dict-per-product layout and keeps trace memory to a few
+    dozen bytes per product and per visit.
+
+    For long runs, SampledTraceStore keeps a fixed-size reservoir sample of the
+    finished products of each quality instead of every product, together with
+    exact counts and running distributions of their cycle, wait and process
+    times, so trace memory and the product export stay constant in the horizon.
+
+    @author: Eduardo Ulises Martinez
+    @author: Fernanda Mena
+    @author: Brandon Avalos
+"""
+
+import numpy as np
+from streaming_stats import RunningStats
+
+TRACE_OFF = "off"
+TRACE_SUMMARY = "summary"
+TRACE_FULL = "full"
+TRACE_LEVELS = (TRACE_OFF, TRACE_SUMMARY, TRACE_FULL)
+
+QUALITY_UNKNOWN = 0
+QUALITY_GOOD = 1
+QUALITY_REJECTED = 2
+QUALITY_LABELS = ("unknown", "good", "rejected")
+
+PRODUCT_COLUMNS = {
+    "product_id": np.int64,
+    "start_time": np.float64,
+    "end_time": np.float64,
+    "wait_time": np.float64,
+    "process_time": np.float64,
+    "quality": np.int8,
+}
+
+VISIT_COLUMNS = {
+    "product_row": np.int32,
+    "station_id": np.int16,
+    "entry_time": np.float64,
+    "exit_time": np.float64,
+    "wait_time": np.float64,
+    "process_time": np.float64,
+}
+
+
+def _grow(columns, capacity):
+    """! Reallocate every column of a table to a new capacity, keeping its contents.
+    @param columns Dict of column name to NumPy array
+    @param capacity New number of rows
+    @return Dict of resized arrays
+    """
+    grown = {}
+    for name, column in columns.items():
+        new_column = np.empty(capacity, dtype=column.dtype)
+        new_column[:len(column)] = column
+        grown[name] = new_column
+    return grown
+
+
+class ProductTraceStore:
+    """! Columnar store of product traces for a single simulation run.
+
+    @details With level "summary" only the product table is kept; with level "full"
+    every station visit is recorded as well. Product rows end with end_time set to
+    NaN until the product leaves the line, either finished or rejected.
+    """
+    def __init__(self, level=TRACE_FULL, capacity=1024):
+        """! Initialize an empty store.
+        @param level Tracing level, "summary" or "full"
+        @param capacity Initial number of product rows to preallocate
+        """
+        if level not in (TRACE_SUMMARY, TRACE_FULL):
+            raise ValueError(f"Unsupported trace level for a store: {level}")
+        self.level = level
+        self.num_products = 0
+        self.num_visits = 0
+        self.products = {name: np.empty(capacity, dtype=dtype)
+                         for name, dtype in PRODUCT_COLUMNS.items()}
+        visit_capacity = capacity * 6 if level == TRACE_FULL else 0
+        self.visits = {name: np.empty(visit_capacity, dtype=dtype)
+                       for name, dtype in VISIT_COLUMNS.items()}
+
+    def __len__(self):
+        """! Number of products recorded."""
+        return self.num_products
+
+    def add_product(self, product_id, start_time):
+        """! Register a product entering the line.
+        @param product_id Identifier of the product within the run
+        @param start_time Simulation time at which the product was created
+        @return Row index of the product in the store
+        """
+        row = self.num_products
+        if row == len(self.products["start_time"]):
+            self.products = _grow(self.products, max(2 * row, 16))
+        products = self.products
+        products["product_id"][row] = product_id
+        products["start_time"][row] = start_time
+        products["end_time"][row] = np.nan
+        products["wait_time"][row] = 0.0
+        products["process_time"][row] = 0.0
+        products["quality"][row] = QUALITY_UNKNOWN
+        self.num_products = row + 1
+        return row
+
+    def add_visit(self, row, station_id, entry_time, exit_time, wait_time, process_time):
+        """! Record a completed station visit of a product.
+        @param row Row index returned by add_product
+        @param station_id Index of the station visited
+        @param entry_time Time the product arrived at the station (before resupply)
+        @param exit_time Time the product left the station
+        @param wait_time Time spent queueing for the station
+        @param process_time Time spent at the station, including breakdowns
+        """
+        self.products["process_time"][row] += process_time
+        if self.level != TRACE_FULL:
+            return
+        index = self.num_visits
+        if index == len(self.visits["entry_time"]):
+            self.visits = _grow(self.visits, max(2 * index, 64))
+        visits = self.visits
+        visits["product_row"][index] = row
+        visits["station_id"][index] = station_id
+        visits["entry_time"][index] = entry_time
+        visits["exit_time"][index] = exit_time
+        visits["wait_time"][index] = wait_time
+        visits["process_time"][index] = process_time
+        self.num_visits = index + 1
+
+    def add_wait(self, row, wait_time):
+        """! Accumulate queueing time for a product.
+        @param row Row index returned by add_product
+        @param wait_time Time spent waiting for a station
+        """
+        self.products["wait_time"][row] += wait_time
+
+    def finish(self, row, end_time, quality):
+        """! Mark a product as having left the line.
+        @param row Row index returned by add_product
+        @param end_time Time the product finished or was rejected
+        @param quality QUALITY_GOOD or QUALITY_REJECTED
+        """
+        self.products["end_time"][row] = end_time
+        self.products["quality"][row] = quality
+
+    @classmethod
+    def from_columns(cls, level, products, visits=None):
+        """! Build a store from already computed columns, e.g. by a vectorized engine.
+        @param level Tracing level, "summary" or "full"
+        @param products Dict with an array for every name in PRODUCT_COLUMNS
+        @param visits Dict with an array for every name in VISIT_COLUMNS (full level only)
+        @return ProductTraceStore holding the given rows
+        """
+        store = cls(level, capacity=0)
+        store.products = {name: np.asarray(products[name], dtype=dtype)
+                          for name, dtype in PRODUCT_COLUMNS.items()}
+        store.num_products = len(store.products["product_id"])
+        if level == TRACE_FULL and visits is not None:
+            store.visits = {name: np.asarray(visits[name], dtype=dtype)
+                            for name, dtype in VISIT_COLUMNS.items()}
+            store.num_visits = len(store.visits["product_row"])
+        return store
+
+    def product_columns(self):
+        """! Views of the product table trimmed to the recorded rows.
+        @return Dict of column name to array
+        """
+        return {name: column[:self.num_products] for name, column in self.products.items()}
+
+    def visit_columns(self):
+        """! Views of the visit table trimmed to the recorded rows.
+        @return Dict of column name to array
+        """
+        return {name: column[:self.num_visits] for name, column in self.visits.items()}
+
+    def visits_by_product(self):
+        """! Group the visit table by product row.
+        @return Tuple (order, offsets): visits of product row r are order[offsets[r]:offsets[r + 1]]
+        """
+        product_rows = self.visits["product_row"][:self.num_visits]
+        order = np.argsort(product_rows, kind="stable")
+        offsets = np.searchsorted(product_rows[order], np.arange(self.num_products + 1))
+        return order, offsets
+
+    def compact(self):
+        """! Release unused preallocated capacity, e.g. before pickling results."""
+        self.products = {name: column.copy() for name, column in self.product_columns().items()}
+        self.visits = {name: column.copy() for name, column in self.visit_columns().items()}
+        return self
+
+
+class SampledTraceStore:
+    """! Reservoir sample of finished product traces, stratified by quality, with exact aggregates.
+
+    @details Products in the line are held in a small dict until they finish. A
+    finished product is folded into the exact count and the cycle/wait/process time
+    accumulators of its quality, then offered to that quality's reservoir (Vitter's
+    algorithm R): the n-th product of a stratum replaces a random kept one with
+    probability sample_size / n, so every finished product of the stratum is equally
+    likely to be kept. Products still in the line at the end are not sampled,
+    matching the export, which skips unfinished products.
+    """
+    STRATA = (QUALITY_GOOD, QUALITY_REJECTED)
+
+    def __init__(self, level, sample_size, uniforms):
+        """! Initialize empty reservoirs.
+        @param level Tracing level of the sampled products, "summary" or "full"
+        @param sample_size Products kept per quality
+        @param uniforms VariateStream of uniforms on [0, 1) choosing the replaced slots
+        """
+        if level not in (TRACE_SUMMARY, TRACE_FULL):
+            raise ValueError(f"Unsupported trace level for a store: {level}")
+        if sample_size < 1:
+            raise ValueError("sample_size must be at least 1")
+        self.level = level
+        self.sample_size = int(sample_size)
+        self.uniforms = uniforms
+        self.active = {}
+        self.next_row = 0
+        self.reservoirs = {quality: [] for quality in self.STRATA}
+        self.seen = {quality: 0 for quality in self.STRATA}
+        self.times = {quality: {name: RunningStats(quantiles=True)
+                                for name in ("cycle_time", "wait_time", "process_time")}
+                      for quality in self.STRATA}
+
+    def __len__(self):
+        """! Number of products currently kept in the reservoirs."""
+        return sum(len(reservoir) for reservoir in self.reservoirs.values())
+
+    def add_product(self, product_id, start_time):
+        """! Register a product entering the line; see ProductTraceStore.add_product."""
+        row = self.next_row
+        self.next_row += 1
+        # [product_id, start_time, wait_time, process_time, visits]
+        self.active[row] = [product_id, start_time, 0.0, 0.0, [] if self.level == TRACE_FULL else None]
+        return row
+
+    def add_visit(self, row, station_id, entry_time, exit_time, wait_time, process_time):
+        """! Record a completed station visit; see ProductTraceStore.add_visit."""
+        record = self.active[row]
+        record[3] += process_time
+        if record[4] is not None:
+            record[4].append((station_id, entry_time, exit_time, wait_time, process_time))
+
+    def add_wait(self, row, wait_time):
+        """! Accumulate queueing time; see ProductTraceStore.add_wait."""
+        self.active[row][2] += wait_time
+
+    def finish(self, row, end_time, quality):
+        """! Fold a finished product into the aggregates and offer it to its reservoir.
+        @param row Row index returned by add_product
+        @param end_time Time the product finished or was rejected
+        @param quality QUALITY_GOOD or QUALITY_REJECTED
+        """
+        product_id, start_time, wait_time, process_time, visits = self.active.pop(row)
+        times = self.times[quality]
+        times["cycle_time"].add(end_time - start_time)
+        times["wait_time"].add(wait_time)
+        times["process_time"].add(process_time)
+
+        seen = self.seen[quality] + 1
+        self.seen[quality] = seen
+        reservoir = self.reservoirs[quality]
+        entry = (product_id, start_time, end_time, wait_time, process_time, quality, visits)
+        if len(reservoir) < self.sample_size:
+            reservoir.append(entry)
+        else:
+            slot = int(self.uniforms.next() * seen)
+            if slot < self.sample_size:
+                reservoir[slot] = entry
+
+    def to_store(self):
+        """! The sampled products as a ProductTraceStore, in product order.
+        @return ProductTraceStore holding only the kept products
+        """
+        entries = sorted((entry for reservoir in self.reservoirs.values() for entry in reservoir),
+                         key=lambda entry: entry[0])
+        products = {name: np.array([entry[index] for entry in entries], dtype=dtype)
+                    for index, (name, dtype) in enumerate(PRODUCT_COLUMNS.items())}
+        visits = None
+        if self.level == TRACE_FULL:
+            rows = [(row,) + visit for row, entry in enumerate(entries) for visit in entry[6]]
+            visits = {name: np.array([visit[index] for visit in rows], dtype=dtype)
+                      for index, (name, dtype) in enumerate(VISIT_COLUMNS.items())}
+        return ProductTraceStore.from_columns(self.level, products, visits)
+
+    def compact(self):
+        """! Materialize the sample for the run results (the store itself keeps the reservoirs)."""
+        return self.to_store()
+
+    def summary(self):
+        """! Exact totals and distributions of every quality, with the sampling weights.
+        @return Dict of quality label to seen/kept counts, weight and time summaries
+        """
+        summary = {}
+        for quality in self.STRATA:
+            seen, kept = self.seen[quality], len(self.reservoirs[quality])
+            summary[QUALITY_LABELS[quality]] = {
+                "seen": seen,
+                "kept": kept,
+                # Each kept product stands for this many finished products of its quality
+                "weight": seen / kept if kept else 0.0,
+                **{name: stats.summary() for name, stats in self.times[quality].items()},
+            }
+        return summary
+
+
+def create_trace_store(level=TRACE_FULL, sample_size=None, uniforms=None):
+    """! Create the trace store matching a tracing level.
+    @param level One of "off", "summary" or "full"
+    @param sample_size Products kept per quality in a reservoir sample (None keeps every product)
+    @param uniforms VariateStream of uniforms used by the reservoir sample
+    @return ProductTraceStore or SampledTraceStore, or None when tracing is off
+    """
+    if level not in TRACE_LEVELS:
+        raise ValueError(f"Unknown trace level: {level}. Expected one of {TRACE_LEVELS}")
+    if level == TRACE_OFF:
+        return None
+    if sample_size is not None:
+        if uniforms is None:
+            raise ValueError("A reservoir sample needs a stream of uniforms")
+        return SampledTraceStore(level, sample_size, uniforms)
+    return ProductTraceStore(level)
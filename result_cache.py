@@ -0,0 +1,162 @@
+"""! @file result_cache.py
+    @brief Content-addressed on-disk cache of simulation run results.
+
+    A cached result is keyed by everything that determines it: the run seed, the
+    simulation horizon, the facility parameters, the run_simulation options and
+    a hash of the simulation source code. Changing any of them simply produces a
+    different key, so stale entries are never returned; they age out through the
+    size-bounded least-recently-used eviction or an explicit clear().
+
+    @author: Eduardo Ulises Martinez
+    @author: Fernanda Mena
+    @author: Brandon Avalos
+"""
+
+import hashlib
+import json
+import os
+import pickle
+import tempfile
+
+DEFAULT_CACHE_DIR = "./.sim_cache"
+DEFAULT_MAX_BYTES = 2 * 1024 ** 3
+
+# Source files whose contents affect simulation results
+MODEL_SOURCES = ("EUMV_FMS.py", "random_streams.py", "product_traces.py", "streaming_stats.py",
+                 "vector_engine.py", "topology.py")
+
+_model_version = None
+
+
+def model_version():
+    """! Hash of the simulation source code, used to invalidate results of older models.
+    @return Hex digest of the model source files
+    """
+    global _model_version
+    if _model_version is None:
+        digest = hashlib.sha256()
+        base_dir = os.path.dirname(os.path.abspath(__file__))
+        for source in MODEL_SOURCES:
+            digest.update(source.encode("utf-8"))
+            with open(os.path.join(base_dir, source), "rb") as f:
+                digest.update(f.read())
+        _model_version = digest.hexdigest()
+    return _model_version
+
+
+class ResultCache:
+    """! Directory of pickled run results addressed by the hash of their inputs."""
+
+    def __init__(self, directory=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        """! Initialize the cache, creating its directory if needed.
+        @param directory Directory holding the cached results
+        @param max_bytes Total size above which least recently used entries are evicted
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def key(self, seed, simulation_time, parameters, options=None):
+        """! Compute the cache key of one simulation run.
+        @param seed Seed of the run (run_id + 1000)
+        @param simulation_time Duration of the run
+        @param parameters Dict of facility parameters
+        @param options Dict of extra run_simulation options (e.g. trace_level)
+        @return Hex digest identifying the run
+        """
+        description = {
+            "seed": seed,
+            "simulation_time": simulation_time,
+            "parameters": parameters,
+            "options": options or {},
+            "model_version": model_version(),
+        }
+        encoded = json.dumps(description, sort_keys=True, default=repr)
+        return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+    def _path(self, key):
+        """! File path of a cache entry."""
+        return os.path.join(self.directory, f"{key}.pkl")
+
+    def get(self, key):
+        """! Load a cached result.
+        @param key Cache key from key()
+        @return Cached result, or None if the entry is missing or unreadable
+        """
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                result = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            self.misses += 1
+            return None
+        os.utime(path)  # Mark as recently used
+        self.hits += 1
+        return result
+
+    def put(self, key, result):
+        """! Store a result atomically and evict old entries if the cache is too large.
+        @param key Cache key from key()
+        @param result Result dict to store
+        """
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                pickle.dump(result, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self._path(key))
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self.evict()
+
+    def _entries(self):
+        """! List cache entries as (mtime, size, path) tuples."""
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".pkl"):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+    def size(self):
+        """! Total size of the cached results in bytes."""
+        return sum(size for _, size, _ in self._entries())
+
+    def evict(self):
+        """! Remove least recently used entries until the cache fits in max_bytes.
+        @return Number of entries removed
+        """
+        entries = self._entries()
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            removed += 1
+        return removed
+
+    def invalidate(self, key):
+        """! Remove a single entry.
+        @param key Cache key from key()
+        """
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def clear(self):
+        """! Remove every cached result.
+        @return Number of entries removed
+        """
+        entries = self._entries()
+        for _, _, path in entries:
+            os.remove(path)
+        return len(entries)
@@ -0,0 +1,346 @@
+"""! @file results_store.py
+    @brief Memory-mapped, columnar on-disk store of replication results.
+
+    A results store is a directory of .npy column files described by a
+    schema.json header:
+
+        schema.json              format version, sizes, column names and dtypes
+        runs/<column>.npy        one value per run (production, rejected, ...)
+        stations/<column>.npy    one row per run, one column per station
+        stats/<name>.<field>.npy RunningStats fields per run and station
+        stats/<name>.sketch_*.npy quantile sketch buckets in compressed sparse rows
+        products/<column>.npy    product traces of every run, concatenated
+        visits/<column>.npy      station visits of every run, concatenated
+
+    Columns are opened with memory mapping, so slicing a year of runs only reads
+    the pages that are touched. A ResultsStore behaves like the list of result
+    dicts returned by run_all_runs (len, indexing, slicing, iteration), so the
+    plotting generators accept it directly; the dicts are built one run at a time.
+
+    @author: Eduardo Ulises Martinez
+    @author: Fernanda Mena
+    @author: Brandon Avalos
+"""
+
+import json
+import os
+import numpy as np
+from numpy.lib.format import open_memmap
+from product_traces import PRODUCT_COLUMNS, VISIT_COLUMNS, ProductTraceStore
+from streaming_stats import QuantileSketch, RunningStats
+from topology import station_name, station_names
+
+STORE_FORMAT = "eumv-results"
+STORE_VERSION = 1
+SCHEMA_FILE = "schema.json"
+
+# Plain per-run result fields
+RUN_COLUMNS = {
+    "run_id": np.int64,
+    "production": np.int64,
+    "rejected": np.int64,
+    "supplier_occupancy": np.float64,
+}
+
+# Plain per-station result fields
+STATION_COLUMNS = {
+    "occupancy": np.float64,
+    "downtime": np.float64,
+    "avg_fixing_time": np.float64,
+    "avg_waiting_time": np.float64,
+    "avg_bottleneck_delay": np.float64,
+    "p50_waiting_time": np.float64,
+    "p95_waiting_time": np.float64,
+    "p99_waiting_time": np.float64,
+    "p50_fixing_time": np.float64,
+    "p95_fixing_time": np.float64,
+    "p99_fixing_time": np.float64,
+    "good_products": np.int64,
+    "rejected_products": np.int64,
+    "accidents": np.int64,
+}
+
+# Per-station RunningStats fields of the results
+STATS_NAMES = ("waiting_time_stats", "fixing_time_stats")
+STATS_FIELDS = {
+    "count": np.int64,
+    "mean": np.float64,
+    "m2": np.float64,
+    "min": np.float64,
+    "max": np.float64,
+    "total": np.float64,
+}
+
+
+def _save(directory, name, array):
+    """! Save one column file, creating its subdirectory.
+    @param directory Store directory
+    @param name Column path relative to the store, without extension
+    @param array Array to save
+    """
+    path = os.path.join(directory, f"{name}.npy")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    np.save(path, array)
+
+
+def _dtype_names(columns):
+    """! Column name to dtype string mapping for the schema."""
+    return {name: np.dtype(dtype).str for name, dtype in columns.items()}
+
+
+def write_results_store(all_results, directory, products=True):
+    """! Write replication results as a columnar results store.
+    @param all_results List of simulation run results
+    @param directory Output directory (created if needed)
+    @param products Also store product traces of the runs that have them
+    @return Path of the schema file
+    """
+    os.makedirs(directory, exist_ok=True)
+    num_runs = len(all_results)
+    num_stations = len(all_results[0]['stations']) if num_runs else 0
+
+    for name, dtype in RUN_COLUMNS.items():
+        _save(directory, f"runs/{name}", np.array([result[name] for result in all_results], dtype=dtype))
+    for name, dtype in STATION_COLUMNS.items():
+        values = [[result['stations'][i][name] for i in range(num_stations)] for result in all_results]
+        _save(directory, f"stations/{name}", np.array(values, dtype=dtype).reshape(num_runs, num_stations))
+
+    # Stats are laid out station-major so each station's runs are contiguous
+    sketch_params = {}
+    for stats_name in STATS_NAMES:
+        stats = [all_results[run]['stations'][i][stats_name] for i in range(num_stations) for run in range(num_runs)]
+        for field, dtype in STATS_FIELDS.items():
+            values = np.array([getattr(item, field) for item in stats], dtype=dtype)
+            _save(directory, f"stats/{stats_name}.{field}", values.reshape(num_stations, num_runs))
+        sketches = [item.sketch for item in stats]
+        lengths = [len(sketch.buckets) if sketch is not None else 0 for sketch in sketches]
+        offsets = np.zeros(len(sketches) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        present = [sketch for sketch in sketches if sketch is not None]
+        indices = np.concatenate([np.fromiter(sketch.buckets.keys(), np.int64, len(sketch.buckets))
+                                  for sketch in present] or [np.zeros(0, dtype=np.int64)])
+        counts = np.concatenate([np.fromiter(sketch.buckets.values(), np.int64, len(sketch.buckets))
+                                 for sketch in present] or [np.zeros(0, dtype=np.int64)])
+        zeros = np.array([sketch.zero_count if sketch is not None else -1 for sketch in sketches], dtype=np.int64)
+        _save(directory, f"stats/{stats_name}.sketch_offsets", offsets)
+        _save(directory, f"stats/{stats_name}.sketch_indices", indices)
+        _save(directory, f"stats/{stats_name}.sketch_counts", counts)
+        # A zero count of -1 marks stats kept without a sketch
+        _save(directory, f"stats/{stats_name}.sketch_zero_count", zeros)
+        if present:
+            sketch_params[stats_name] = {"relative_accuracy": present[0].relative_accuracy,
+                                         "max_buckets": present[0].max_buckets,
+                                         "min_value": present[0].min_value}
+
+    trace_levels = [None] * num_runs
+    if products:
+        _write_traces(all_results, directory, trace_levels)
+
+    schema = {
+        "format": STORE_FORMAT,
+        "version": STORE_VERSION,
+        "num_runs": num_runs,
+        "num_stations": num_stations,
+        "station_names": station_names(all_results),
+        "run_columns": _dtype_names(RUN_COLUMNS),
+        "station_columns": _dtype_names(STATION_COLUMNS),
+        "stats": {name: {"fields": _dtype_names(STATS_FIELDS), "sketch": sketch_params.get(name)}
+                  for name in STATS_NAMES},
+        "products": products,
+        "product_columns": _dtype_names(PRODUCT_COLUMNS) if products else None,
+        "visit_columns": _dtype_names(VISIT_COLUMNS) if products else None,
+        "trace_levels": trace_levels,
+    }
+    schema_path = os.path.join(directory, SCHEMA_FILE)
+    with open(schema_path, "w") as f:
+        json.dump(schema, f, indent=2)
+    return schema_path
+
+
+def _write_traces(all_results, directory, trace_levels):
+    """! Write the product and visit tables of every run, concatenated, with run offsets.
+    @param all_results List of simulation run results
+    @param directory Store directory
+    @param trace_levels List filled in with the trace level of every run (None when off)
+    """
+    stores = [result.get('products') for result in all_results]
+    product_offsets = np.zeros(len(stores) + 1, dtype=np.int64)
+    visit_offsets = np.zeros(len(stores) + 1, dtype=np.int64)
+    np.cumsum([len(store) if store is not None else 0 for store in stores], out=product_offsets[1:])
+    np.cumsum([store.num_visits if store is not None else 0 for store in stores], out=visit_offsets[1:])
+    _save(directory, "products/run_offsets", product_offsets)
+    _save(directory, "visits/run_offsets", visit_offsets)
+
+    # Fill the columns through writable memory maps instead of concatenating in memory
+    os.makedirs(os.path.join(directory, "products"), exist_ok=True)
+    os.makedirs(os.path.join(directory, "visits"), exist_ok=True)
+    tables = (("products", PRODUCT_COLUMNS, product_offsets, ProductTraceStore.product_columns),
+              ("visits", VISIT_COLUMNS, visit_offsets, ProductTraceStore.visit_columns))
+    for table, columns, offsets, column_getter in tables:
+        for name, dtype in columns.items():
+            column = open_memmap(os.path.join(directory, table, f"{name}.npy"), mode="w+",
+                                 dtype=dtype, shape=(int(offsets[-1]),))
+            for run, store in enumerate(stores):
+                if store is not None:
+                    column[offsets[run]:offsets[run + 1]] = column_getter(store)[name]
+            column.flush()
+            del column
+    for run, store in enumerate(stores):
+        trace_levels[run] = store.level if store is not None else None
+
+
+class ResultsStore:
+    """! Read-only, memory-mapped view of a results store, usable as a list of run results."""
+
+    def __init__(self, directory, mmap_mode="r", start=0, stop=None):
+        """! Open a results store.
+        @param directory Store directory written by write_results_store
+        @param mmap_mode Memory-map mode passed to numpy.load (None loads into memory)
+        @param start First run of the view
+        @param stop Run after the last run of the view (None for all runs)
+        """
+        self.directory = directory
+        self.mmap_mode = mmap_mode
+        with open(os.path.join(directory, SCHEMA_FILE)) as f:
+            self.schema = json.load(f)
+        if self.schema.get("format") != STORE_FORMAT or self.schema.get("version") != STORE_VERSION:
+            raise ValueError(f"{directory} is not a version {STORE_VERSION} results store")
+        self.num_stations = self.schema["num_stations"]
+        # Stores written before topologies were recorded get the default names
+        self.station_names = self.schema.get("station_names") or [station_name(i) for i in range(self.num_stations)]
+        total = self.schema["num_runs"]
+        self.start = start
+        self.stop = total if stop is None else stop
+        self._columns = {}
+
+    def _column(self, name):
+        """! Memory-mapped column file, opened once.
+        @param name Column path relative to the store, without extension
+        @return Array (memory-mapped unless mmap_mode is None)
+        """
+        column = self._columns.get(name)
+        if column is None:
+            column = np.load(os.path.join(self.directory, f"{name}.npy"), mmap_mode=self.mmap_mode)
+            self._columns[name] = column
+        return column
+
+    def __len__(self):
+        """! Number of runs in the view."""
+        return self.stop - self.start
+
+    def __getitem__(self, key):
+        """! Results dict of one run, or a store view of a contiguous range of runs."""
+        if isinstance(key, slice):
+            start, stop, step = key.indices(len(self))
+            if step != 1:
+                raise ValueError("Results store views only support contiguous slices")
+            view = ResultsStore.__new__(ResultsStore)
+            view.__dict__.update(self.__dict__)
+            view.start, view.stop = self.start + start, self.start + max(start, stop)
+            return view
+        index = key + len(self) if key < 0 else key
+        if not 0 <= index < len(self):
+            raise IndexError("run index out of range")
+        return self.run(index)
+
+    def __iter__(self):
+        """! Iterate over the results dicts, one run at a time."""
+        for index in range(len(self)):
+            yield self.run(index)
+
+    def run_column(self, name):
+        """! One value per run of the view.
+        @param name Name from RUN_COLUMNS
+        @return 1-D array
+        """
+        return self._column(f"runs/{name}")[self.start:self.stop]
+
+    def station_column(self, name):
+        """! One row per run and one column per station.
+        @param name Name from STATION_COLUMNS
+        @return 2-D array
+        """
+        return self._column(f"stations/{name}")[self.start:self.stop]
+
+    def sketch_buckets(self, stats_name, station):
+        """! Sketch buckets of one station over the runs of the view.
+        @param stats_name Name from STATS_NAMES
+        @param station Station index
+        @return Tuple (runs, indices, counts, zero_counts): run of every bucket entry relative to
+                the view, bucket indices and counts, and the zero count of every run
+        """
+        total = self.schema["num_runs"]
+        first = station * total + self.start
+        last = station * total + self.stop
+        offsets = self._column(f"stats/{stats_name}.sketch_offsets")[first:last + 1]
+        lengths = np.diff(offsets)
+        runs = np.repeat(np.arange(len(lengths)), lengths)
+        indices = self._column(f"stats/{stats_name}.sketch_indices")[offsets[0]:offsets[-1]]
+        counts = self._column(f"stats/{stats_name}.sketch_counts")[offsets[0]:offsets[-1]]
+        zero_counts = np.maximum(self._column(f"stats/{stats_name}.sketch_zero_count")[first:last], 0)
+        return runs, indices, counts, zero_counts
+
+    def sketch_params(self, stats_name):
+        """! Accuracy parameters of the sketches of a stats field, or None without sketches."""
+        return self.schema["stats"][stats_name]["sketch"]
+
+    def _stats(self, stats_name, station, run):
+        """! Rebuild the RunningStats of one station in one run."""
+        total = self.schema["num_runs"]
+        row = station * total + run
+        stats = RunningStats()
+        for field in STATS_FIELDS:
+            value = self._column(f"stats/{stats_name}.{field}")[station, run]
+            setattr(stats, field, value.item())
+        zero_count = int(self._column(f"stats/{stats_name}.sketch_zero_count")[row])
+        if zero_count >= 0:
+            stats.sketch = QuantileSketch(**self.sketch_params(stats_name))
+            offsets = self._column(f"stats/{stats_name}.sketch_offsets")[row:row + 2]
+            indices = self._column(f"stats/{stats_name}.sketch_indices")[offsets[0]:offsets[1]]
+            counts = self._column(f"stats/{stats_name}.sketch_counts")[offsets[0]:offsets[1]]
+            stats.sketch.buckets = dict(zip(indices.tolist(), counts.tolist()))
+            stats.sketch.zero_count = zero_count
+            stats.sketch.count = zero_count + int(counts.sum())
+        return stats
+
+    def product_traces(self, index):
+        """! Product trace store of one run, backed by the memory-mapped columns.
+        @param index Run index within the view
+        @return ProductTraceStore, or None when the run was not traced
+        """
+        run = self.start + index
+        if not self.schema["products"] or self.schema["trace_levels"][run] is None:
+            return None
+        product_offsets = self._column("products/run_offsets")
+        visit_offsets = self._column("visits/run_offsets")
+        products = {name: self._column(f"products/{name}")[product_offsets[run]:product_offsets[run + 1]]
+                    for name in PRODUCT_COLUMNS}
+        visits = {name: self._column(f"visits/{name}")[visit_offsets[run]:visit_offsets[run + 1]]
+                  for name in VISIT_COLUMNS}
+        return ProductTraceStore.from_columns(self.schema["trace_levels"][run], products, visits)
+
+    def run(self, index):
+        """! Results dict of one run, in the format returned by run_simulation.
+        @param index Run index within the view
+        @return Dict containing simulation results and metrics
+        """
+        run = self.start + index
+        results = {name: self._column(f"runs/{name}")[run].item() for name in RUN_COLUMNS}
+        results['stations'] = {}
+        for i in range(self.num_stations):
+            station = {name: self._column(f"stations/{name}")[run, i].item() for name in STATION_COLUMNS}
+            for stats_name in STATS_NAMES:
+                station[stats_name] = self._stats(stats_name, i, run)
+            results['stations'][i] = station
+        results['station_names'] = list(self.station_names)
+        results['products'] = self.product_traces(index)
+        return results
+
+
+def open_results_store(directory, mmap_mode="r"):
+    """! Open a results store written by write_results_store.
+    @param directory Store directory
+    @param mmap_mode Memory-map mode passed to numpy.load (None loads into memory)
+    @return ResultsStore
+    """
+    return ResultsStore(directory, mmap_mode)
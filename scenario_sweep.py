@@ -0,0 +1,137 @@
+"""! @file scenario_sweep.py
+    @brief Parameter sweeps over ManufacturingFacility configurations.
+
+    A sweep is a list of scenarios, each a dict overriding some of the facility
+    parameters (bin_size, supplier_capacity, station_capacity, failure_probs, topology).
+    Scenarios can be listed explicitly or generated from a parameter grid. All
+    scenario × replication runs are fanned out over one process pool, cached
+    runs are reused, and the sweep produces a single tidy summary table with
+    one row per scenario.
+
+    @author: Eduardo Ulises Martinez
+    @author: Fernanda Mena
+    @author: Brandon Avalos
+"""
+
+import csv
+import itertools
+import json
+import os
+import numpy as np
+from EUMV_FMS import DEFAULT_FACILITY_PARAMS, resolve_facility_params, run_tasks
+from product_traces import TRACE_OFF
+
+SUMMARY_METRICS = ("production", "rejected", "rejection_rate", "supplier_occupancy")
+STATION_SUMMARY_METRICS = ("occupancy", "downtime", "avg_waiting_time", "p95_waiting_time")
+
+
+def expand_grid(grid):
+    """! Expand a parameter grid into the list of all its scenarios.
+    @param grid Dict mapping a facility parameter name to the list of values to try
+    @return List of scenario dicts, one per combination of values
+    """
+    names = list(grid)
+    return [dict(zip(names, values)) for values in itertools.product(*(grid[name] for name in names))]
+
+
+def load_scenarios(path):
+    """! Load scenarios from a JSON file.
+
+    @details The file holds either {"grid": {parameter: [values, ...]}} or
+    {"scenarios": [{parameter: value, ...}, ...]}; both keys may be combined.
+    @param path Path of the JSON scenario description
+    @return List of scenario dicts
+    """
+    with open(path) as f:
+        description = json.load(f)
+    scenarios = list(description.get("scenarios", []))
+    if "grid" in description:
+        scenarios.extend(expand_grid(description["grid"]))
+    return scenarios
+
+
+def summarize_scenario(scenario_id, scenario, results):
+    """! Reduce the replications of one scenario to a summary row.
+    @param scenario_id Index of the scenario in the sweep
+    @param scenario Dict of facility parameter overrides
+    @param results List of run_simulation results for the scenario
+    @return Dict of column name to value
+    """
+    params = resolve_facility_params(scenario)
+    row = {"scenario_id": scenario_id}
+    for name in DEFAULT_FACILITY_PARAMS:
+        value = params[name]
+        row[name] = json.dumps(value) if isinstance(value, (list, tuple, dict)) else value
+    row["runs"] = len(results)
+
+    productions = np.array([r['production'] for r in results], dtype=float)
+    rejections = np.array([r['rejected'] for r in results], dtype=float)
+    finished = productions + rejections
+    values = {
+        "production": productions,
+        "rejected": rejections,
+        "rejection_rate": np.divide(rejections, finished, out=np.zeros_like(finished), where=finished > 0),
+        "supplier_occupancy": np.array([r['supplier_occupancy'] for r in results], dtype=float),
+    }
+    for metric in SUMMARY_METRICS:
+        row[f"{metric}_mean"] = float(np.mean(values[metric])) if results else 0.0
+        row[f"{metric}_std"] = float(np.std(values[metric], ddof=1)) if len(results) > 1 else 0.0
+
+    num_stations = len(results[0]['stations']) if results else 0
+    for station in range(num_stations):
+        for metric in STATION_SUMMARY_METRICS:
+            row[f"station{station}_{metric}_mean"] = float(np.mean([r['stations'][station][metric] for r in results]))
+    return row
+
+
+def write_summary_table(rows, output_path):
+    """! Write sweep summary rows to a CSV file.
+    @param rows List of summary dicts from summarize_scenario
+    @param output_path Path of the CSV file
+    """
+    output_dir = os.path.dirname(output_path)
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+    # Scenarios with different topologies have different station columns; cells of
+    # stations a scenario does not have are left empty
+    fieldnames = list(dict.fromkeys(name for row in rows for name in row)) or ["scenario_id"]
+    with open(output_path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=fieldnames, restval='')
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def run_sweep(scenarios, num_runs, simulation_time, workers=None, chunksize=None, cache=None,
+              output_path='./sweeps/sweep_summary.csv', trace_level=TRACE_OFF, progress=True):
+    """! Run every scenario for num_runs replications and write the summary table.
+
+    @details Replication r of every scenario uses run_id r, so all scenarios see the
+    same seeds and differences between rows come from the parameters.
+    @param scenarios List of scenario dicts of facility parameter overrides
+    @param num_runs Number of replications per scenario
+    @param simulation_time Duration of each simulation run
+    @param workers Number of worker processes (None uses every core)
+    @param chunksize Number of runs handed to a worker at a time (None picks one)
+    @param cache Optional ResultCache used to load and store run results
+    @param output_path Path of the CSV summary table (None skips writing it)
+    @param trace_level Product tracing level of the runs ("off" keeps workers light)
+    @param progress Print progress while the sweep runs
+    @return List of summary rows, one per scenario
+    """
+    scenarios = [dict(scenario) for scenario in scenarios]
+    for scenario in scenarios:
+        resolve_facility_params(scenario)  # Fail before simulating if a scenario is invalid
+
+    tasks = [(run_id, {"trace_level": trace_level, "facility_params": scenario})
+             for scenario in scenarios for run_id in range(num_runs)]
+    if progress:
+        print(f"Running sweep: {len(scenarios)} scenario(s) x {num_runs} replication(s)")
+    results = run_tasks(tasks, simulation_time, workers, chunksize, progress, cache)
+
+    rows = [summarize_scenario(index, scenario, results[index * num_runs:(index + 1) * num_runs])
+            for index, scenario in enumerate(scenarios)]
+    if output_path is not None:
+        write_summary_table(rows, output_path)
+        if progress:
+            print(f"Sweep summary written: {output_path}")
+    return rows
@@ -0,0 +1,352 @@
+"""! @file sharding.py
+    @brief Multi-node replication through a work queue in a shared directory.
+
+    A job splits run_ids 0..num_runs-1 into shards of shard_size consecutive runs.
+    Workers on any number of machines that mount the same directory claim
+    shards, simulate them and write one result file per shard; a merge step
+    then rebuilds the all_results list run_all_runs would have returned, in
+    run_id order, for the plotting and export generators.
+
+    Queue directory layout:
+        job.json                  simulation time, number of runs, shard size, run options
+        claims/shard-00003.lock   claim of a shard being simulated (owner, heartbeat by mtime)
+        results/shard-00003.pkl   pickled results of a finished shard
+
+    A claim is taken by creating its lock file with O_CREAT | O_EXCL, which is
+    atomic on local filesystems and on NFSv3 and later. While a worker simulates
+    a shard, a heartbeat thread touches the lock file. A claim is abandoned when
+    its heartbeat is older than the lease, or when its owner ran on this host and
+    that process no longer exists; any worker may then take it over by renaming
+    the stale lock away and claiming the shard again. Results are written to a
+    temporary file and renamed into place, so a crash never leaves a partial
+    shard behind.
+
+    Execution is at least once: in the rare race where two workers recover the
+    same claim, the shard is simulated twice. Every run is seeded from its
+    run_id, so both write identical results and the duplicate is harmless.
+
+    @author: Eduardo Ulises Martinez
+    @author: Fernanda Mena
+    @author: Brandon Avalos
+"""
+
+import json
+import os
+import pickle
+import socket
+import tempfile
+import threading
+import time
+import uuid
+from multiprocessing import Process
+from EUMV_FMS import resolve_facility_params, run_replications
+
+JOB_FILE = "job.json"
+CLAIMS_DIR = "claims"
+RESULTS_DIR = "results"
+DEFAULT_SHARD_SIZE = 10
+DEFAULT_LEASE_SECONDS = 300.0
+
+
+def create_job(queue_dir, num_runs, simulation_time, shard_size=DEFAULT_SHARD_SIZE, **simulation_options):
+    """! Create the work queue of a job, or check an existing one matches.
+    @param queue_dir Shared directory holding the queue
+    @param num_runs Number of replications (run_ids 0..num_runs-1)
+    @param simulation_time Duration of each run
+    @param shard_size Number of consecutive runs per shard
+    @param simulation_options Extra keyword arguments for run_simulation (e.g. trace_level)
+    @return Job description dict
+    """
+    if num_runs < 1 or shard_size < 1:
+        raise ValueError("num_runs and shard_size must be positive")
+    resolve_facility_params(simulation_options.get("facility_params"))
+    job = {
+        "num_runs": int(num_runs),
+        "simulation_time": simulation_time,
+        "shard_size": int(shard_size),
+        "num_shards": -(-int(num_runs) // int(shard_size)),
+        "options": simulation_options,
+    }
+    os.makedirs(os.path.join(queue_dir, CLAIMS_DIR), exist_ok=True)
+    os.makedirs(os.path.join(queue_dir, RESULTS_DIR), exist_ok=True)
+    path = os.path.join(queue_dir, JOB_FILE)
+    if os.path.exists(path):
+        existing = load_job(queue_dir)
+        # Compare through JSON so tuples and lists are treated alike
+        if existing != json.loads(json.dumps(job)):
+            raise ValueError(f"{queue_dir} already holds a different job; use another directory")
+        return existing
+    _write_atomic(path, json.dumps(job, indent=2).encode("utf-8"))
+    return job
+
+
+def load_job(queue_dir):
+    """! Read the job description of a queue directory.
+    @param queue_dir Shared directory holding the queue
+    @return Job description dict
+    """
+    path = os.path.join(queue_dir, JOB_FILE)
+    if not os.path.exists(path):
+        raise ValueError(f"{queue_dir} is not a shard queue (missing {JOB_FILE})")
+    with open(path) as f:
+        return json.load(f)
+
+
+def is_shard_queue(path):
+    """! Whether a directory holds a shard queue."""
+    return os.path.isfile(os.path.join(path, JOB_FILE))
+
+
+def shard_run_ids(job, shard):
+    """! Run identifiers of one shard."""
+    first = shard * job["shard_size"]
+    return range(first, min(first + job["shard_size"], job["num_runs"]))
+
+
+def _lock_path(queue_dir, shard):
+    return os.path.join(queue_dir, CLAIMS_DIR, f"shard-{shard:05d}.lock")
+
+
+def _result_path(queue_dir, shard):
+    return os.path.join(queue_dir, RESULTS_DIR, f"shard-{shard:05d}.pkl")
+
+
+def _write_atomic(path, data):
+    """! Write a file through a temporary file in the same directory and an atomic rename."""
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def _read_claim(lock_path):
+    """! Owner record and heartbeat age of a claim.
+    @return Tuple (owner dict, seconds since the last heartbeat), or None if there is no claim
+    """
+    try:
+        with open(lock_path) as f:
+            owner = json.load(f)
+        age = time.time() - os.stat(lock_path).st_mtime
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError):
+        # A lock being written right now reads as empty or partial; it ages from its mtime
+        # like any other, so one left by a worker that died before writing it still expires
+        try:
+            return {}, time.time() - os.stat(lock_path).st_mtime
+        except FileNotFoundError:
+            return None
+        except OSError:
+            return {}, 0.0
+    return owner, age
+
+
+def _owner_is_dead(owner):
+    """! Whether a claim's owner ran on this host and its process no longer exists."""
+    if owner.get("host") != socket.gethostname() or "pid" not in owner:
+        return False
+    try:
+        os.kill(owner["pid"], 0)
+    except ProcessLookupError:
+        return True
+    except PermissionError:
+        return False
+    return False
+
+
+class ShardClaim:
+    """! Claim on one shard, kept alive by a heartbeat thread while the shard is simulated."""
+
+    def __init__(self, lock_path, owner, lease_seconds):
+        """! Wrap a lock file this worker just created.
+        @param lock_path Path of the lock file
+        @param owner Owner record written in the lock file
+        @param lease_seconds Lease after which a claim without heartbeat is considered abandoned
+        """
+        self.lock_path = lock_path
+        self.owner = owner
+        self.interval = max(lease_seconds / 4, 0.05)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._heartbeat, daemon=True)
+
+    def _heartbeat(self):
+        while not self._stop.wait(self.interval):
+            try:
+                os.utime(self.lock_path)
+            except FileNotFoundError:
+                return
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        """! Stop the heartbeat and remove the lock if this worker still owns it."""
+        self._stop.set()
+        self._thread.join()
+        claim = _read_claim(self.lock_path)
+        if claim is not None and claim[0].get("token") == self.owner["token"]:
+            try:
+                os.remove(self.lock_path)
+            except FileNotFoundError:
+                pass
+        return False
+
+
+def try_claim(queue_dir, shard, worker_id, lease_seconds=DEFAULT_LEASE_SECONDS):
+    """! Claim a shard that is neither finished nor claimed by a live worker.
+    @param queue_dir Shared directory holding the queue
+    @param shard Shard index
+    @param worker_id Name of the claiming worker, recorded in the lock
+    @param lease_seconds Heartbeat age after which a claim is considered abandoned
+    @return ShardClaim, or None if the shard is done or owned by someone else
+    """
+    if os.path.exists(_result_path(queue_dir, shard)):
+        return None
+    lock_path = _lock_path(queue_dir, shard)
+    claim = _read_claim(lock_path)
+    if claim is not None:
+        owner, age = claim
+        if age < lease_seconds and not _owner_is_dead(owner):
+            return None
+        # Abandoned: move the stale lock aside; only one worker's rename succeeds
+        stale_path = f"{lock_path}.stale-{uuid.uuid4().hex}"
+        try:
+            os.rename(lock_path, stale_path)
+        except FileNotFoundError:
+            return None
+        os.remove(stale_path)
+        print(f"  Recovering shard {shard} abandoned by {owner.get('worker', 'unknown worker')}")
+
+    owner = {"worker": worker_id, "host": socket.gethostname(), "pid": os.getpid(),
+             "token": uuid.uuid4().hex, "claimed_at": time.time()}
+    try:
+        fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+    except FileExistsError:
+        return None
+    with os.fdopen(fd, "w") as f:
+        json.dump(owner, f)
+    # The shard may have finished between the first check and the claim
+    if os.path.exists(_result_path(queue_dir, shard)):
+        os.remove(lock_path)
+        return None
+    return ShardClaim(lock_path, owner, lease_seconds)
+
+
+def run_worker(queue_dir, worker_id=None, workers=1, lease_seconds=DEFAULT_LEASE_SECONDS, cache=None,
+               poll_seconds=None, max_shards=None):
+    """! Claim and simulate shards until every shard of the job is finished.
+
+    @details Once no shard is left to claim, the worker keeps polling while other
+    workers hold claims, so it can take over shards whose owners crash.
+    @param queue_dir Shared directory holding the queue
+    @param worker_id Name of this worker (default: host name and process id)
+    @param workers Number of local worker processes per shard (None uses every core)
+    @param lease_seconds Heartbeat age after which a claim is considered abandoned
+    @param cache Optional ResultCache used to load and store run results
+    @param poll_seconds Wait between scans while other workers hold the remaining shards
+                        (default: a quarter of the lease)
+    @param max_shards Stop after simulating this many shards (None: no limit)
+    @return Number of shards this worker simulated
+    """
+    job = load_job(queue_dir)
+    worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+    poll_seconds = lease_seconds / 4 if poll_seconds is None else poll_seconds
+    completed = 0
+    while max_shards is None or completed < max_shards:
+        pending = [shard for shard in range(job["num_shards"])
+                   if not os.path.exists(_result_path(queue_dir, shard))]
+        if not pending:
+            break
+        claimed = False
+        for shard in pending:
+            claim = try_claim(queue_dir, shard, worker_id, lease_seconds)
+            if claim is None:
+                continue
+            claimed = True
+            run_ids = shard_run_ids(job, shard)
+            with claim:
+                start = time.perf_counter()
+                results = run_replications(run_ids, job["simulation_time"], workers, cache=cache,
+                                           **job["options"])
+                _write_atomic(_result_path(queue_dir, shard),
+                              pickle.dumps(results, protocol=pickle.HIGHEST_PROTOCOL))
+            completed += 1
+            print(f"  {worker_id}: shard {shard} (runs {run_ids.start}-{run_ids.stop - 1}) "
+                  f"in {time.perf_counter() - start:.1f}s")
+            break
+        if not claimed:
+            time.sleep(poll_seconds)
+    return completed
+
+
+def queue_status(queue_dir, lease_seconds=DEFAULT_LEASE_SECONDS):
+    """! Count the shards of a job by state.
+    @param queue_dir Shared directory holding the queue
+    @param lease_seconds Heartbeat age after which a claim is considered abandoned
+    @return Dict with the job and the number of done, running, abandoned and pending shards
+    """
+    job = load_job(queue_dir)
+    status = {"job": job, "done": 0, "running": 0, "abandoned": 0, "pending": 0}
+    for shard in range(job["num_shards"]):
+        if os.path.exists(_result_path(queue_dir, shard)):
+            status["done"] += 1
+            continue
+        claim = _read_claim(_lock_path(queue_dir, shard))
+        if claim is None:
+            status["pending"] += 1
+        elif claim[1] >= lease_seconds or _owner_is_dead(claim[0]):
+            status["abandoned"] += 1
+        else:
+            status["running"] += 1
+    return status
+
+
+def merge_shards(queue_dir, allow_partial=False):
+    """! Merge the shard results into the list run_all_runs would return.
+    @param queue_dir Shared directory holding the queue
+    @param allow_partial Merge the finished shards even if some are missing
+    @return List of run results in run_id order
+    """
+    job = load_job(queue_dir)
+    all_results = []
+    missing = []
+    for shard in range(job["num_shards"]):
+        path = _result_path(queue_dir, shard)
+        if not os.path.exists(path):
+            missing.append(shard)
+            continue
+        with open(path, "rb") as f:
+            results = pickle.load(f)
+        expected = list(shard_run_ids(job, shard))
+        if [result['run_id'] for result in results] != expected:
+            raise ValueError(f"Shard {shard} holds runs that do not match the job")
+        all_results.extend(results)
+    if missing and not allow_partial:
+        raise ValueError(f"{len(missing)} of {job['num_shards']} shards are not finished: {missing[:10]}")
+    return all_results
+
+
+def launch_local_workers(queue_dir, count, lease_seconds=DEFAULT_LEASE_SECONDS, poll_seconds=None):
+    """! Run several single-process workers on this machine, standing in for separate nodes.
+    @param queue_dir Shared directory holding the queue
+    @param count Number of worker processes
+    @param lease_seconds Heartbeat age after which a claim is considered abandoned
+    @param poll_seconds Wait between scans while other workers hold the remaining shards
+    @return List of worker exit codes
+    """
+    processes = [Process(target=run_worker, args=(queue_dir, f"local-{index}", 1, lease_seconds),
+                         kwargs={"poll_seconds": poll_seconds})
+                 for index in range(count)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    return [process.exitcode for process in processes]
@@ -0,0 +1,270 @@
+"""! @file streaming_stats.py
+    @brief Constant-memory, mergeable statistics for station metrics.
+
+    RunningStats keeps count, mean and variance (Welford's algorithm) plus min/max
+    and, optionally, a QuantileSketch for percentiles. Both can be merged, so the
+    per-run station accumulators can be combined into plant-level summaries
+    across any number of runs without keeping individual observations.
+
+    @author: Eduardo Ulises Martinez
+    @author: Fernanda Mena
+    @author: Brandon Avalos
+"""
+
+import math
+from statistics import NormalDist
+import numpy as np
+
+
+class QuantileSketch:
+    """! Mergeable quantile sketch with relative accuracy guarantees (DDSketch style).
+
+    @details Positive values are counted in logarithmic buckets of ratio gamma, so any
+    quantile is returned within relative_accuracy of the true value. Values at or
+    below min_value are counted in a dedicated zero bucket. When more than
+    max_buckets buckets are in use, the lowest ones are collapsed together, which
+    keeps memory fixed while preserving accuracy for the upper percentiles.
+    """
+    __slots__ = ('relative_accuracy', 'max_buckets', 'min_value', 'gamma',
+                 '_log_gamma', 'buckets', 'zero_count', 'count')
+
+    def __init__(self, relative_accuracy=0.01, max_buckets=2048, min_value=1e-9):
+        """! Initialize an empty sketch.
+        @param relative_accuracy Maximum relative error of returned quantiles
+        @param max_buckets Maximum number of logarithmic buckets kept
+        @param min_value Values at or below this are counted as zero
+        """
+        self.relative_accuracy = relative_accuracy
+        self.max_buckets = max_buckets
+        self.min_value = min_value
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.buckets = {}
+        self.zero_count = 0
+        self.count = 0
+
+    def add(self, value, weight=1):
+        """! Add an observation to the sketch.
+        @param value Observed value (negative values are treated as zero)
+        @param weight Number of times the value was observed
+        """
+        self.count += weight
+        if value <= self.min_value:
+            self.zero_count += weight
+            return
+        index = math.ceil(math.log(value) / self._log_gamma)
+        buckets = self.buckets
+        buckets[index] = buckets.get(index, 0) + weight
+        if len(buckets) > self.max_buckets:
+            self._collapse()
+
+    def add_array(self, values):
+        """! Add a batch of observations at once.
+        @param values 1-D array of observed values
+        """
+        values = np.asarray(values, dtype=float)
+        if values.size == 0:
+            return
+        self.count += int(values.size)
+        positive = values[values > self.min_value]
+        self.zero_count += int(values.size - positive.size)
+        if positive.size:
+            indices, counts = np.unique(np.ceil(np.log(positive) / self._log_gamma).astype(np.int64),
+                                        return_counts=True)
+            buckets = self.buckets
+            for index, bucket_count in zip(indices.tolist(), counts.tolist()):
+                buckets[index] = buckets.get(index, 0) + bucket_count
+            if len(buckets) > self.max_buckets:
+                self._collapse()
+
+    def _collapse(self):
+        """! Merge the lowest buckets until at most max_buckets remain."""
+        indices = sorted(self.buckets)
+        excess = len(indices) - self.max_buckets
+        target = indices[excess]
+        for index in indices[:excess]:
+            self.buckets[target] += self.buckets.pop(index)
+
+    def merge(self, other):
+        """! Add the contents of another sketch with the same accuracy into this one.
+        @param other QuantileSketch to merge
+        @return This sketch
+        """
+        if other.gamma != self.gamma:
+            raise ValueError("Cannot merge sketches with different relative accuracy")
+        self.count += other.count
+        self.zero_count += other.zero_count
+        for index, bucket_count in other.buckets.items():
+            self.buckets[index] = self.buckets.get(index, 0) + bucket_count
+        if len(self.buckets) > self.max_buckets:
+            self._collapse()
+        return self
+
+    def quantile(self, q):
+        """! Estimate a quantile.
+        @param q Quantile in [0, 1]
+        @return Estimated value, or 0 when the sketch is empty
+        """
+        if self.count == 0:
+            return 0.0
+        rank = q * (self.count - 1)
+        if rank < self.zero_count:
+            return 0.0
+        seen = self.zero_count
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen > rank:
+                return 2 * self.gamma ** index / (self.gamma + 1)
+        return 2 * self.gamma ** max(self.buckets) / (self.gamma + 1)
+
+
+class RunningStats:
+    """! Online count/mean/variance/min/max accumulator with an optional quantile sketch."""
+    __slots__ = ('count', 'mean', 'm2', 'min', 'max', 'total', 'sketch')
+
+    def __init__(self, quantiles=False):
+        """! Initialize an empty accumulator.
+        @param quantiles Also maintain a QuantileSketch for percentile estimates
+        """
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+        self.total = 0.0
+        self.sketch = QuantileSketch() if quantiles else None
+
+    def add(self, value):
+        """! Add one observation (Welford update).
+        @param value Observed value
+        """
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+        self.total += value
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+        if self.sketch is not None:
+            self.sketch.add(value)
+
+    def add_array(self, values):
+        """! Add a batch of observations at once (equivalent to calling add on each).
+        @param values 1-D array of observed values
+        """
+        values = np.asarray(values, dtype=float)
+        if values.size == 0:
+            return
+        batch = RunningStats()
+        batch.count = int(values.size)
+        batch.mean = float(values.mean())
+        batch.m2 = float(((values - batch.mean) ** 2).sum())
+        batch.total = float(values.sum())
+        batch.min = float(values.min())
+        batch.max = float(values.max())
+        self.merge(batch)
+        if self.sketch is not None:
+            self.sketch.add_array(values)
+
+    def merge(self, other):
+        """! Combine another accumulator into this one (Chan et al. parallel update).
+        @param other RunningStats to merge
+        @return This accumulator
+        """
+        if other.count == 0:
+            return self
+        if self.count == 0:
+            self.mean, self.m2 = other.mean, other.m2
+        else:
+            count = self.count + other.count
+            delta = other.mean - self.mean
+            self.mean += delta * other.count / count
+            self.m2 += other.m2 + delta * delta * self.count * other.count / count
+        self.count += other.count
+        self.total += other.total
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        if other.sketch is not None:
+            if self.sketch is None:
+                self.sketch = QuantileSketch(other.sketch.relative_accuracy, other.sketch.max_buckets,
+                                             other.sketch.min_value)
+            self.sketch.merge(other.sketch)
+        return self
+
+    @property
+    def variance(self):
+        """! Sample variance of the observations (0 with fewer than two)."""
+        return self.m2 / (self.count - 1) if self.count > 1 else 0.0
+
+    @property
+    def std(self):
+        """! Sample standard deviation of the observations."""
+        return math.sqrt(self.variance)
+
+    def confidence_interval(self, confidence=0.95):
+        """! Student-t confidence interval of the mean, treating observations as i.i.d.
+        @param confidence Confidence level in (0, 1)
+        @return Tuple (mean, half_width); the half width is infinite with fewer than two observations
+        """
+        if self.count < 2:
+            return self.mean, math.inf
+        return self.mean, t_quantile(0.5 + confidence / 2, self.count - 1) * self.std / math.sqrt(self.count)
+
+    def quantile(self, q):
+        """! Estimate a quantile from the sketch.
+        @param q Quantile in [0, 1]
+        @return Estimated value (0 when empty or when no sketch is kept)
+        """
+        if self.sketch is None:
+            return 0.0
+        return self.sketch.quantile(q)
+
+    def summary(self):
+        """! Plain-dict summary of the accumulator, suitable for JSON export.
+        @return Dict with count, mean, std, min, max and p50/p95/p99 when available
+        """
+        summary = {
+            "count": self.count,
+            "mean": self.mean,
+            "std": self.std,
+            "min": self.min if self.count else 0.0,
+            "max": self.max if self.count else 0.0,
+        }
+        if self.sketch is not None:
+            summary.update({"p50": self.quantile(0.5), "p95": self.quantile(0.95),
+                            "p99": self.quantile(0.99)})
+        return summary
+
+
+def t_quantile(p, dof):
+    """! Quantile of Student's t distribution.
+    @details Exact for one and two degrees of freedom, otherwise the Cornish-Fisher
+    expansion around the normal quantile (Abramowitz and Stegun 26.7.5), within
+    0.1% of the exact value from three degrees of freedom up.
+    @param p Probability in (0, 1)
+    @param dof Degrees of freedom (at least 1)
+    @return Value t with P(T <= t) = p
+    """
+    if dof == 1:
+        return math.tan(math.pi * (p - 0.5))
+    if dof == 2:
+        return (2 * p - 1) / math.sqrt(2 * p * (1 - p))
+    z = NormalDist().inv_cdf(p)
+    g1 = (z ** 3 + z) / 4
+    g2 = (5 * z ** 5 + 16 * z ** 3 + 3 * z) / 96
+    g3 = (3 * z ** 7 + 19 * z ** 5 + 17 * z ** 3 - 15 * z) / 384
+    g4 = (79 * z ** 9 + 776 * z ** 7 + 1482 * z ** 5 - 1920 * z ** 3 - 945 * z) / 92160
+    return z + g1 / dof + g2 / dof ** 2 + g3 / dof ** 3 + g4 / dof ** 4
+
+
+def merge_stats(stats):
+    """! Merge several accumulators into a new one without modifying them.
+    @param stats Iterable of RunningStats
+    @return Merged RunningStats
+    """
+    merged = RunningStats()
+    for item in stats:
+        merged.merge(item)
+    return merged
@@ -0,0 +1,238 @@
+"""! @file topology.py
+    @brief Declarative production line topologies: serial stages and parallel groups.
+
+    A topology lists the stages of the line in the order products go through
+    them. A stage is either one station or a parallel group of stations:
+
+        {"stages": [
+            {"name": "Cutting", "failure_prob": 0.02},
+            {"parallel": 12, "visit": "one", "capacity": 2, "failure_prob": 0.05},
+            {"parallel": [{"name": "Paint 1"}, {"name": "Paint 2", "bin_size": 40}], "visit": "all"},
+            {}
+        ]}
+
+    Stations take their capacity, bin_size and failure_prob from their own entry,
+    then from their group, then from the line-wide facility parameters
+    (station_capacity, bin_size and the station's entry of failure_probs).
+    "parallel" is either the number of identical stations or their list.
+
+    A product visits one station of a "one" group (the default): the station
+    with the shortest queue, counting the products routed to it and not yet done
+    against its capacity, so a station with idle servers comes first.
+    ShortestQueueGroup keeps the stations bucketed by that excess load, so each
+    decision is O(1) however wide the group is. A product visits every station
+    of an "all" group, shortest queue first; that is how the original line treats
+    its last two stations, and is meant for small groups since the product goes
+    through all of them.
+
+    Stations are numbered in the order they appear, which keys their random
+    streams, so the default topology reproduces the original 6-station line.
+
+    @author: Eduardo Ulises Martinez
+    @author: Fernanda Mena
+    @author: Brandon Avalos
+"""
+
+import json
+from dataclasses import dataclass
+from typing import Tuple
+
+VISIT_ONE = "one"
+VISIT_ALL = "all"
+VISIT_MODES = (VISIT_ONE, VISIT_ALL)
+
+# The original line: stations 0 to 3 in series, then the 4/5 pair, both visited
+DEFAULT_TOPOLOGY = {"stages": [{}, {}, {}, {}, {"parallel": 2, "visit": VISIT_ALL}]}
+
+STATION_FIELDS = ("name", "capacity", "bin_size", "failure_prob")
+GROUP_FIELDS = ("parallel", "visit", "capacity", "bin_size", "failure_prob")
+
+
+def station_name(index):
+    """! Default display name of a station: Station A to Z, then AA, AB, ...
+    @param index Station index
+    @return Station name
+    """
+    letters = ""
+    index += 1
+    while index:
+        index, remainder = divmod(index - 1, 26)
+        letters = chr(65 + remainder) + letters
+    return f"Station {letters}"
+
+
+def workstation_id(index):
+    """! Workstation identifier of a station in the dashboard exports (WS-111, WS-222, ...)."""
+    return f"WS-{111 + index * 111}"
+
+
+def station_names(all_results):
+    """! Station names of a set of results, following their topology.
+    @param all_results List of simulation run results, or a ResultsStore
+    @return List of station names (empty when there are no results)
+    """
+    names = getattr(all_results, "station_names", None)
+    if names is None and len(all_results):
+        first = all_results[0]
+        names = first.get('station_names') or [station_name(i) for i in range(len(first['stations']))]
+    return list(names or [])
+
+
+@dataclass(frozen=True)
+class StationSpec:
+    """! Resolved settings of one station."""
+    name: str
+    capacity: int
+    bin_size: int
+    failure_prob: float
+
+
+@dataclass(frozen=True)
+class LineTopology:
+    """! Resolved topology: every station's settings and the stages of the line."""
+    stations: Tuple[StationSpec, ...]
+    stages: Tuple[Tuple[int, ...], ...]
+    visits: Tuple[str, ...]
+
+    @property
+    def num_stations(self):
+        """! Number of stations of the line."""
+        return len(self.stations)
+
+    @property
+    def names(self):
+        """! Station names, by station index."""
+        return [station.name for station in self.stations]
+
+
+def _check_fields(entry, allowed, where):
+    """! Reject misspelled keys of a stage or station entry."""
+    if not isinstance(entry, dict):
+        raise ValueError(f"{where} must be a JSON object")
+    unknown = set(entry) - set(allowed)
+    if unknown:
+        raise ValueError(f"Unknown keys in {where}: {sorted(unknown)}")
+
+
+def build_topology(params):
+    """! Resolve the topology of a set of facility parameters.
+    @param params Complete facility parameter dict (see EUMV_FMS.resolve_facility_params);
+                  its "topology" entry is a spec like DEFAULT_TOPOLOGY, or None for the default line
+    @return LineTopology
+    """
+    spec = params.get("topology") or DEFAULT_TOPOLOGY
+    if isinstance(spec, str):
+        spec = json.loads(spec)
+    _check_fields(spec, ("stages",), "topology")
+    stages_spec = spec.get("stages") or []
+    if not stages_spec:
+        raise ValueError("A topology needs at least one stage")
+
+    # Flatten the stages into (station entry, group entry) pairs, numbering stations in order
+    entries = []
+    stages = []
+    visits = []
+    for position, stage in enumerate(stages_spec):
+        where = f"stage {position}"
+        if isinstance(stage, dict) and "parallel" in stage:
+            _check_fields(stage, GROUP_FIELDS, where)
+            members = stage["parallel"]
+            if isinstance(members, int):
+                members = [{}] * members
+            if not members:
+                raise ValueError(f"Parallel group of {where} has no stations")
+            visit = stage.get("visit", VISIT_ONE)
+            if visit not in VISIT_MODES:
+                raise ValueError(f"visit of {where} must be one of {VISIT_MODES}")
+        else:
+            members, stage, visit = [stage], {}, VISIT_ONE
+        stage_stations = []
+        for member in members:
+            _check_fields(member, STATION_FIELDS, f"a station of {where}")
+            stage_stations.append(len(entries))
+            entries.append((member, stage))
+        stages.append(tuple(stage_stations))
+        visits.append(visit)
+
+    num_stations = len(entries)
+    failure_probs = params["failure_probs"]
+    line_probs = failure_probs if len(failure_probs) == num_stations else None
+    stations = []
+    for index, (member, group) in enumerate(entries):
+        def setting(field, default):
+            return member.get(field, group.get(field, default))
+
+        failure_prob = setting("failure_prob", line_probs[index] if line_probs is not None else None)
+        if failure_prob is None:
+            raise ValueError(f"failure_probs must have one probability per station ({num_stations}) "
+                             f"unless the topology gives every station its own failure_prob")
+        station = StationSpec(name=setting("name", station_name(index)),
+                              capacity=int(setting("capacity", params["station_capacity"])),
+                              bin_size=int(setting("bin_size", params["bin_size"])),
+                              failure_prob=float(failure_prob))
+        if station.capacity < 1 or station.bin_size < 1:
+            raise ValueError(f"{station.name} needs a capacity and bin_size of at least 1")
+        if not 0 <= station.failure_prob <= 1:
+            raise ValueError(f"failure_prob of {station.name} must be between 0 and 1")
+        stations.append(station)
+    return LineTopology(tuple(stations), tuple(stages), tuple(visits))
+
+
+class ShortestQueueGroup:
+    """! Stations of a "one" parallel group bucketed by their excess load, for O(1) routing.
+
+    @details The load of a station is the number of products routed to it that have
+    not left it yet (waiting for a bin resupply, queued or in service); its excess load
+    is the load minus its capacity, which is the queue length when positive and minus
+    the number of idle servers otherwise. Loads only change by one, so the lowest
+    non-empty bucket moves by at most one step on acquire, and release can only lower
+    it to the bucket the station lands in. Ties go to the station that has waited
+    longest at that excess load.
+    """
+
+    def __init__(self, stations, capacities):
+        """! Start with every station idle.
+        @param stations Station indices of the group
+        @param capacities Capacity of each of those stations
+        """
+        self.excess = {station: -int(capacity) for station, capacity in zip(stations, capacities)}
+        # buckets[n] holds the stations with excess load n; dicts keep insertion order
+        self.buckets = {}
+        for station, excess in self.excess.items():
+            self.buckets.setdefault(excess, {})[station] = None
+        self.lowest = min(self.buckets)
+
+    def acquire(self):
+        """! Pick the station with the shortest queue (or most idle servers) and count one more product on it.
+        @return Station index
+        """
+        station = next(iter(self.buckets[self.lowest]))
+        self._move(station, 1)
+        if not self.buckets[self.lowest]:
+            self.lowest += 1
+        return station
+
+    def release(self, station):
+        """! Count one product fewer on a station.
+        @param station Station index returned by acquire
+        """
+        self._move(station, -1)
+        self.lowest = min(self.lowest, self.excess[station])
+
+    def set_capacity(self, station, old_capacity, new_capacity):
+        """! Account for a capacity change of one station in the middle of a run.
+        @param station Station index
+        @param old_capacity Capacity the station had
+        @param new_capacity Capacity it has now
+        """
+        if new_capacity != old_capacity:
+            self._move(station, old_capacity - new_capacity)
+            self.lowest = min(excess for excess, bucket in self.buckets.items() if bucket)
+
+    def _move(self, station, step):
+        """! Move a station to the bucket of its new excess load."""
+        excess = self.excess[station]
+        del self.buckets[excess][station]
+        excess += step
+        self.buckets.setdefault(excess, {})[station] = None
+        self.excess[station] = excess
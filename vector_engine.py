@@ -0,0 +1,373 @@
+"""! @file vector_engine.py
+    @brief Vectorized NumPy fast-path engine for the manufacturing line.
+
+    The line is stations 0-3 in series followed by the 4/5 pair, which every
+    product visits in an order chosen by the shorter backlog. Instead of
+    scheduling SimPy events, this engine walks through products one at a time
+    and advances a whole batch of replications at once with Lindley-style
+    recursions over NumPy arrays: a product starts at a station at
+    max(arrival, time the earliest server becomes free).
+
+    The model mirrors the SimPy engine: arrivals every 1 or 2 time units
+    depending on the station 0 queue, folded normal service times, a breakdown
+    check on every 5th item, 1% rejections per station, bin resupply and
+    facility accidents. It approximates the parallel-pair choice with the
+    servers' remaining work instead of queue lengths, serves products in
+    creation order at every station, and does not model queueing for the
+    supplier pool (which is lightly loaded in the default setup). Results
+    therefore agree with the SimPy engine statistically rather than run by run;
+    validate_vector_engine() checks that agreement. Only the default topology is
+    supported; other lines need the SimPy engine.
+
+    @author: Eduardo Ulises Martinez
+    @author: Fernanda Mena
+    @author: Brandon Avalos
+"""
+
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from EUMV_FMS import (StationMetrics, build_results, resolve_facility_params, run_replications,
+                      _default_workers)
+from product_traces import (TRACE_OFF, TRACE_FULL, QUALITY_GOOD, QUALITY_REJECTED,
+                            ProductTraceStore)
+from random_streams import RandomStreams
+
+NUM_STATIONS = 6
+SERIAL_STATIONS = 4
+REJECTION_PROB = 0.01
+DRAW_BLOCK = 64
+
+
+def simulate_vectorized(run_ids, simulation_time, trace_level=TRACE_OFF, facility_params=None,
+                        batch_size=64):
+    """! Simulate many replications with the vectorized engine.
+    @param run_ids List of run identifiers (one replication each)
+    @param simulation_time Total time to simulate per replication
+    @param trace_level Product tracing level: "off", "summary" or "full"
+    @param facility_params Dict overriding DEFAULT_FACILITY_PARAMS
+    @param batch_size Number of replications advanced together (bounds memory use)
+    @return List of results dicts, in the same format as run_simulation, ordered like run_ids
+    """
+    params = resolve_facility_params(facility_params)
+    if params["topology"] is not None:
+        raise ValueError("The vectorized engine only simulates the default 6-station line; "
+                         "use engine='simpy' for other topologies")
+    run_ids = list(run_ids)
+    results = []
+    for start in range(0, len(run_ids), batch_size):
+        results.extend(_simulate_batch(run_ids[start:start + batch_size], simulation_time,
+                                       trace_level, params))
+    return results
+
+
+def run_vectorized_replications(run_ids, simulation_time, workers=1, batch_size=64, **options):
+    """! Simulate replications with the vectorized engine, spreading batches over worker processes.
+
+    @details Batches always hold the same run_ids for a given batch_size, so results do
+    not depend on the number of workers.
+    @param run_ids Iterable of run identifiers
+    @param simulation_time Total time to simulate per replication
+    @param workers Number of worker processes (1 runs serially, None uses every core)
+    @param batch_size Number of replications advanced together
+    @param options Extra keyword arguments for simulate_vectorized (trace_level, facility_params)
+    @return List of results dicts ordered like run_ids
+    """
+    run_ids = list(run_ids)
+    batches = [run_ids[start:start + batch_size] for start in range(0, len(run_ids), batch_size)]
+    simulate = partial(simulate_vectorized, simulation_time=simulation_time, batch_size=batch_size, **options)
+    workers = min(_default_workers(workers), max(len(batches), 1))
+    if workers == 1:
+        batch_results = map(simulate, batches)
+        return [result for results in batch_results for result in results]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return [result for results in executor.map(simulate, batches) for result in results]
+
+
+def _draw_block(generators):
+    """! Draw the variates of the next DRAW_BLOCK products of every replication.
+
+    @details Each replication makes the same calls on its own generator whatever the
+    batch, one call per distribution and block, and the draws are stacked along the
+    batch axis.
+    @param generators One np.random.Generator per replication of the batch
+    @return Tuple of arrays (accident, accident_station, service, breakdown, fixing, rejection,
+            supply); the first two are (DRAW_BLOCK, batch), the others (DRAW_BLOCK, batch, NUM_STATIONS)
+    """
+    shape = (DRAW_BLOCK, NUM_STATIONS)
+    draws = [(rng.random(DRAW_BLOCK), rng.integers(0, NUM_STATIONS, DRAW_BLOCK),
+              np.abs(rng.normal(4, 1, shape)), rng.random(shape), rng.exponential(3, shape),
+              rng.random(shape), np.abs(rng.normal(2, 0.5, shape)))
+             for rng in generators]
+    return tuple(np.stack(columns, axis=1) for columns in zip(*draws))
+
+
+def _simulate_batch(run_ids, simulation_time, trace_level, params):
+    """! Simulate one batch of replications in lockstep.
+    @param run_ids List of run identifiers in the batch
+    @param simulation_time Total time to simulate per replication
+    @param trace_level Product tracing level
+    @param params Resolved facility parameters
+    @return List of results dicts for the batch
+    """
+    horizon = simulation_time
+    batch = len(run_ids)
+    rows = np.arange(batch)
+    # Every replication draws from its own run_id's generator, so its results do not depend
+    # on which runs share its batch
+    generators = [RandomStreams(run_id + 1000).generator("vector_run", 0) for run_id in run_ids]
+
+    failure_probs = np.asarray(params["failure_probs"], dtype=float)
+    bin_size = params["bin_size"]
+    accident_prob = 0.0001 / (simulation_time / 24)
+
+    station_free = np.zeros((batch, NUM_STATIONS, params["station_capacity"]))
+    processed = np.zeros((batch, NUM_STATIONS), dtype=np.int64)
+    bins = np.full((batch, NUM_STATIONS), bin_size, dtype=np.int64)
+    refill_end = np.zeros((batch, NUM_STATIONS))
+    supplier_busy = np.zeros(batch)
+    accidents = np.zeros((batch, NUM_STATIONS), dtype=np.int64)
+    recent_starts = np.full((batch, 6), -np.inf)  # Station 0 start times of the last 6 products
+
+    next_arrival = np.zeros(batch)
+    arriving = np.ones(batch, dtype=bool)
+    log = {name: [] for name in ("station", "entry", "queue", "start", "service", "fixing", "end",
+                                 "present", "rejected")}
+    arrivals = []
+    product = 0
+
+    while arriving.any():
+        if product % DRAW_BLOCK == 0:
+            (accident_block, accident_station_block, service_block, breakdown_block, fixing_block,
+             rejection_block, supply_block) = _draw_block(generators)
+        offset = product % DRAW_BLOCK
+
+        arrival = next_arrival.copy()
+        accident = arriving & (accident_block[offset] < accident_prob)
+        if accident.any():
+            accidents[rows[accident], accident_station_block[offset][accident]] += 1
+            arriving &= ~accident
+        present = arriving.copy()
+        arrivals.append(np.where(present, arrival, np.nan))
+
+        service = service_block[offset]
+        breakdown = breakdown_block[offset]
+        fixing = fixing_block[offset]
+        rejection = rejection_block[offset]
+        supply_delay = supply_block[offset]
+
+        now = arrival
+        for stage in range(NUM_STATIONS):
+            if stage < SERIAL_STATIONS:
+                station = np.full(batch, stage)
+            elif stage == SERIAL_STATIONS:
+                # Shorter queue first, approximated by the remaining work at each pair station
+                backlog_4 = station_free[:, 4].min(axis=1) - now
+                backlog_5 = station_free[:, 5].min(axis=1) - now
+                station = np.where(np.maximum(backlog_4, 0) <= np.maximum(backlog_5, 0), 4, 5)
+                first_parallel = station
+            else:
+                station = 9 - first_parallel
+            entry = now
+
+            # Empty bins are refilled before the product queues; as in the SimPy engine, a
+            # product reaching a station while its bin is still being refilled orders its own refill
+            resupply = present & ((bins[rows, station] <= 0) | (now < refill_end[rows, station]))
+            if resupply.any():
+                supply_end = now + supply_delay[rows, station]
+                supplier_busy += np.where(resupply & (supply_end < horizon), supply_end - now, 0.0)
+                now = np.where(resupply, supply_end, now)
+                bins[rows[resupply], station[resupply]] = bin_size
+                refill_end[rows[resupply], station[resupply]] = supply_end[resupply]
+            bins[rows[present], station[present]] -= 1
+
+            servers = station_free[rows, station]
+            server = servers.argmin(axis=1)
+            start = np.maximum(now, servers[rows, server])
+            processed[rows[present], station[present]] += 1
+            fails = (present & (processed[rows, station] % 5 == 0)
+                     & (breakdown[rows, station] < failure_probs[station]))
+            fixing_time = np.where(fails, fixing[rows, station], 0.0)
+            service_time = service[rows, station]
+            end = start + service_time + fixing_time
+            station_free[rows[present], station[present], server[present]] = end[present]
+            rejected = present & (rejection[rows, station] < REJECTION_PROB)
+
+            for name, value in (("station", station), ("entry", entry), ("queue", now), ("start", start),
+                                ("service", service_time), ("fixing", fixing_time), ("end", end),
+                                ("present", present), ("rejected", rejected)):
+                log[name].append(value)
+            if stage == 0:
+                # Arrivals slow down while more than 5 products wait for station 0
+                long_queue = recent_starts[:, product % 6] > arrival
+                recent_starts[:, product % 6] = np.where(present, start, recent_starts[:, product % 6])
+            present = present & ~rejected
+            now = end
+
+        next_arrival = arrival + np.where(long_queue, 2.0, 1.0)
+        arriving &= next_arrival < horizon
+        product += 1
+
+    # Visit tables of shape (batch, products * stations), ordered product by product
+    visits = {name: np.stack(values, axis=1) for name, values in log.items()}
+    arrivals = np.stack(arrivals, axis=1) if arrivals else np.empty((batch, 0))
+    return [_replication_results(run_ids[r], simulation_time, trace_level,
+                                 {name: values[r] for name, values in visits.items()}, arrivals[r],
+                                 supplier_busy[r], accidents[r])
+            for r in range(batch)]
+
+
+def _replication_results(run_id, simulation_time, trace_level, visits, arrivals, supplier_busy, accidents):
+    """! Reduce the visit table of one replication to a results dict.
+    @param run_id Identifier of the replication
+    @param simulation_time Total simulated time
+    @param trace_level Product tracing level
+    @param visits Dict of per-visit arrays for the replication
+    @param arrivals Creation time of every product (NaN where no product was created)
+    @param supplier_busy Total supplier busy time
+    @param accidents Accident count per station
+    @return Results dict in the run_simulation format
+    """
+    horizon = simulation_time
+    present = visits["present"]
+    station = visits["station"]
+    service_end = visits["start"] + visits["service"]
+    started = present & (visits["start"] < horizon)
+    served = present & (service_end < horizon)
+    finished = present & (visits["end"] < horizon)
+    rejected = finished & visits["rejected"]
+    completed = finished & ~visits["rejected"]
+
+    # Bottleneck delays follow the global order in which stations finish items
+    order = np.argsort(visits["end"][finished], kind="stable")
+    finish_times = visits["end"][finished][order]
+    delays = finish_times[1:] - finish_times[:-1] - visits["service"][finished][order][1:]
+    delay_stations = station[finished][order][1:]
+
+    metrics = {}
+    for i in range(NUM_STATIONS):
+        at_station = station == i
+        station_metrics = StationMetrics()
+        station_metrics.processed_items = int(np.count_nonzero(served & at_station))
+        station_metrics.busy_time = float(visits["service"][served & at_station].sum())
+        fixed = finished & at_station & (visits["fixing"] > 0)
+        station_metrics.downtime = float(visits["fixing"][fixed].sum())
+        station_metrics.fixing_times.add_array(visits["fixing"][fixed])
+        station_metrics.waiting_times.add_array((visits["start"] - visits["queue"])[started & at_station])
+        station_delays = delays[delay_stations == i]
+        station_metrics.bottleneck_delays.add_array(station_delays[station_delays > 0])
+        station_metrics.good_products = int(np.count_nonzero(completed & at_station))
+        # Rejections are counted twice per station, as in the SimPy engine
+        station_metrics.rejected_products = 2 * int(np.count_nonzero(rejected & at_station))
+        station_metrics.accident_count = int(accidents[i])
+        metrics[i] = station_metrics
+
+    per_product = completed.reshape(-1, NUM_STATIONS)
+    production = int(np.count_nonzero(per_product.all(axis=1)))
+    traces = None
+    if trace_level != TRACE_OFF:
+        traces = _product_traces(trace_level, visits, arrivals, horizon, started, completed, rejected)
+    return build_results(run_id, simulation_time, production, int(np.count_nonzero(rejected)),
+                         supplier_busy, metrics, traces)
+
+
+def _product_traces(trace_level, visits, arrivals, horizon, started, completed, rejected):
+    """! Build the product trace store of one replication from its visit table.
+    @return ProductTraceStore with one row per created product
+    """
+    created = ~np.isnan(arrivals)
+    num_products = int(np.count_nonzero(created))
+    shape = (-1, NUM_STATIONS)
+    wait = np.where(started, visits["start"] - visits["queue"], 0.0).reshape(shape)[:num_products]
+    process = np.where(completed, visits["end"] - visits["start"], 0.0).reshape(shape)[:num_products]
+    ends = visits["end"].reshape(shape)[:num_products]
+    done = completed.reshape(shape)[:num_products]
+    dropped = rejected.reshape(shape)[:num_products]
+
+    end_time = np.full(num_products, np.nan)
+    quality = np.zeros(num_products, dtype=np.int8)
+    good = done.all(axis=1)
+    end_time[good] = ends[good, -1]
+    quality[good] = QUALITY_GOOD
+    rejected_products = dropped.any(axis=1)
+    rejection_stage = dropped.argmax(axis=1)
+    end_time[rejected_products] = ends[rejected_products, rejection_stage[rejected_products]]
+    quality[rejected_products] = QUALITY_REJECTED
+
+    products = {
+        "product_id": np.arange(num_products),
+        "start_time": arrivals[:num_products],
+        "end_time": end_time,
+        "wait_time": wait.sum(axis=1),
+        "process_time": process.sum(axis=1),
+        "quality": quality,
+    }
+    visit_table = None
+    if trace_level == TRACE_FULL:
+        product_rows, stages = np.nonzero(done)
+        flat = product_rows * NUM_STATIONS + stages
+        visit_table = {
+            "product_row": product_rows,
+            "station_id": visits["station"][flat],
+            "entry_time": visits["entry"][flat],
+            "exit_time": visits["end"][flat],
+            "wait_time": (visits["start"] - visits["queue"])[flat],
+            "process_time": (visits["end"] - visits["start"])[flat],
+        }
+    return ProductTraceStore.from_columns(trace_level, products, visit_table)
+
+
+def validate_vector_engine(num_runs=30, simulation_time=5000, tolerance=0.1, workers=None):
+    """! Compare the statistics of the vectorized engine against the SimPy engine.
+
+    @details Both engines simulate num_runs replications. For every metric the mean
+    over replications is compared; a metric passes when the relative difference is
+    within tolerance or the two means are within three standard errors.
+    @param num_runs Number of replications per engine
+    @param simulation_time Duration of each replication
+    @param tolerance Accepted relative difference between the engine means
+    @param workers Worker processes for the SimPy replications (None uses every core)
+    @return Dict of metric name to comparison dict, plus an overall "passed" flag
+    """
+    reference = run_replications(range(num_runs), simulation_time, workers, trace_level=TRACE_OFF)
+    candidate = simulate_vectorized(range(num_runs), simulation_time)
+
+    def metric_values(results):
+        """Collect the compared metrics of every replication into lists"""
+        values = {
+            "production": [r['production'] for r in results],
+            "rejected": [r['rejected'] for r in results],
+            "supplier_occupancy": [r['supplier_occupancy'] for r in results],
+        }
+        for i in range(NUM_STATIONS):
+            for metric in ("occupancy", "avg_waiting_time", "downtime"):
+                values[f"station{i}_{metric}"] = [r['stations'][i][metric] for r in results]
+        return values
+
+    reference_values = metric_values(reference)
+    candidate_values = metric_values(candidate)
+    report = {}
+    passed = True
+    for name, expected in reference_values.items():
+        expected = np.asarray(expected, dtype=float)
+        actual = np.asarray(candidate_values[name], dtype=float)
+        difference = actual.mean() - expected.mean()
+        relative = abs(difference) / abs(expected.mean()) if expected.mean() else abs(difference)
+        standard_error = np.sqrt(expected.var(ddof=1) / len(expected) + actual.var(ddof=1) / len(actual))
+        ok = bool(relative <= tolerance or abs(difference) <= 3 * standard_error)
+        passed &= ok
+        report[name] = {"simpy_mean": float(expected.mean()), "vector_mean": float(actual.mean()),
+                        "relative_difference": float(relative), "ok": ok}
+    report["passed"] = passed
+    return report
+
+
+if __name__ == "__main__":
+    validation = validate_vector_engine()
+    for metric, comparison in validation.items():
+        if metric == "passed":
+            continue
+        status = "ok" if comparison["ok"] else "MISMATCH"
+        print(f"{metric:32s} simpy={comparison['simpy_mean']:10.3f} "
+              f"vector={comparison['vector_mean']:10.3f} [{status}]")
+    print("Validation passed" if validation["passed"] else "Validation failed")
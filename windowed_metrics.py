@@ -0,0 +1,319 @@
+"""! @file windowed_metrics.py
+    @brief Prefix-sum aggregation of run results over arbitrary day windows.
+
+    Each run is one simulated day. WindowedMetrics makes a single pass over the
+    results and stores cumulative sums of every station and plant metric, so the
+    totals and averages of any window [start, end) are the difference of two
+    rows, whatever its length. Waiting and fixing time percentiles use cumulative
+    histograms of the per-run quantile sketch buckets, so a window's merged
+    sketch is also two rows apart. Leading windows (daily, weekly, ...), rolling
+    windows and calendar date ranges are all answered the same way. A ResultsStore
+    is aggregated directly from its memory-mapped columns.
+
+    @author: Eduardo Ulises Martinez
+    @author: Fernanda Mena
+    @author: Brandon Avalos
+"""
+
+import datetime
+import numpy as np
+from results_store import ResultsStore
+from topology import station_names
+
+# Dashboard windows, as leading numbers of days
+STANDARD_WINDOWS = {"daily": 1, "weekly": 7, "monthly": 30, "quarterly": 90, "yearly": 365}
+
+# Per-station result fields summed over windows
+STATION_SUM_FIELDS = ("good_products", "rejected_products", "occupancy", "accidents", "downtime",
+                      "avg_fixing_time", "avg_bottleneck_delay")
+
+# Plant-level result fields summed over windows
+PLANT_SUM_FIELDS = ("production", "rejected", "supplier_occupancy")
+
+
+def _prefix(values):
+    """! Cumulative sums along the first axis with a leading row of zeros.
+    @param values Array with one row per day
+    @return Array with one more row; row d holds the sum of days [0, d)
+    """
+    values = np.asarray(values)
+    prefix = np.zeros((len(values) + 1,) + values.shape[1:], dtype=values.dtype)
+    np.cumsum(values, axis=0, out=prefix[1:])
+    return prefix
+
+
+class SketchPrefix:
+    """! Cumulative bucket histograms of per-day quantile sketches.
+
+    @details The buckets of every day's sketch are laid out on a shared dense index, so
+    the sketch obtained by merging the days of a window is the difference of two
+    cumulative rows and any quantile is read from it without touching the days.
+    """
+
+    def __init__(self, days, bucket_indices, bucket_counts, zero_counts, gamma=1.0, max_buckets=0):
+        """! Build the cumulative histograms from flattened bucket entries.
+        @param days Day of every bucket entry
+        @param bucket_indices Sketch bucket index of every entry
+        @param bucket_counts Count of every entry
+        @param zero_counts Zero-bucket count of every day
+        @param gamma Bucket ratio of the sketches
+        @param max_buckets Bucket limit of the sketches
+        """
+        num_days = len(zero_counts)
+        self.gamma = gamma
+        indices = np.unique(bucket_indices)
+        # Mirror QuantileSketch._collapse: the lowest buckets fold into the lowest kept one
+        excess = max(0, len(indices) - max_buckets)
+        self.indices = indices[excess:]
+        columns = np.maximum(np.searchsorted(indices, bucket_indices) - excess, 0)
+        counts = np.bincount(days * len(self.indices) + columns, weights=bucket_counts,
+                             minlength=num_days * len(self.indices))
+        counts = counts.astype(np.int64).reshape(num_days, len(self.indices))
+        self.bucket_prefix = _prefix(counts)
+        self.zero_prefix = _prefix(np.asarray(zero_counts, dtype=np.int64))
+
+    @classmethod
+    def from_sketches(cls, sketches):
+        """! Build the cumulative histograms of a list of sketches.
+        @param sketches List of QuantileSketch (or None for a day without one), one per day
+        @return SketchPrefix
+        """
+        present = [sketch for sketch in sketches if sketch is not None]
+        # Flatten every (day, bucket index, count) entry, then histogram them in one go
+        days = np.repeat(np.arange(len(sketches)),
+                         [len(sketch.buckets) if sketch is not None else 0 for sketch in sketches])
+        bucket_indices = np.concatenate(
+            [np.fromiter(sketch.buckets.keys(), np.int64, len(sketch.buckets)) for sketch in present]
+            or [np.zeros(0, dtype=np.int64)])
+        bucket_counts = np.concatenate(
+            [np.fromiter(sketch.buckets.values(), np.int64, len(sketch.buckets)) for sketch in present]
+            or [np.zeros(0, dtype=np.int64)])
+        zero_counts = [sketch.zero_count if sketch is not None else 0 for sketch in sketches]
+        return cls(days, bucket_indices, bucket_counts, zero_counts,
+                   present[0].gamma if present else 1.0, present[0].max_buckets if present else 0)
+
+    def quantiles(self, start, end, qs):
+        """! Quantiles of the merged sketch of days [start, end).
+        @param start First day of the window
+        @param end Day after the last day of the window
+        @param qs Sequence of quantiles in [0, 1]
+        @return List of estimated values, matching QuantileSketch.quantile
+        """
+        buckets = self.bucket_prefix[end] - self.bucket_prefix[start]
+        zero_count = int(self.zero_prefix[end] - self.zero_prefix[start])
+        cumulative = zero_count + np.cumsum(buckets)
+        count = int(cumulative[-1]) if len(cumulative) else zero_count
+        values = []
+        for q in qs:
+            rank = q * (count - 1)
+            if count == 0 or rank < zero_count:
+                values.append(0.0)
+                continue
+            column = min(int(np.searchsorted(cumulative, rank, side="right")), len(cumulative) - 1)
+            values.append(2 * self.gamma ** int(self.indices[column]) / (self.gamma + 1))
+        return values
+
+
+class WindowedMetrics:
+    """! Station and plant aggregates of any window of days, in constant time per window."""
+
+    def __init__(self, all_results):
+        """! Aggregate the results in a single pass.
+        @param all_results List of simulation run results, one per day, or a ResultsStore
+        """
+        if isinstance(all_results, ResultsStore):
+            self._from_store(all_results)
+            return
+        self.num_days = len(all_results)
+        self.num_stations = len(all_results[0]['stations']) if all_results else 0
+        self.station_names = station_names(all_results)
+        stations = range(self.num_stations)
+
+        station_values = {field: np.zeros((self.num_days, self.num_stations)) for field in STATION_SUM_FIELDS}
+        plant_values = {field: np.zeros(self.num_days) for field in PLANT_SUM_FIELDS}
+        waiting_sketches = [[] for _ in stations]
+        fixing_sketches = [[] for _ in stations]
+        for day, result in enumerate(all_results):
+            for field in PLANT_SUM_FIELDS:
+                plant_values[field][day] = result.get(field, 0)
+            for i in stations:
+                station = result['stations'][i]
+                for field in STATION_SUM_FIELDS:
+                    station_values[field][day, i] = station.get(field, 0) or 0
+                waiting_sketches[i].append(_sketch(station.get('waiting_time_stats')))
+                fixing_sketches[i].append(_sketch(station.get('fixing_time_stats')))
+
+        # Occupancy is reported in hours of a 24 hour day
+        station_values['occupancy_hours'] = station_values['occupancy'] * 24
+        self.station_prefix = {field: _prefix(values) for field, values in station_values.items()}
+        self.plant_prefix = {field: _prefix(values) for field, values in plant_values.items()}
+        self.waiting_prefix = [SketchPrefix.from_sketches(sketches) for sketches in waiting_sketches]
+        self.fixing_prefix = [SketchPrefix.from_sketches(sketches) for sketches in fixing_sketches]
+
+    def _from_store(self, store):
+        """! Aggregate straight from the columns of a results store, without building run dicts.
+        @param store ResultsStore
+        """
+        self.num_days = len(store)
+        self.num_stations = store.num_stations
+        self.station_names = list(store.station_names)
+        station_values = {field: np.asarray(store.station_column(field), dtype=float)
+                          for field in STATION_SUM_FIELDS}
+        station_values['occupancy_hours'] = station_values['occupancy'] * 24
+        self.station_prefix = {field: _prefix(values) for field, values in station_values.items()}
+        self.plant_prefix = {field: _prefix(np.asarray(store.run_column(field), dtype=float))
+                             for field in PLANT_SUM_FIELDS}
+
+        def sketch_prefixes(stats_name):
+            params = store.sketch_params(stats_name) or {"relative_accuracy": 0.0, "max_buckets": 0}
+            accuracy = params["relative_accuracy"]
+            gamma = (1 + accuracy) / (1 - accuracy)
+            return [SketchPrefix(*store.sketch_buckets(stats_name, i), gamma, params["max_buckets"])
+                    for i in range(self.num_stations)]
+
+        self.waiting_prefix = sketch_prefixes('waiting_time_stats')
+        self.fixing_prefix = sketch_prefixes('fixing_time_stats')
+
+    def window(self, spec):
+        """! Resolve a window specification to day indices clamped to the available days.
+        @param spec Number of leading days, or a (start, end) pair of day indices
+        @return Tuple (start, end)
+        """
+        if isinstance(spec, (tuple, list)):
+            start, end = spec
+        else:
+            start, end = 0, spec
+        end = max(0, min(int(end), self.num_days))
+        return min(max(0, int(start)), end), end
+
+    def rolling_windows(self, width, step=1):
+        """! Windows of a fixed width sliding over the days.
+        @param width Number of days per window
+        @param step Days between the starts of consecutive windows
+        @return List of (start, end) pairs
+        """
+        return [(start, start + width) for start in range(0, self.num_days - width + 1, step)]
+
+    def _station_sum(self, field, station, start, end):
+        """! Sum of a per-station field over days [start, end)."""
+        prefix = self.station_prefix[field]
+        return prefix[end, station] - prefix[start, station]
+
+    def _plant_sum(self, field, start, end):
+        """! Sum of a plant field over days [start, end)."""
+        prefix = self.plant_prefix[field]
+        return prefix[end] - prefix[start]
+
+    def station_block(self, station, spec):
+        """! Station entry of StationsInfo.json for one window.
+        @param station Station index
+        @param spec Window specification (see window())
+        @return Dict of aggregated metrics
+        """
+        start, end = self.window(spec)
+        count = end - start
+        if not count:
+            return {
+                "production": 0,
+                "occupancy_hours": 0,
+                "avg_production_time_min": 0,
+                "rejected_units": 0,
+                "rejection_percentage": 0.0,
+                "avg_delay_minutes": 0,
+                "accidents": 0
+            }
+
+        production = self._station_sum("good_products", station, start, end)
+        rejected = self._station_sum("rejected_products", station, start, end)
+        occupancy = self._station_sum("occupancy_hours", station, start, end)
+        accidents = self._station_sum("accidents", station, start, end)
+        delay = self._station_sum("downtime", station, start, end)
+        avg_fixing_time = self._station_sum("avg_fixing_time", station, start, end)
+
+        rejection_pct = 0.0
+        if production + rejected > 0:
+            rejection_pct = round(float(rejected / (production + rejected) * 100), 1)
+
+        return {
+            "production": int(production),
+            "occupancy_hours": int(occupancy),
+            "avg_production_time_min": int(avg_fixing_time / count),
+            "rejected_units": int(rejected),
+            "rejection_percentage": rejection_pct,
+            "avg_delay_minutes": int(delay / count),
+            "accidents": int(accidents)
+        }
+
+    def plant_summary(self, spec):
+        """! Entry of PlantInfo.json for one window.
+        @param spec Window specification (see window())
+        @return Dict with plant-level summary metrics
+        """
+        start, end = self.window(spec)
+        count = end - start
+        station_metrics = {}
+        for i in range(self.num_stations):
+            metrics = {
+                "name": self.station_names[i],
+                "avg_occupancy": 0,
+                "avg_downtime": 0,
+                "avg_bottleneck_delay": 0,
+                "p50_waiting_time": 0,
+                "p95_waiting_time": 0,
+                "p99_waiting_time": 0,
+                "p95_fixing_time": 0
+            }
+            if count:
+                metrics["avg_occupancy"] = float(self._station_sum("occupancy", i, start, end) / count)
+                metrics["avg_downtime"] = float(self._station_sum("downtime", i, start, end) / count)
+                metrics["avg_bottleneck_delay"] = float(
+                    self._station_sum("avg_bottleneck_delay", i, start, end) / count)
+                # Percentiles come from the merged sketches, not from averaging per-run percentiles
+                p50, p95, p99 = self.waiting_prefix[i].quantiles(start, end, (0.50, 0.95, 0.99))
+                metrics["p50_waiting_time"] = p50
+                metrics["p95_waiting_time"] = p95
+                metrics["p99_waiting_time"] = p99
+                metrics["p95_fixing_time"] = self.fixing_prefix[i].quantiles(start, end, (0.95,))[0]
+            station_metrics[str(i)] = metrics
+
+        if not count:
+            return {
+                "total_production": 0,
+                "total_rejected": 0,
+                "rejection_rate": 0,
+                "supplier_utilization": 0,
+                "station_metrics": station_metrics
+            }
+
+        total_production = int(self._plant_sum("production", start, end))
+        total_rejected = int(self._plant_sum("rejected", start, end))
+        rejection_rate = 0
+        if total_production + total_rejected > 0:
+            rejection_rate = total_rejected / (total_production + total_rejected)
+
+        return {
+            "total_production": total_production,
+            "total_rejected": total_rejected,
+            "rejection_rate": rejection_rate,
+            "supplier_utilization": float(self._plant_sum("supplier_occupancy", start, end) / count),
+            "station_metrics": station_metrics
+        }
+
+
+def _sketch(stats):
+    """! Quantile sketch of a RunningStats, or None when it has none."""
+    return getattr(stats, "sketch", None)
+
+
+def date_window(start_date, end_date, first_day):
+    """! Day window covering a calendar date range.
+    @param start_date First date of the range (datetime.date or ISO string)
+    @param end_date Last date of the range, inclusive
+    @param first_day Date of the first run (day index 0)
+    @return Tuple (start, end) usable as a window specification
+    """
+    def to_date(value):
+        return datetime.date.fromisoformat(value) if isinstance(value, str) else value
+
+    origin = to_date(first_day)
+    return (to_date(start_date) - origin).days, (to_date(end_date) - origin).days + 1